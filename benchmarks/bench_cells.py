@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+
+"""Benchmark for the parallel cell preprocessing of pre_markdown and pre_cite2c
+
+Converts synthetic notebooks with thousands of distinct markdown cells with
+an increasing number of worker processes, checks that the result equals the
+serial one and reports the speedup. A speedup needs as many cores as
+workers.
+
+Run from the repository root:
+
+    python benchmarks/bench_cells.py --cells 20000 --workers 1 2 4
+"""
+
+from __future__ import print_function
+
+import argparse
+import copy
+import sys
+import time
+
+from traitlets.config import Config
+
+from generators import make_notebook
+from pre_markdown import MarkdownPreprocessor
+from pre_cite2c import BibTexPreprocessor
+
+
+def run(preprocessor, nb, extension, workers, repeat, style="harvard1"):
+    """
+    returns the best time and the converted cell sources with workers processes
+    """
+    config = Config()
+    getattr(config, preprocessor.__name__).workers = workers
+    config.BibTexPreprocessor.cache_dir = ""
+    config.BibTexPreprocessor.citation_style = style
+    best = None
+    for _ in range(repeat):
+        converted = copy.deepcopy(nb)
+        resources = {"output_extension": extension, "output_files_dir": "bench_files", "unique_key": "bench"}
+        start = time.time()
+        preprocessor(config=config).preprocess(converted, resources)
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, [cell.source for cell in converted.cells]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--cells", type=int, default=20000, help="number of markdown cells")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4], help="worker counts to compare")
+    parser.add_argument("--style", default="harvard1", help="CSL style of the pre_cite2c citations")
+    parser.add_argument("--repeat", type=int, default=3, help="repetitions per worker count, the best is reported")
+    args = parser.parse_args(argv)
+
+    cases = [("pre_markdown", MarkdownPreprocessor, make_notebook(args.cells, colors_per_cell=5), ".tex"),
+             ("pre_cite2c", BibTexPreprocessor, make_notebook(args.cells, citations_per_cell=20), ".html")]
+    print("{:>14} {:>8} {:>10} {:>8}".format("preprocessor", "workers", "time [s]", "speedup"))
+    for name, preprocessor, nb, extension in cases:
+        serial = None
+        for workers in args.workers:
+            t, sources = run(preprocessor, nb, extension, workers, args.repeat, args.style)
+            if serial is None:
+                serial = t, sources
+            elif sources != serial[1]:
+                print("{}: result with {} workers differs from {} workers".format(name, workers, args.workers[0]))
+                return 1
+            print("{:>14} {:>8} {:>10.3f} {:>8.2f}".format(name, workers, t, serial[0] / t))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+
+"""Benchmark for the citation rewriting in pre_cite2c.BibTexPreprocessor
+
+Builds synthetic notebooks with an increasing number of <cite> tags and
+reports the time per citation for the HTML conversion, which should stay
+constant if the rewriting scales linearly.
+
+Run from the repository root:
+
+    python benchmarks/bench_cite2c.py --citations 10000
+"""
+
+from __future__ import print_function
+
+import argparse
+import time
+
+from traitlets.config import Config
+
+from generators import make_notebook
+from pre_cite2c import BibTexPreprocessor
+
+
+def run(ncitations, repeat=3, cache_dir=""):
+    config = Config()
+    config.BibTexPreprocessor.cache_dir = cache_dir
+    best = None
+    for _ in range(repeat):
+        nb = make_notebook(cells=100, citations_per_cell=max(1, ncitations // 100))
+        resources = {"output_extension": ".html", "output_files_dir": "bench_files", "unique_key": "bench"}
+        start = time.time()
+        BibTexPreprocessor(config=config).preprocess(nb, resources)
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--citations", type=int, default=10000, help="largest number of citations")
+    parser.add_argument("--steps", type=int, default=4, help="number of doublings up to --citations")
+    parser.add_argument("--repeat", type=int, default=3, help="repetitions per size, the best is reported")
+    parser.add_argument("--cache-dir", default="", help="citation cache directory, disabled by default")
+    args = parser.parse_args(argv)
+
+    sizes = [args.citations // 2**i for i in reversed(range(args.steps))]
+    print("{:>10} {:>10} {:>14}".format("citations", "time [s]", "us/citation"))
+    for n in sizes:
+        t = run(n, args.repeat, args.cache_dir)
+        print("{:>10} {:>10.3f} {:>14.1f}".format(n, t, 1e6 * t / n))
+
+
+if __name__ == '__main__':
+    main()
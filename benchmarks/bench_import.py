@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+
+"""Benchmark for the startup time of the command line and the extensions
+
+Runs every command in a fresh interpreter and reports the best wall time,
+next to that of an empty interpreter. Fails if the command line takes
+longer than --target seconds, or if importing the extensions loads modules
+that are only needed for some output formats.
+
+Run from the repository root:
+
+    python benchmarks/bench_import.py
+"""
+
+from __future__ import print_function
+
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+EXTENSIONS = os.path.join(ROOT, 'extensions')
+
+COMMANDS = [
+    ("python", ["-c", "pass"]),
+    ("cli --help", ["-m", "jupyterpublicationscripts", "--help"]),
+    ("cli typeset --help", ["-m", "jupyterpublicationscripts", "typeset", "--help"]),
+    ("cli check example", ["-m", "jupyterpublicationscripts", "check", "example"]),
+    ("import PrettyTable", ["-c", "import publicationextensions.PrettyTable"]),
+    ("import pre_markdown", ["-c", "import pre_markdown"]),
+    ("import pre_cite2c", ["-c", "import pre_cite2c"]),
+]
+
+# modules that must only be imported when a conversion needs them
+DEFERRED = ["citeproc", "unicode_tex", "sqlite3", "IPython", "notebook"]
+
+
+def environment():
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join([ROOT, EXTENSIONS] + [p for p in [env.get("PYTHONPATH")] if p])
+    return env
+
+
+def timed(args, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.time()
+        subprocess.check_call([sys.executable] + args, env=environment(), cwd=ROOT,
+                              stdout=subprocess.DEVNULL if hasattr(subprocess, "DEVNULL") else None)
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def loaded(module):
+    """
+    returns the modules of DEFERRED loaded by importing module
+    """
+    code = "import sys, {0}; print(' '.join(m for m in {1!r} if m in sys.modules))".format(module, DEFERRED)
+    output = subprocess.check_output([sys.executable, "-c", code], env=environment(), cwd=ROOT)
+    return output.decode().split()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5, help="runs per command, the best is reported")
+    parser.add_argument("--target", type=float, default=0.1, help="maximum startup time of the command line in s")
+    args = parser.parse_args(argv)
+
+    status = 0
+    print("{:>24} {:>10}".format("command", "time [s]"))
+    for name, command in COMMANDS:
+        t = timed(command, args.repeat)
+        slow = name.startswith("cli") and t > args.target
+        print("{:>24} {:>10.3f}{}".format(name, t, "  > target {:.3f} s".format(args.target) if slow else ""))
+        status = status or slow
+    for module in ["pre_markdown", "pre_cite2c", "publicationextensions.PrettyTable", "jupyterpublicationscripts"]:
+        modules = loaded(module)
+        if modules:
+            print("importing {} loads {}".format(module, ", ".join(modules)))
+            status = 1
+    return int(status)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+
+"""Benchmark for building PrettyTables from NumPy arrays and DataFrames
+
+Compares the column-wise formatting of ndarray and DataFrame input with
+the row-wise path taken by lists of rows, on a table of 10^6 cells.
+
+Run from the repository root:
+
+    python benchmarks/bench_prettytable.py --cells 1000000
+"""
+
+from __future__ import print_function
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from publicationextensions.PrettyTable import PrettyTable
+
+
+def timed(func, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.time()
+        func()
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--cells", type=int, default=10**6, help="number of table cells")
+    parser.add_argument("--columns", type=int, default=4, help="number of table columns")
+    parser.add_argument("--repeat", type=int, default=3, help="repetitions, the best is reported")
+    args = parser.parse_args(argv)
+
+    data = np.random.RandomState(0).randn(args.cells // args.columns, args.columns)
+    header = ["c{}".format(i) for i in range(args.columns)]
+    rows = list(data)
+
+    cases = [
+        ("list of rows", lambda fmt: PrettyTable(rows, header, formatstring=fmt)),
+        ("ndarray", lambda fmt: PrettyTable(data, header, formatstring=fmt)),
+    ]
+    try:
+        import pandas as pd
+        frame = pd.DataFrame(data, columns=header)
+        cases.append(("DataFrame", lambda fmt: PrettyTable(frame, formatstring=fmt)))
+    except ImportError:
+        pass
+
+    print("{:>14} {:>12} {:>10}".format("input", "formatstring", "time [s]"))
+    for fmt in ["", ".3f"]:
+        for name, build in cases:
+            print("{:>14} {:>12} {:>10.3f}".format(name, repr(fmt), timed(lambda: build(fmt), args.repeat)))
+
+
+if __name__ == '__main__':
+    main()
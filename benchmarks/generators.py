@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+
+"""Synthetic notebooks for the benchmarks
+
+All generators are deterministic for a given seed, so that timings of
+different versions are comparable.
+"""
+
+from __future__ import print_function
+
+import base64
+import os
+import random
+import sys
+
+import nbformat.v4 as nbf
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+# the extensions are not a package, nbconvert finds them on sys.path
+for path in (ROOT, os.path.join(ROOT, 'extensions')):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+WORDS = ("lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod tempor "
+         "incididunt ut labore et dolore magna aliqua").split()
+
+COLORS = ("red", "blue", "green", "orange")
+
+
+def make_reference(index):
+    """
+    returns cite2c (CSL-JSON) data of a journal article
+    """
+    return {
+        "type": "article-journal",
+        "title": "Synthetic article number {}".format(index),
+        "container-title": "Journal of Benchmarks",
+        "author": [{"family": "Author{}".format(index), "given": "A."}],
+        "issued": {"year": str(1950 + index % 70)},
+        "volume": str(index % 100),
+        "page": "1-10",
+    }
+
+
+def make_library(nrefs):
+    """
+    returns a cite2c reference library of nrefs articles by citation key
+    """
+    return dict(("bench/{:06d}".format(i), make_reference(i)) for i in range(nrefs))
+
+
+def make_table(rows, columns=4, seed=0):
+    """
+    returns a list of rows of random floats
+    """
+    rng = random.Random(seed)
+    return [[rng.random() for _ in range(columns)] for _ in range(rows)]
+
+
+def make_figure(size, seed=0):
+    """
+    returns size random bytes, base64 encoded in lines of 76 characters like
+    figures in notebooks. Only the size matters to the benchmarks, the data
+    is not a valid image.
+    """
+    rng = random.Random(seed)
+    data = bytes(bytearray(rng.getrandbits(8) for _ in range(size)))
+    return base64.encodebytes(data).decode("ascii") if hasattr(base64, "encodebytes") else base64.encodestring(data)
+
+
+def make_markdown(rng, keys, citations, colors, words=30):
+    """
+    returns the source of a markdown cell with the given number of <cite>
+    tags and <font color> tags in between words of filler text
+    """
+    parts = [" ".join(rng.choice(WORDS) for _ in range(words))]
+    for _ in range(citations):
+        parts.append('<cite data-cite="{}"></cite>'.format(rng.choice(keys)))
+    for _ in range(colors):
+        parts.append('<font color="{}">{}</font>'.format(rng.choice(COLORS), rng.choice(WORDS)))
+    rng.shuffle(parts)
+    return " ".join(parts)
+
+
+def make_notebook(cells=100, citations_per_cell=0, nrefs=200, colors_per_cell=0,
+                  tables=0, table_rows=100, table_columns=4, figures=0, figure_size=100000,
+                  distinct_figures=None, bibliography=True, seed=0):
+    """
+    returns a notebook with the given number of markdown cells, each holding
+    citations_per_cell citations to a cite2c library of nrefs references and
+    colors_per_cell font color tags. tables code cells display a PrettyTable
+    of table_rows x table_columns numbers, figures code cells display a PNG
+    of figure_size bytes, of which distinct_figures (default: all) differ,
+    and a final cell holds the bibliography.
+    """
+    from publicationextensions.PrettyTable import PrettyTable
+
+    rng = random.Random(seed)
+    library = make_library(nrefs)
+    keys = sorted(library)
+    nb_cells = []
+    for i in range(cells):
+        nb_cells.append(nbf.new_markdown_cell(make_markdown(rng, keys, citations_per_cell, colors_per_cell)))
+    for i in range(tables):
+        table = PrettyTable(make_table(table_rows, table_columns, seed + i), formatstring=".4f")
+        output = nbf.new_output("display_data", data={
+            "text/plain": "<PrettyTable>",
+            "text/html": table._repr_html_(),
+            "text/latex": table._repr_latex_(),
+        })
+        nb_cells.append(nbf.new_code_cell("PrettyTable(data)", outputs=[output], execution_count=i + 1))
+    distinct = [make_figure(figure_size, seed + i) for i in range(min(figures, distinct_figures or figures))]
+    for i in range(figures):
+        output = nbf.new_output("display_data", data={"text/plain": "<Figure>", "image/png": distinct[i % len(distinct)]})
+        nb_cells.append(nbf.new_code_cell("plot(data)", outputs=[output], execution_count=tables + i + 1))
+    if bibliography:
+        nb_cells.append(nbf.new_markdown_cell('<div class="cite2c-biblio"></div>'))
+    nb = nbf.new_notebook(cells=nb_cells)
+    nb.metadata["cite2c"] = {"citations": library}
+    nb.metadata["latex_metadata"] = {"title": "Benchmark notebook"}
+    return nb
@@ -0,0 +1,271 @@
+# -*- coding: utf-8 -*-
+
+"""Benchmark suite of the preprocessors, PrettyTable and the templates
+
+Every benchmark is run for all combinations of its parameters on synthetic
+notebooks from generators.py, and the best of --repeat runs is reported.
+Results can be saved as JSON and compared against a saved baseline, the
+suite then fails if a benchmark got slower by more than --threshold.
+
+Run from the repository root:
+
+    python benchmarks/run.py --save baseline.json
+    ... change something ...
+    python benchmarks/run.py --compare baseline.json
+"""
+
+from __future__ import print_function
+
+import argparse
+import atexit
+import copy
+import io
+import itertools
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from collections import OrderedDict
+
+from traitlets.config import Config
+
+from generators import ROOT, make_notebook, make_table
+
+# name -> (setup, parameter grid), setup is called with one combination of
+# parameters and returns the function to time
+BENCHMARKS = OrderedDict()
+
+# options of the command line used by the benchmarks
+OPTIONS = {"style": "harvard1"}
+
+
+def benchmark(name, **grid):
+    """
+    decorator registering a benchmark, grid gives the values of every
+    parameter of setup
+    """
+    def register(setup):
+        BENCHMARKS[name] = (setup, OrderedDict(sorted(grid.items())))
+        return setup
+    return register
+
+
+_notebooks = {}
+
+def notebook(**kw):
+    """
+    returns a copy of a generated notebook, the preprocessors modify it
+    """
+    key = tuple(sorted(kw.items()))
+    if key not in _notebooks:
+        _notebooks[key] = make_notebook(**kw)
+    return copy.deepcopy(_notebooks[key])
+
+
+_tempdir = []
+
+def tempdir():
+    """
+    returns a temporary directory removed when the suite exits
+    """
+    if not _tempdir:
+        _tempdir.append(tempfile.mkdtemp())
+        atexit.register(shutil.rmtree, _tempdir[0], True)
+    return _tempdir[0]
+
+
+def resources(extension):
+    return {"output_extension": extension, "output_files_dir": "bench_files", "unique_key": "bench",
+            "metadata": {"name": "bench"}, "outputs": {}}
+
+
+def preprocessor_config():
+    config = Config()
+    config.BibTexPreprocessor.cache_dir = ""
+    config.BibTexPreprocessor.citation_style = OPTIONS["style"]
+    return config
+
+#-----------------------------------------------------------------------------
+# Benchmarks
+#-----------------------------------------------------------------------------
+
+@benchmark("markdown", cells=[1000, 10000], colors_per_cell=[1, 10])
+def markdown(cells, colors_per_cell):
+    from pre_markdown import MarkdownPreprocessor
+    nb = notebook(cells=cells, colors_per_cell=colors_per_cell, bibliography=False)
+    return lambda: MarkdownPreprocessor().preprocess(nb, resources(".tex"))
+
+
+@benchmark("cite2c.html", citations_per_cell=[1, 10], nrefs=[100, 1000])
+def cite2c_html(citations_per_cell, nrefs):
+    from pre_cite2c import BibTexPreprocessor
+    nb = notebook(cells=200, citations_per_cell=citations_per_cell, nrefs=nrefs)
+    return lambda: BibTexPreprocessor(config=preprocessor_config()).preprocess(nb, resources(".html"))
+
+
+@benchmark("cite2c.bibfile", nrefs=[100, 1000, 10000])
+def cite2c_bibfile(nrefs):
+    from pre_cite2c import BibTexPreprocessor
+    nb = notebook(cells=10, nrefs=nrefs)
+    # a new file every time, unchanged .bib files are not rewritten
+    fd, bibfile = tempfile.mkstemp(suffix=".bib", dir=tempdir())
+    os.close(fd)
+    os.remove(bibfile)
+    def run():
+        preprocessor = BibTexPreprocessor(config=preprocessor_config())
+        preprocessor.references = nb.metadata["cite2c"]["citations"]
+        preprocessor.create_bibfile({"outputs": {}}, bibfile)
+    return run
+
+
+@benchmark("prettytable", rows=[1000, 100000], output=["html", "latex"])
+def prettytable(rows, output):
+    from publicationextensions.PrettyTable import PrettyTable
+    data = make_table(rows)
+    return lambda: getattr(PrettyTable(data, formatstring=".4f"), "_repr_" + output + "_")()
+
+
+@benchmark("template", template=["latex_nocode", "revtex_nocode"], tables=[0, 10])
+def template(template, tables):
+    from nbconvert.exporters import LatexExporter
+    config = preprocessor_config()
+    config.Exporter.preprocessors = ["pre_markdown.MarkdownPreprocessor", "pre_cite2c.BibTexPreprocessor"]
+    config.Exporter.template_path = [os.path.join(ROOT, "templates")]
+    config.Exporter.template_file = template
+    config.BibTexPreprocessor.write_bibfile = False
+    nb = notebook(cells=100, citations_per_cell=2, colors_per_cell=2, tables=tables)
+    exporter = LatexExporter(config=config)
+    return lambda: exporter.from_notebook_node(nb, resources(".tex"))
+
+@benchmark("figures", figures=[10, 100], distinct=[1, 10], stored=[False, True])
+def figures(figures, distinct, stored):
+    from pre_figures import FigureStorePreprocessor
+    nb = notebook(cells=10, figures=figures, distinct_figures=distinct, bibliography=False)
+    res = resources(".tex")
+    res["output_files_dir"] = tempfile.mkdtemp(dir=tempdir())
+    if stored:
+        # figures written by a previous conversion
+        FigureStorePreprocessor().preprocess(copy.deepcopy(nb), dict(res))
+    return lambda: FigureStorePreprocessor().preprocess(nb, res)
+
+
+@benchmark("fragments", to=["html", "latex"], cells=[1000], cached=[False, True])
+def fragments(to, cells, cached):
+    from nbconvert.exporters import get_exporter
+    from jupyterpublicationscripts.fragments import FragmentCache, install
+    exporter = install(get_exporter(to)())
+    nb = notebook(cells=cells, colors_per_cell=1, tables=10)
+    filename = os.path.join(tempdir(), "fragments-{}.json".format(to))
+    if os.path.exists(filename):
+        os.remove(filename)
+    if cached:
+        # a previous build, then one cell changes
+        with FragmentCache(filename, []) as cache:
+            exporter.from_notebook_node(nb, resources(exporter.file_extension))
+        cache.save()
+        nb.cells[0].source += " changed"
+    def run():
+        with FragmentCache(filename, []):
+            exporter.from_notebook_node(nb, resources(exporter.file_extension))
+    return run
+
+
+@benchmark("read", figures=[20, 100], reader=["nbformat", "stream"])
+def read(figures, reader):
+    import nbformat
+    from nbstream import read_notebook
+    filename = os.path.join(tempdir(), "read-{}.ipynb".format(figures))
+    if not os.path.exists(filename):
+        nbformat.write(notebook(cells=100, figures=figures, figure_size=1000000, distinct_figures=10), filename)
+    if reader == "nbformat":
+        return lambda: nbformat.read(filename, as_version=4)
+    spill_dir = tempfile.mkdtemp(dir=tempdir())
+    return lambda: read_notebook(filename, spill_dir, 1 << 20)
+
+#-----------------------------------------------------------------------------
+# Runner
+#-----------------------------------------------------------------------------
+
+def cases(pattern=None):
+    """
+    yields name and parameters of every benchmark case matching pattern
+    """
+    for name, (setup, grid) in BENCHMARKS.items():
+        for values in itertools.product(*grid.values()):
+            params = OrderedDict(zip(grid, values))
+            case = "{}[{}]".format(name, ",".join("{}={}".format(k, v) for k, v in params.items()))
+            if pattern is None or pattern in case:
+                yield case, setup, params
+
+
+def run(setup, params, repeat):
+    """
+    returns the best time of repeat runs, each on a fresh setup
+    """
+    best = None
+    for _ in range(repeat):
+        func = setup(**params)
+        start = time.time()
+        func()
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("-k", "--filter", default=None, help="only run cases containing this string")
+    parser.add_argument("--repeat", type=int, default=3, help="repetitions per case, the best is reported")
+    parser.add_argument("--style", default=OPTIONS["style"], help="CSL style of the pre_cite2c citations")
+    parser.add_argument("--save", default=None, metavar="<file.json>", help="save the results")
+    parser.add_argument("--compare", default=None, metavar="<file.json>", help="compare with saved results")
+    parser.add_argument("--threshold", type=float, default=1.2,
+                        help="slowdown relative to --compare considered a regression (default: 1.2)")
+    parser.add_argument("--list", action="store_true", help="list the cases and exit")
+    args = parser.parse_args(argv)
+    OPTIONS["style"] = args.style
+
+    if args.list:
+        for case, _, _ in cases(args.filter):
+            print(case)
+        return 0
+
+    baseline = {}
+    if args.compare:
+        with io.open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    results = OrderedDict()
+    regressions = []
+    errors = []
+    print("{:<60} {:>10} {:>8}".format("case", "time [s]", "ratio" if baseline else ""))
+    for case, setup, params in cases(args.filter):
+        try:
+            t = run(setup, params, args.repeat)
+        except Exception as e:
+            errors.append(case)
+            print("{:<60} {:>10}   {}: {}".format(case, "error", type(e).__name__, str(e).splitlines()[0] if str(e) else ""))
+            continue
+        results[case] = t
+        ratio = ""
+        if baseline.get(case):
+            ratio = t / baseline[case]
+            if ratio > args.threshold:
+                regressions.append(case)
+            ratio = "{:.2f}".format(ratio)
+        print("{:<60} {:>10.4f} {:>8}".format(case, t, ratio))
+
+    if args.save:
+        with io.open(args.save, "w", encoding="utf-8") as f:
+            f.write(json.dumps(results, indent=1))
+    if regressions:
+        print("\n{} regression(s) slower than {:.2f}x the baseline:".format(len(regressions), args.threshold))
+        for case in regressions:
+            print("  " + case)
+    return 1 if regressions or errors else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
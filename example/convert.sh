@@ -6,12 +6,11 @@
 # convert ipython notebook to latex
 ipython nbconvert --to=latex ExampleNotebook.ipynb
 
-# typeset latex file into pdf and run bibtex inbetween, run pdflatex three times to get all references etc. correct
-pdflatex ExampleNotebook.tex > /dev/null 2>&1
-bibtex ExampleNotebook.aux
-pdflatex ExampleNotebook.tex > /dev/null 2>&1
-pdflatex ExampleNotebook.tex > /dev/null 2>&1
+# typeset latex file into pdf, pdflatex is only rerun until all references etc. are correct
+# and bibtex only runs if the citations or the bibliography changed
+PYTHONPATH="..:$PYTHONPATH" python -m jupyterpublicationscripts typeset ExampleNotebook.tex
 
-# cleanup temorary conversion and latex files
-rm *.bbl *.aux *.blg *.log *.out *Notes.bib *.tex
+# cleanup temorary conversion and latex files, the auxiliary files and the
+# record of the last bibtex run are kept, so that the next run can skip passes
+rm *.blg *.log *Notes.bib *.tex
 rm -rf ExampleNotebook_files
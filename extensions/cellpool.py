@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+
+"""Worker pool shared by the preprocessors to process the cells of large
+notebooks in parallel
+"""
+
+#-----------------------------------------------------------------------------
+# Imports
+#-----------------------------------------------------------------------------
+from __future__ import (absolute_import, division, print_function, unicode_literals)
+
+from concurrent.futures import ProcessPoolExecutor
+
+#-----------------------------------------------------------------------------
+# Functions
+#-----------------------------------------------------------------------------
+def map_cells(func, args, workers, initializer=None, initargs=()):
+    """
+    returns [func(*a) for a in args], computed by up to workers processes.
+    Results are returned in the order of args, whatever the order in which
+    the workers finish, so that merging them is deterministic. func and
+    initializer must be module-level functions, and func, args and results
+    picklable.
+
+    Parameters
+    ----------
+    func: callable
+        function applied to every element of args, typically a cell source
+    args: list
+        tuples of arguments of func
+    workers: int
+        number of worker processes, with 1 or a single element args is
+        processed in the calling process
+    initializer: callable
+        called with initargs in every worker before processing, e.g. to
+        pass data shared by all cells only once per worker
+    """
+    workers = min(workers, len(args))
+    if workers <= 1:
+        if initializer is not None:
+            initializer(*initargs)
+        return [func(*a) for a in args]
+    # a few chunks per worker balance the load while keeping the number of
+    # pickled messages small
+    chunksize = max(1, len(args) // (4 * workers))
+    with ProcessPoolExecutor(workers, initializer=initializer, initargs=initargs) as pool:
+        return list(pool.map(func, *zip(*args), chunksize=chunksize))
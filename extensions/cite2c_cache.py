@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+
+"""Persistent on-disk cache for rendered citeproc citations and bibliography entries
+"""
+
+#-----------------------------------------------------------------------------
+# Imports
+#-----------------------------------------------------------------------------
+from __future__ import (absolute_import, division, print_function, unicode_literals)
+
+import os
+import io
+import json
+import hashlib
+
+from publicationextensions.atomicfile import atomic_write
+
+#-----------------------------------------------------------------------------
+# Functions
+#-----------------------------------------------------------------------------
+def default_cache_dir():
+    """
+    returns the default cache directory, following the XDG base directory spec
+    """
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "jupyter-publication-scripts", "citeproc")
+
+
+def item_hash(item):
+    """
+    returns a stable hash of a CSL-JSON item (a cite2c reference)
+
+    Parameters
+    ----------
+    item: dictionary
+        CSL-JSON data of a single reference
+    """
+    data = json.dumps(item, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha1(data.encode("utf-8")).hexdigest()
+
+
+def cache_key(*parts):
+    """
+    returns the content address for the given key parts
+    """
+    return hashlib.sha1("\0".join(parts).encode("utf-8")).hexdigest()
+
+#-----------------------------------------------------------------------------
+# Classes
+#-----------------------------------------------------------------------------
+class CitationCache(object):
+    """ Content-addressed store of rendered strings, one small JSON file per
+        entry. Reading an entry refreshes its modification time, so that
+        evict() can drop the least recently used entries once the cache
+        grows beyond max_size bytes.
+        """
+    def __init__(self, directory, max_size=64*1024*1024):
+        """
+        Public constructor
+
+        Parameters
+        ----------
+        directory : str
+            directory holding the cache entries, created on first write
+        max_size : int
+            upper bound of the total size of all entries in bytes
+        """
+        self.directory = directory
+        self.max_size = max_size
+        self.written = False
+
+    def path(self, key):
+        return os.path.join(self.directory, key[:2], key + ".json")
+
+    def get(self, key):
+        """
+        returns the cached value for key, or None if there is none
+        """
+        path = self.path(key)
+        try:
+            with io.open(path, encoding="utf-8") as f:
+                value = json.load(f)
+        except (IOError, OSError, ValueError):
+            return None
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+        return value
+
+    def set(self, key, value):
+        """
+        stores value under key, the file is replaced atomically so that
+        concurrent conversions never read a partial entry
+        """
+        atomic_write(self.path(key), json.dumps(value, ensure_ascii=False))
+        self.written = True
+
+    def evict(self):
+        """
+        removes the least recently used entries until the cache fits into max_size
+        """
+        if not self.written:
+            return
+        self.written = False
+        entries = []
+        total = 0
+        for root, dirs, files in os.walk(self.directory):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, path))
+                total += st.st_size
+        if total <= self.max_size:
+            return
+        entries.sort()
+        for mtime, size, path in entries:
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            if total <= self.max_size:
+                break
@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+
+"""Validation of the cite2c citations of notebooks against their references:
+cited keys missing from the references, references never cited and
+references stored more than once under different keys. Notebooks are read as
+plain JSON one cell at a time, dropping the code cells with their outputs, and
+all markdown cells are scanned at once, so that many notebooks can be checked
+before converting any of them.
+"""
+
+#-----------------------------------------------------------------------------
+# Imports
+#-----------------------------------------------------------------------------
+from __future__ import (absolute_import, division, print_function, unicode_literals)
+
+import re
+from collections import OrderedDict
+
+from nbstream import iter_notebook
+
+# cite2c inserts citations as empty <cite> tags and marks the bibliography
+# position with an empty <div>; both are matched once per cell
+CITE_RE = re.compile(r'<cite data-cite="(.*?)"></cite>')
+BIBLIO_TAG = '<div class="cite2c-biblio"></div>'
+
+TITLE_RE = re.compile(r"\W+", re.UNICODE)
+
+#-----------------------------------------------------------------------------
+# Functions
+#-----------------------------------------------------------------------------
+def markdown_sources(nb):
+    """
+    returns the sources of the markdown cells of a notebook read as JSON,
+    of nbformat 4 or, with worksheets, 3
+    """
+    cells = nb.get("cells")
+    if cells is None:
+        cells = [cell for worksheet in nb.get("worksheets", []) for cell in worksheet.get("cells", [])]
+    sources = []
+    for cell in cells:
+        if cell.get("cell_type") == "markdown":
+            source = cell.get("source", "")
+            sources.append(source if not isinstance(source, list) else "".join(source))
+    return sources
+
+
+def cited_keys(sources):
+    """
+    returns the number of citations by citation key in the given markdown
+    sources, in order of first citation
+    """
+    counts = OrderedDict()
+    for key in CITE_RE.findall("\n".join(sources)):
+        counts[key] = counts.get(key, 0) + 1
+    return counts
+
+
+def reference_identity(reference):
+    """
+    returns what identifies the publication of a cite2c reference regardless
+    of its key: the DOI or, without one, the normalized title and year
+    """
+    doi = reference.get("DOI")
+    if doi:
+        return "doi:" + doi.strip().lower()
+    title = TITLE_RE.sub(" ", reference.get("title", "")).strip().lower()
+    if not title:
+        return None
+    year = reference.get("issued", {}).get("year") or \
+        "".join(str(p) for p in (reference.get("issued", {}).get("date-parts") or [[""]])[0][:1])
+    return "title:" + title + ":" + str(year)
+
+
+def check_references(cited, references, shared=None):
+    """
+    returns the problems of the citations of a notebook as a dictionary of
+    missing (citation count by key cited but not in the references), unused
+    (keys of references not cited) and duplicates (lists of keys of the same
+    publication).
+
+    Parameters
+    ----------
+    cited: dictionary
+        number of citations by citation key, see cited_keys
+    references: dictionary
+        cite2c reference data by citation key
+    shared: dictionary
+        references of all notebooks of a project with a reference store,
+        cited keys found in them are not missing
+    """
+    # citeproc looks up citation keys regardless of case
+    known = set(key.lower() for key in references)
+    if shared:
+        known.update(key.lower() for key in shared)
+    missing = OrderedDict((key, count) for key, count in cited.items() if key.lower() not in known)
+    used = set(key.lower() for key in cited)
+    unused = sorted(key for key in references if key.lower() not in used)
+
+    # keys differing in case only are the same for citeproc
+    groups = OrderedDict()
+    for key in sorted(references):
+        groups.setdefault("key:" + key.lower(), []).append(key)
+        identity = reference_identity(references[key])
+        if identity is not None:
+            groups.setdefault(identity, []).append(key)
+    duplicates = []
+    for keys in groups.values():
+        if len(keys) > 1 and keys not in duplicates:
+            duplicates.append(keys)
+    return {"missing": missing, "unused": unused, "duplicates": duplicates}
+
+
+def read_citations(path):
+    """
+    returns the citation counts by key and the cite2c references of the
+    notebook file path, read without validating the notebook
+    """
+    nb = {"cells": []}
+    for key, value in iter_notebook(path):
+        if key == "cell":
+            if value.get("cell_type") == "markdown":
+                nb["cells"].append(value)
+        else:
+            nb[key] = value
+    return cited_keys(markdown_sources(nb)), nb.get("metadata", {}).get("cite2c", {}).get("citations", {})
+
+
+def check_notebook(path, shared=None):
+    """
+    returns the problems of the citations of the notebook file path, see
+    check_references
+    """
+    cited, references = read_citations(path)
+    return check_references(cited, references, shared)
@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+
+"""Project-wide store of cite2c references shared by all notebooks
+"""
+
+#-----------------------------------------------------------------------------
+# Imports
+#-----------------------------------------------------------------------------
+from __future__ import (absolute_import, division, print_function, unicode_literals)
+
+import os
+import json
+import sqlite3
+
+from cite2c_cache import item_hash
+from nbstream import notebook_metadata
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS reference (
+    id TEXT PRIMARY KEY,
+    hash TEXT NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS notebook (
+    path TEXT PRIMARY KEY,
+    hash TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS source (
+    path TEXT NOT NULL,
+    id TEXT NOT NULL,
+    PRIMARY KEY (path, id)
+);
+CREATE INDEX IF NOT EXISTS source_id ON source (id);
+"""
+
+#-----------------------------------------------------------------------------
+# Functions
+#-----------------------------------------------------------------------------
+def notebook_references(path):
+    """
+    returns the cite2c references in the metadata of the notebook file path,
+    read without validating the notebook
+    """
+    return notebook_metadata(path).get("cite2c", {}).get("citations", {})
+
+
+def build_store(filename, notebooks, retain=None):
+    """
+    returns the ReferenceStore filename updated with the references of
+    notebooks, only notebooks whose references changed are written. If
+    retain is given, the notebooks not in it are dropped, so that the store
+    lists the references of these notebooks only.
+
+    Parameters
+    ----------
+    filename: str
+        SQLite database, created if it does not exist
+    notebooks: list
+        paths of the notebooks to read the references of
+    retain: list
+        paths of all notebooks of the project, None keeps all notebooks
+    """
+    store = ReferenceStore(filename)
+    with store.db:
+        for path in notebooks:
+            store.update(os.path.abspath(path), notebook_references(path))
+        if retain is not None:
+            store.retain([os.path.abspath(path) for path in retain])
+    return store
+
+#-----------------------------------------------------------------------------
+# Classes
+#-----------------------------------------------------------------------------
+class ReferenceStore(object):
+    """ SQLite database of the cite2c references of a project, indexed by
+        citation key. Every reference is stored once however many notebooks
+        cite it, together with the notebooks it was taken from, so that the
+        references of deleted notebooks can be dropped.
+        """
+    def __init__(self, filename):
+        """
+        Public constructor
+
+        Parameters
+        ----------
+        filename : str
+            SQLite database, created if it does not exist
+        """
+        self.filename = filename
+        if os.path.dirname(filename) and not os.path.isdir(os.path.dirname(filename)):
+            os.makedirs(os.path.dirname(filename))
+        # concurrent conversions wait for each other's writes
+        self.db = sqlite3.connect(filename, timeout=60)
+        with self.db:
+            self.db.executescript(SCHEMA)
+        # whether references were recorded or dropped since it was opened
+        self.changed = False
+
+    def close(self):
+        self.db.close()
+
+    def update(self, path, references):
+        """
+        records the references of the notebook path, returns False if they
+        did not change since they were last recorded. A reference differing
+        from the stored one with the same key replaces it, references the
+        notebook no longer has are dropped unless other notebooks have them.
+
+        Parameters
+        ----------
+        path: str
+            notebook the references are taken from
+        references: dictionary
+            cite2c reference data by citation key
+        """
+        refhash = item_hash(references)
+        row = self.db.execute("SELECT hash FROM notebook WHERE path = ?", (path,)).fetchone()
+        if row is not None and row[0] == refhash:
+            return False
+        with self.db:
+            stored = dict(self.db.execute("SELECT id, hash FROM reference WHERE id IN (SELECT id FROM source "
+                                          "WHERE path = ?)", (path,)))
+            for key, reference in references.items():
+                h = item_hash(reference)
+                if stored.get(key) == h:
+                    continue
+                row = self.db.execute("SELECT hash FROM reference WHERE id = ?", (key,)).fetchone()
+                if row is not None and row[0] != h:
+                    print("Warning: Reference " + key + " of " + path + " differs from other notebooks, using this one")
+                if row is None or row[0] != h:
+                    self.db.execute("INSERT OR REPLACE INTO reference (id, hash, data) VALUES (?, ?, ?)",
+                                    (key, h, json.dumps(reference, sort_keys=True, ensure_ascii=False)))
+            self.db.execute("DELETE FROM source WHERE path = ?", (path,))
+            self.db.executemany("INSERT INTO source (path, id) VALUES (?, ?)", [(path, key) for key in references])
+            self.db.execute("INSERT OR REPLACE INTO notebook (path, hash) VALUES (?, ?)", (path, refhash))
+            self.db.executemany("DELETE FROM reference WHERE id = ? AND id NOT IN (SELECT id FROM source)",
+                                [(key,) for key in set(stored) - set(references)])
+        self.changed = True
+        return True
+
+    def retain(self, paths):
+        """
+        drops the notebooks not in paths and the references only they cite
+        """
+        known = [row[0] for row in self.db.execute("SELECT path FROM notebook")]
+        gone = [(path,) for path in set(known) - set(paths)]
+        if not gone:
+            return
+        with self.db:
+            self.db.executemany("DELETE FROM notebook WHERE path = ?", gone)
+            self.db.executemany("DELETE FROM source WHERE path = ?", gone)
+            self.db.execute("DELETE FROM reference WHERE id NOT IN (SELECT id FROM source)")
+        self.changed = True
+
+    def get(self, keys):
+        """
+        returns the stored references of keys by citation key, unknown keys
+        are left out
+        """
+        references = {}
+        for key in keys:
+            row = self.db.execute("SELECT data FROM reference WHERE id = ?", (key,)).fetchone()
+            if row is not None:
+                references[key] = json.loads(row[0])
+        return references
+
+    def all(self):
+        """
+        returns all stored references by citation key, in key order
+        """
+        return dict((key, json.loads(data)) for key, data in
+                    self.db.execute("SELECT id, data FROM reference ORDER BY id"))
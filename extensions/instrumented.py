@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+
+"""Instrumentation of the preprocessors, see publicationextensions.instrument,
+with no-op replacements if the publicationextensions package is not installed
+"""
+
+#-----------------------------------------------------------------------------
+# Imports
+#-----------------------------------------------------------------------------
+from __future__ import (absolute_import, division, print_function, unicode_literals)
+
+try:
+    from publicationextensions.instrument import get_instrumentation, stage, notebook
+except ImportError:
+    # without the publicationextensions package conversions are not instrumented
+    from contextlib import contextmanager
+    get_instrumentation = lambda config=None: None
+    @contextmanager
+    def stage(name):
+        yield
+    notebook = stage
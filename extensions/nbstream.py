@@ -0,0 +1,228 @@
+# -*- coding: utf-8 -*-
+
+"""Streaming reader for notebooks with large embedded outputs
+
+The notebook JSON is parsed incrementally, with the decoder of the json
+module on a buffer that only has to hold the value being decoded, and the
+cells are yielded one at a time. Output payloads larger than a threshold,
+e.g. the base64 data of figures, are spilled to files named after the hash
+of their data and replaced by empty strings, the files are listed in the
+output metadata under SPILLED. The markdown and citation preprocessors then work on
+a notebook whose size does not depend on its outputs, at most a single cell
+is held in memory with its outputs while reading. restore() puts the spilled
+data back before the notebook is rendered, the FigureStorePreprocessor stores
+spilled figures straight from their files.
+"""
+
+#-----------------------------------------------------------------------------
+# Imports
+#-----------------------------------------------------------------------------
+from __future__ import (absolute_import, division, print_function, unicode_literals)
+
+import os
+import io
+import re
+import json
+import hashlib
+
+from publicationextensions.atomicfile import atomic_write
+
+# output metadata listing the spilled payloads by mime type
+SPILLED = "jps_spilled"
+
+# characters of the notebook read at once by the fallback parser
+CHUNK = 1 << 16
+
+WHITESPACE_RE = re.compile(r"\s*")
+DECODER = json.JSONDecoder()
+
+#-----------------------------------------------------------------------------
+# Parsers
+#-----------------------------------------------------------------------------
+class JSONStream(object):
+    """ Incremental parsing of a JSON text file, values are decoded with
+        json.JSONDecoder.raw_decode from a buffer that grows until it holds
+        the whole value, and is emptied when values were consumed.
+        """
+    def __init__(self, f):
+        self.f = f
+        self.buffer = ""
+        self.pos = 0
+
+    def fill(self):
+        """
+        reads more of the file into the buffer, at least as much as it holds,
+        so that a large value is decoded in a few attempts. Returns False at
+        the end of the file.
+        """
+        data = self.f.read(max(CHUNK, len(self.buffer) - self.pos))
+        if not data:
+            return False
+        self.buffer = self.buffer[self.pos:] + data
+        self.pos = 0
+        return True
+
+    def peek(self):
+        """
+        returns the next character that is not whitespace, "" at the end
+        """
+        while True:
+            self.pos = WHITESPACE_RE.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer) or not self.fill():
+                return self.buffer[self.pos:self.pos + 1]
+
+    def expect(self, characters):
+        """
+        consumes and returns the next character, which must be one of characters
+        """
+        c = self.peek()
+        if not c or c not in characters:
+            raise ValueError("expected one of '{}' at '{}'".format(characters, self.buffer[self.pos:self.pos + 20]))
+        self.pos += 1
+        return c
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = DECODER.raw_decode(self.buffer, self.pos)
+            except ValueError:
+                # the value is not complete yet
+                if not self.fill():
+                    raise
+                continue
+            # a number at the end of the buffer may continue in the file
+            if end < len(self.buffer) or not self.fill():
+                self.pos = end
+                return value
+
+
+def iter_json(f):
+    """
+    yields the top level items of the notebook in the text file f as
+    (key, value), and every cell as ("cell", cell) instead of the cell list
+    """
+    stream = JSONStream(f)
+    stream.expect("{")
+    if stream.peek() == "}":
+        return
+    while True:
+        key = stream.value()
+        stream.expect(":")
+        if key == "cells" and stream.peek() == "[":
+            stream.expect("[")
+            if stream.peek() == "]":
+                stream.expect("]")
+            else:
+                while True:
+                    yield "cell", stream.value()
+                    if stream.expect(",]") == "]":
+                        break
+        else:
+            yield key, stream.value()
+        if stream.expect(",}") == "}":
+            return
+
+
+def iter_notebook(path):
+    """
+    yields the top level items of the notebook file path as (key, value),
+    and its cells one at a time as ("cell", cell)
+    """
+    with io.open(path, encoding="utf-8") as f:
+        for item in iter_json(f):
+            yield item
+
+
+def notebook_metadata(path):
+    """
+    returns the metadata of the notebook file path, the cells are parsed
+    one at a time and dropped
+    """
+    for key, value in iter_notebook(path):
+        if key == "metadata":
+            return value
+    return {}
+
+#-----------------------------------------------------------------------------
+# Spilling
+#-----------------------------------------------------------------------------
+def is_json_mime(mime_type):
+    # JSON payloads are data structures, not text split into lines
+    return mime_type == "application/json" or mime_type.endswith("+json")
+
+
+def spill_cell(cell, directory, threshold):
+    """
+    replaces the output payloads of cell longer than threshold characters by
+    empty strings, the data is written to files in directory named after its
+    hash, which are not written again if they exist. Returns the files.
+    """
+    spilled = []
+    for output in cell.get("outputs", []):
+        for mime_type, data in list(output.get("data", {}).items()):
+            if is_json_mime(mime_type):
+                continue
+            if isinstance(data, list):
+                data = "".join(data)
+            if len(data) <= threshold:
+                continue
+            data = data.encode("utf-8")
+            filename = os.path.join(directory, hashlib.sha1(data).hexdigest()[:20] + ".spill")
+            if not os.path.exists(filename):
+                atomic_write(filename, data)
+            output["data"][mime_type] = ""
+            output.setdefault("metadata", {}).setdefault(SPILLED, {})[mime_type] = filename
+            spilled.append(filename)
+    return spilled
+
+
+def read_notebook(path, directory, threshold=1 << 20):
+    """
+    returns the notebook file path as NotebookNode of nbformat 4, with the
+    output payloads longer than threshold characters spilled to directory.
+    Spilled files of earlier reads that are not used by the notebook are
+    removed. Unlike nbformat.read, the notebook is not validated.
+    """
+    import nbformat
+
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    nb = {"cells": []}
+    used = set()
+    for key, value in iter_notebook(path):
+        if key == "cell":
+            used.update(spill_cell(value, directory, threshold))
+            nb["cells"].append(value)
+        else:
+            nb[key] = value
+
+    major = nb.get("nbformat", 4)
+    if major < 4:
+        # the cells of older notebooks are in their worksheets, which are
+        # read at once and spilled once converted
+        nb.pop("cells")
+    # like nbformat.read, joins multi-line strings and drops transient data
+    nb = nbformat.versions[major].to_notebook_json(nb, minor=nb.get("nbformat_minor", 0))
+    if major < 4:
+        nb = nbformat.convert(nb, 4)
+        for cell in nb.cells:
+            used.update(spill_cell(cell, directory, threshold))
+
+    for name in os.listdir(directory):
+        if name.endswith(".spill") and os.path.join(directory, name) not in used:
+            os.remove(os.path.join(directory, name))
+    return nb
+
+
+def restore(nb):
+    """
+    puts the spilled output payloads of nb back, returns nb
+    """
+    for cell in nb.cells:
+        for output in cell.get("outputs", []):
+            spilled = output.get("metadata", {}).pop(SPILLED, {})
+            for mime_type, filename in spilled.items():
+                with io.open(filename, encoding="utf-8") as f:
+                    output.data[mime_type] = f.read()
+    return nb
@@ -10,22 +10,18 @@
 from __future__ import (absolute_import, division, print_function, unicode_literals)
 
 from nbconvert.preprocessors import *
+from traitlets import Unicode, Integer, Bool
 import os
 import sys
-import re
-import json
 
-from citeproc.py2compat import *
-import citeproc
-import citeproc.source.json
+if sys.version_info[0] < 3:
+    from citeproc.py2compat import *
 
-import unicode_tex
-
-# unicode_tex replaces also spaces, this causes problems with bibtex and is undesirable anyway
-try:
-    del unicode_tex.unicode_to_tex_map[u' ']
-except KeyError:
-    pass
+from cite2c_cache import CitationCache, default_cache_dir, item_hash, cache_key
+from cellpool import map_cells
+from cite2c_check import CITE_RE, BIBLIO_TAG, cited_keys
+from instrumented import get_instrumentation, stage, notebook
+from publicationextensions.atomicfile import write_if_changed
 
 #-----------------------------------------------------------------------------
 # Classes
@@ -34,7 +30,217 @@ def cite_warn(citation_item):
     print("WARNING: Reference with key '{}' not found in the bibliography.".format(citation_item.key))
 
 
+# citeproc is only needed for HTML output and imported on first use, see
+# load_citeproc
+citeproc = None
+
+def load_citeproc():
+    global citeproc
+    if citeproc is None:
+        import citeproc.source.json
+    return citeproc
+
+
+# parsed CSL styles by (style, locale), parsing is expensive and styles are
+# reused across notebooks converted in the same process
+_styles = {}
+
+def get_style(style, locale):
+    try:
+        return _styles[(style, locale)]
+    except KeyError:
+        load_citeproc()
+        bib_style = citeproc.CitationStylesStyle(style, locale=locale, validate=False)
+        _styles[(style, locale)] = bib_style
+        return bib_style
+
+
+_tex_translation = None
+_tex_strings = {}
+
+def unicode_to_tex(text):
+    """
+    returns text with non-ascii and special characters replaced by TeX
+    commands. Equivalent to unicode_tex.unicode_to_tex, but translates with a
+    table built once from unicode_tex.unicode_to_tex_map and memoizes results,
+    as the same names and titles recur across a library.
+    """
+    global _tex_translation
+    try:
+        return _tex_strings[text]
+    except KeyError:
+        pass
+    if _tex_translation is None:
+        # unicode_tex is only imported once LaTeX output needs it. Its map
+        # replaces also spaces, this causes problems with bibtex and is
+        # undesirable anyway. unicode_tex.unicode_to_tex maps single
+        # characters only.
+        import unicode_tex
+        _tex_translation = dict((ord(k), v) for k, v in unicode_tex.unicode_to_tex_map.items()
+                                if len(k) == 1 and k != u' ')
+    with stage("cite2c.unicode_tex"):
+        tex = text.translate(_tex_translation)
+    _tex_strings[text] = tex
+    return tex
+
+
+def format_names(names):
+    return " and ".join(unicode_to_tex(n["family"]) + ", " + unicode_to_tex(n["given"]) if "given" in n
+                        else unicode_to_tex(n["family"]) if "family" in n
+                        else "{" + unicode_to_tex(n.get("literal", "")) + "}"
+                        for n in names)
+
+
+def format_year(issued):
+    # cite2c stores the year directly, CSL-JSON uses date-parts
+    if "year" in issued:
+        return str(issued["year"])
+    return str(issued.get("date-parts", [[""]])[0][0])
+
+
+def format_pages(pages):
+    return pages.replace("-", "--")
+
+
+def format_raw(value):
+    return str(value)
+
+
+# CSL item types (CSL 1.0.2) and the BibTeX entry types they are written as
+BIBTEX_TYPES = {
+    "article": "misc",
+    "article-journal": "article",
+    "article-magazine": "article",
+    "article-newspaper": "article",
+    "bill": "misc",
+    "book": "book",
+    "broadcast": "misc",
+    "chapter": "inbook",
+    "classic": "book",
+    "collection": "book",
+    "dataset": "misc",
+    "document": "misc",
+    "entry": "misc",
+    "entry-dictionary": "incollection",
+    "entry-encyclopedia": "incollection",
+    "event": "misc",
+    "figure": "misc",
+    "graphic": "misc",
+    "hearing": "misc",
+    "interview": "misc",
+    "legal_case": "misc",
+    "legislation": "misc",
+    "manuscript": "unpublished",
+    "map": "misc",
+    "motion_picture": "misc",
+    "musical_score": "misc",
+    "pamphlet": "booklet",
+    "paper-conference": "inproceedings",
+    "patent": "misc",
+    "performance": "misc",
+    "periodical": "misc",
+    "personal_communication": "misc",
+    "post": "misc",
+    "post-weblog": "misc",
+    "regulation": "misc",
+    "report": "techreport",
+    "review": "article",
+    "review-book": "article",
+    "software": "misc",
+    "song": "misc",
+    "speech": "misc",
+    "standard": "techreport",
+    "thesis": "phdthesis",
+    "treaty": "misc",
+    "webpage": "misc",
+}
+
+# CSL variables in output order, with their BibTeX field and conversion
+BIBTEX_FIELDS = [
+    ("author", "author", format_names),
+    ("editor", "editor", format_names),
+    ("title", "title", unicode_to_tex),
+    ("container-title", "journal", unicode_to_tex),
+    ("collection-title", "series", unicode_to_tex),
+    ("edition", "edition", format_raw),
+    ("issued", "year", format_year),
+    ("publisher", "publisher", format_raw),
+    ("publisher-place", "address", unicode_to_tex),
+    ("page", "pages", format_pages),
+    ("volume", "volume", format_raw),
+    ("issue", "issue", format_raw),
+    ("number", "number", format_raw),
+    ("ISBN", "isbn", format_raw),
+    ("ISSN", "issn", format_raw),
+    ("DOI", "doi", format_raw),
+    ("URL", "url", format_raw),
+]
+
+# BibTeX fields depending on the entry type, None drops the variable. The
+# series of a book is its collection-title, as Zotero exports it
+BIBTEX_FIELD_OVERRIDES = {
+    "inbook": {"title": "chapter", "container-title": "title"},
+    "incollection": {"container-title": "booktitle"},
+    "inproceedings": {"container-title": "booktitle"},
+    "book": {"container-title": None},
+    "phdthesis": {"publisher": "school"},
+    "techreport": {"publisher": "institution"},
+}
+
+
+def disambiguation_group(reference):
+    """
+    returns the first author and year of a reference. Author-date styles
+    disambiguate references sharing both (e.g. 2010a, 2010b), so their
+    rendering depends on all references of the group.
+    """
+    authors = reference.get("author") or [{}]
+    return (authors[0].get("family", ""), str(reference.get("issued", {}).get("year", "")))
+
+
+# anchors by citation key of a worker process, see BibTexPreprocessor.workers
+_anchors = None
+
+def _init_worker(anchors):
+    global _anchors
+    _anchors = anchors
+
+def _rewrite_cell(source, bibliography):
+    """
+    returns source with the <cite> tags replaced by their anchors, if any,
+    and the bibliography tag by bibliography, if not None
+    """
+    if _anchors is not None:
+        source = CITE_RE.sub(lambda match: _anchors[match.group(1)], source)
+    if bibliography is not None:
+        source = source.replace(BIBLIO_TAG, bibliography)
+    return source
+
+
 class BibTexPreprocessor(Preprocessor):
+
+    citation_style = Unicode('harvard1',
+        help="CSL style used to format citations in HTML output").tag(config=True)
+    citation_locale = Unicode('en-US',
+        help="CSL locale used to format citations in HTML output").tag(config=True)
+    cache_dir = Unicode(default_cache_dir(),
+        help="Directory of the rendered citation cache, an empty string disables the cache").tag(config=True)
+    cache_size = Integer(64*1024*1024,
+        help="Maximum size of the rendered citation cache in bytes").tag(config=True)
+    write_bibfile = Bool(True,
+        help="Write the .bib file for LaTeX output, disable if it is created separately").tag(config=True)
+    workers = Integer(1,
+        help="Number of processes rewriting the markdown cells of a notebook").tag(config=True)
+    reference_store = Unicode('',
+        help="SQLite database of the references of all notebooks of a project, references cited "
+             "but missing from a notebook's metadata are taken from it").tag(config=True)
+    update_store = Bool(True,
+        help="Record the references of the notebook in reference_store, disable if the store "
+             "is updated before the notebooks are converted").tag(config=True)
+    project_bibfile = Unicode('',
+        help="Single .bib file of all references in reference_store, cited by LaTeX output "
+             "instead of a .bib file per notebook").tag(config=True)
+
     def __init__(self, **kw):
         """
         Public constructor
@@ -48,12 +254,20 @@ class BibTexPreprocessor(Preprocessor):
         """
 
         super(BibTexPreprocessor, self).__init__(**kw)
+        get_instrumentation(self.config)
+        if self.project_bibfile and not self.reference_store:
+            raise ValueError("BibTexPreprocessor.project_bibfile requires a reference_store")
+        self.store = None
+
+        # bibtex entries by reference key, together with the hash of the
+        # cite2c data they were created from
+        self.bibentries = {}
 
     def create_bibentry(self, refkey, reference):
         """
         returns a string with a bibtex-entry from cite2c reference data.
-        currently three common reference types are implemented: articles, books and chapter of books.
-        non-ascii characters are only checked for in autor, title and journal name
+        entry types are taken from BIBTEX_TYPES and fields from BIBTEX_FIELDS,
+        non-ascii characters are converted for names, titles and places.
 
         Parameters
         ----------
@@ -62,78 +276,56 @@ class BibTexPreprocessor(Preprocessor):
         reference: dictionary
             Dictonary with cite2c reference data as taken from cite2c JSON metadata
         """
-        if (reference["type"] == "article-journal"):
-            entry  = "@article{" + refkey + ",\n"
-        elif (reference["type"] == "book"):
-            entry  = "@book{" + refkey + ",\n"
-        elif (reference["type"] == "chapter"):
-            entry  = "@inbook{" + refkey + ",\n"
-        else:
+        try:
+            bibtype = BIBTEX_TYPES[reference["type"]]
+        except KeyError:
             # default type is misc!
-            entry  = "@misc{" + refkey + ",\n"
+            bibtype = "misc"
             print("Warning: Unknown type of reference "+refkey)
-
-        if ("author" in reference):
-            entry += "  author = {"
-            entry += " and ".join(map(lambda a: unicode_tex.unicode_to_tex(a["family"]) + ", " + unicode_tex.unicode_to_tex(a["given"]), reference["author"]))
-            entry += "}, \n"
-        else:
+        if not "author" in reference:
             print("Warning: No author(s) of reference " + refkey)
-
-        if ("title" in reference):
-            if reference["type"] == "chapter":
-                entry += "  chapter = {" + unicode_tex.unicode_to_tex(reference["title"]) + "}, \n"
-            else:
-                entry += "  title = {" + unicode_tex.unicode_to_tex(reference["title"]) + "}, \n"
-        else:
+        if not "title" in reference:
             print("Warning: No title of reference " + refkey)
-        if ("container-title" in reference):
-            if reference["type"] == "chapter":
-                entry += "  title = {" + unicode_tex.unicode_to_tex(reference["container-title"]) + "}, \n"
-            else:
-                entry += "  journal = {" + unicode_tex.unicode_to_tex(reference["container-title"]) + "}, \n"
-
-        if ("issued" in reference):
-            entry += "  year = {" + reference["issued"]["year"] + "}, \n"
-        if ("publisher" in reference):
-            entry += "  publisher = {" + reference["publisher"] + "}, \n"
-        if ("page" in reference):
-            entry += "  pages = {" + re.sub("-", "--", reference["page"]) + "}, \n"
-        if ("volume" in reference):
-            entry += "  volume = {" + reference["volume"] + "}, \n"
-        if ("issue" in reference):
-            entry += "  issue = {" + reference["issue"] + "}, \n"
-        if ("DOI" in reference):
-            entry += "  doi = {" + reference["DOI"] + "}, \n"
-        if ("URL" in reference):
-            entry += "  url = {" + reference["URL"] + "}, \n"
-
-        entry += "}\n"
-        entry += "\n"
-        return entry
+
+        overrides = BIBTEX_FIELD_OVERRIDES.get(bibtype, {})
+        entry = ["@" + bibtype + "{" + refkey + ",\n"]
+        for field, bibfield, convert in BIBTEX_FIELDS:
+            bibfield = overrides.get(field, bibfield)
+            if field in reference and bibfield is not None:
+                entry.append("  " + bibfield + " = {" + convert(reference[field]) + "}, \n")
+        entry.append("}\n\n")
+        return "".join(entry)
 
     def create_bibfile(self, resources, filename):
         """
         creates .bib with references from cite2c data in .ipynb JSON metadata
-        references must be places in self.references beforehand
+        references must be places in self.references beforehand.
+        entries are only recreated if their cite2c data changed, and the file
+        is only written if its content changed, so that bibtex runs can be
+        skipped downstream.
 
         Parameters
         ----------
         filename: str
             filename in which the bibtex entries are saved
         """
-        if not os.path.exists(os.path.dirname(filename)):
+        if os.path.dirname(filename) and not os.path.exists(os.path.dirname(filename)):
             os.makedirs(os.path.dirname(filename))
 
-        data = ""
-
+        data = []
         for r in self.references:
-            data += (self.create_bibentry(r, self.references[r]))
-        f = open(filename, "w")
-        f.write(data)
-        f.close()
-
-        resources['outputs'][filename] = data.encode("utf-8")
+            refhash = item_hash(self.references[r])
+            cached = self.bibentries.get(r)
+            if cached is None or cached[0] != refhash:
+                cached = (refhash, self.create_bibentry(r, self.references[r]))
+                self.bibentries[r] = cached
+            data.append(cached[1])
+        data = "".join(data)
+
+        # the writer would rewrite the file from resources['outputs'] anyway,
+        # so an unchanged .bib is not passed on
+        if write_if_changed(filename, data):
+            resources['outputs'][filename] = data.encode("utf-8")
 
     def preprocess(self, nb, resources):
         """
@@ -152,31 +344,150 @@ class BibTexPreprocessor(Preprocessor):
             Additional resources used in the conversion process.  Allows
             preprocessors to pass variables into the Jinja engine.
         """
-        if not "cite2c" in nb["metadata"]:
-            print ("Did not find cite2c metadata")
-            return nb, resources
-        if not "citations" in nb["metadata"]["cite2c"]:
-            print ("Did not find cite2c metadata")
+        with notebook(resources.get("metadata", {}).get("name", "-")):
+            citations = nb["metadata"].get("cite2c", {}).get("citations")
+            if citations is None and not self.reference_store:
+                print ("Did not find cite2c metadata")
+                return nb, resources
+            references = self.collect_references(nb, resources, citations)
+
+            if "html" in resources["output_extension"]:
+                self.prepare_citations(references)
+
+            if "tex" in resources["output_extension"]:
+                # citeproc warns about them for HTML output, bibtex only
+                # when the document is typeset
+                self.warn_missing(nb, references)
+
+            if "tex" in resources["output_extension"] and self.write_bibfile:
+                with stage("cite2c.bibfile"):
+                    if self.project_bibfile:
+                        # written directly, not as an output of this notebook
+                        self.references = self.get_store().all()
+                        self.create_bibfile({"outputs": {}}, self.project_bibfile)
+                    else:
+                        self.references = references
+                        self.create_bibfile(resources, resources["output_files_dir"]+"/"+resources["unique_key"]+".bib")
+
+            with stage("cite2c.cells"):
+                if self.workers > 1:
+                    self.preprocess_parallel(nb, resources)
+                else:
+                    for index, cell in enumerate(nb.cells):
+                        nb.cells[index], resources = self.preprocess_cell(cell, resources, index)
+
+            if "html" in resources["output_extension"] and self.cache is not None:
+                self.cache.evict()
+
             return nb, resources
 
-        if "html" in resources["output_extension"]:
-            newrefs = []
-            for key, value in nb["metadata"]["cite2c"]["citations"].iteritems():
-                temp = value
-                temp["id"] = key
-                newrefs.append(temp)
-            bib_source = citeproc.source.json.CiteProcJSON(newrefs)
-            bib_style = citeproc.CitationStylesStyle('harvard1', validate=False)
-            self.bibliography = citeproc.CitationStylesBibliography(bib_style, bib_source, citeproc.formatter.html)
+    def get_store(self):
+        if self.store is None:
+            from cite2c_store import ReferenceStore
+            self.store = ReferenceStore(self.reference_store)
+        return self.store
 
-        if "tex" in resources["output_extension"]:
-            self.references = nb["metadata"]["cite2c"]["citations"]
-            self.create_bibfile(resources, resources["output_files_dir"]+"/"+resources["unique_key"]+".bib")
+    def collect_references(self, nb, resources, citations):
+        """
+        returns the references of a notebook: its cite2c metadata, completed
+        by the reference store, if any, for cited keys missing from it. The
+        metadata is recorded in the store, unless it is unchanged or
+        update_store is disabled.
+
+        Parameters
+        ----------
+        nb : NotebookNode
+            Notebook being converted
+        resources : dictionary
+            Additional resources used in the conversion process.
+        citations: dictionary
+            cite2c reference data by citation key, None if the notebook has none
+        """
+        if not self.reference_store:
+            return citations
+        store = self.get_store()
+        references = dict(citations or {})
+        if citations is not None and self.update_store:
+            metadata = resources.get("metadata", {})
+            path = os.path.join(metadata.get("path", ""), metadata.get("name", resources.get("unique_key", "")) + ".ipynb")
+            store.update(os.path.abspath(path), citations)
+        cited = set()
+        for cell in nb.cells:
+            if cell.cell_type == "markdown":
+                cited.update(CITE_RE.findall(cell.source))
+        references.update(store.get(sorted(cited.difference(references))))
+        return references
+
+    def warn_missing(self, nb, references):
+        """
+        prints a warning for every key cited in nb but not in references
+        """
+        known = set(key.lower() for key in references)
+        for key in cited_keys([cell.source for cell in nb.cells if cell.cell_type == "markdown"]):
+            if key.lower() not in known:
+                print("WARNING: Reference with key '{}' not found in the bibliography.".format(key))
 
-        for index, cell in enumerate(nb.cells):
-            nb.cells[index], resources = self.preprocess_cell(cell, resources, index)
+    def bibliography_command(self, resources):
+        """
+        returns the LaTeX replacing the bibliography tag
+        """
+        if self.project_bibfile:
+            return "\\bibliography{"+os.path.splitext(self.project_bibfile)[0]+"} \n "
+        return "\\bibliography{"+resources["output_files_dir"]+"/"+resources["unique_key"]+"} \n "
+
+    def prepare_citations(self, references):
+        """
+        sets up HTML citation formatting for the references of a notebook.
+        citeproc itself is only loaded once a citation or bibliography entry
+        is missing from the cache.
 
-        return nb, resources
+        Parameters
+        ----------
+        references: dictionary
+            cite2c reference data by citation key, as taken from cite2c JSON metadata
+        """
+        self.csl_items = []
+        for key, value in references.items():
+            temp = value
+            temp["id"] = key
+            self.csl_items.append(temp)
+        self.bibliography = None
+        # rendered anchor per citation key, so that every key is formatted only once
+        self.citations = {}
+        # (lowercase) citation keys in order of their first appearance
+        self.cited = []
+        self.cache = CitationCache(self.cache_dir, self.cache_size) if self.cache_dir else None
+
+        # cache keys cover style, locale and the CSL data of the reference
+        # itself and of all references it may need to be disambiguated from.
+        # Numeric styles number references in citation order, so citations
+        # are cached by their position as well, and bibliographies by the
+        # keys of all cited references in order
+        hashes = {}
+        groups = {}
+        for item in self.csl_items:
+            hashes[item["id"]] = item_hash(item)
+            groups.setdefault(disambiguation_group(item), []).append(hashes[item["id"]])
+        self.item_keys = {}
+        for item in self.csl_items:
+            group = sorted(groups[disambiguation_group(item)])
+            self.item_keys[item["id"].lower()] = cache_key(self.citation_style, self.citation_locale, hashes[item["id"]], *group)
+
+    def get_bibliography(self):
+        """
+        returns the citeproc bibliography, creating it on first use. Citations
+        that were served from the cache so far are registered in their order
+        of appearance, so citeproc ends up in the same state as without cache.
+        """
+        if self.bibliography is None:
+            with stage("cite2c.citeproc"):
+                load_citeproc()
+                bib_source = citeproc.source.json.CiteProcJSON(self.csl_items)
+                bib_style = get_style(self.citation_style, self.citation_locale)
+                self.bibliography = citeproc.CitationStylesBibliography(bib_style, bib_source, citeproc.formatter.html)
+                for key in self.cited:
+                    self.bibliography.register(citeproc.Citation([citeproc.CitationItem(key)]))
+        return self.bibliography
 
     def preprocess_cell(self, cell, resources, index):
         """
@@ -194,23 +505,113 @@ class BibTexPreprocessor(Preprocessor):
         """
 
         if cell.cell_type == "markdown":
-            replaced = None
+            replaced = cell.source
             if "html" in resources["output_extension"]:
-                replaced = cell.source
-                for citation in re.finditer('<cite data-cite=\\"(.*?)\\"></cite>', cell.source):
-                    tempcite = citeproc.Citation([citeproc.CitationItem(citation.groups()[0])])
-                    self.bibliography.register(tempcite)
-                    replaced = re.sub('<cite data-cite=\\"'+citation.groups()[0]+'\\"></cite>', '<a href="#'+tempcite['cites'][0]["key"]+'">'+str(self.bibliography.cite(tempcite, cite_warn))+'</a>', replaced)
-            if "<div class=\"cite2c-biblio\"></div>" in cell.source:
+                replaced = CITE_RE.sub(self.format_citation, replaced)
+            if BIBLIO_TAG in replaced:
                 if "html" in resources["output_extension"]:
-                    html_bibliography = '<h2 id="bibliography">Bibliography</h2>'
-                    for item, key in zip(self.bibliography.bibliography(), self.bibliography.keys):
-                        html_bibliography += '<p id="'+key+'">'
-                        html_bibliography += str(item)
-                        html_bibliography += '</p>\n'
-                    replaced = re.sub("<div class=\"cite2c-biblio\"></div>", html_bibliography, cell.source)
+                    replaced = replaced.replace(BIBLIO_TAG, self.format_bibliography())
                 elif "tex" in resources["output_extension"]:
-                    replaced = re.sub("<div class=\"cite2c-biblio\"></div>", r"\\bibliography{"+resources["output_files_dir"]+"/"+resources["unique_key"]+r"} \n ", cell.source)
-            if replaced:
-                cell.source = replaced
+                    replaced = replaced.replace(BIBLIO_TAG, self.bibliography_command(resources))
+            cell.source = replaced
         return cell, resources
+
+    def preprocess_parallel(self, nb, resources):
+        """
+        Preprocess the markdown cells in self.workers processes, with the
+        same result as preprocess_cell on every cell.
+
+        citeproc renders citations depending on the ones registered before,
+        so the citation keys and bibliography positions are collected and
+        formatted in cell order in this process, a single regular expression
+        scan per cell. The workers then rewrite the cells with the resulting
+        anchors, and the cells are updated in their original order.
+
+        Parameters
+        ----------
+        nb : NotebookNode
+            Notebook being converted
+        resources : dictionary
+            Additional resources used in the conversion process.
+        """
+        html = "html" in resources["output_extension"]
+        cells = [cell for cell in nb.cells if cell.cell_type == "markdown"]
+        bibliographies = []
+        for cell in cells:
+            if html:
+                for key in CITE_RE.findall(cell.source):
+                    self.format_key(key)
+            bibliography = None
+            if BIBLIO_TAG in cell.source:
+                if html:
+                    bibliography = self.format_bibliography()
+                elif "tex" in resources["output_extension"]:
+                    bibliography = self.bibliography_command(resources)
+            bibliographies.append(bibliography)
+        sources = map_cells(_rewrite_cell, list(zip([cell.source for cell in cells], bibliographies)),
+                            self.workers, _init_worker, (self.citations if html else None,))
+        for cell, source in zip(cells, sources):
+            cell.source = source
+
+    def format_citation(self, match):
+        """
+        returns the HTML anchor replacing a single <cite> tag
+
+        Parameters
+        ----------
+        match: re.MatchObject
+            match of CITE_RE, the first group holds the citation key
+        """
+        return self.format_key(match.group(1))
+
+    def format_key(self, key):
+        """
+        returns the HTML anchor of a citation key. Citations are registered
+        with the bibliography in order of their first appearance, and each
+        distinct key is formatted only once per notebook.
+
+        Parameters
+        ----------
+        key: str
+            citation key as given in the <cite> tag
+        """
+        try:
+            return self.citations[key]
+        except KeyError:
+            pass
+        item_key = self.item_keys.get(key.lower())
+        if item_key is not None:
+            item_key = cache_key(item_key, "citation", str(len(self.cited)))
+        anchor = None
+        if self.cache is not None and item_key is not None:
+            anchor = self.cache.get(item_key)
+        if anchor is None:
+            bibliography = self.get_bibliography()
+            with stage("cite2c.citeproc"):
+                tempcite = citeproc.Citation([citeproc.CitationItem(key)])
+                bibliography.register(tempcite)
+                anchor = '<a href="#'+tempcite['cites'][0]["key"]+'">'+str(bibliography.cite(tempcite, cite_warn))+'</a>'
+            if self.cache is not None and item_key is not None:
+                self.cache.set(item_key, anchor)
+        elif self.bibliography is not None:
+            self.bibliography.register(citeproc.Citation([citeproc.CitationItem(key)]))
+        self.cited.append(key.lower())
+        self.citations[key] = anchor
+        return anchor
+
+    def format_bibliography(self):
+        """
+        returns the HTML bibliography of all citations registered so far
+        """
+        # keys missing from the references are part of the cache key, as
+        # they are registered with the bibliography as well
+        bibliography_key = cache_key("bibliography", *[self.item_keys.get(key, key) for key in self.cited])
+        entries = self.cache.get(bibliography_key) if self.cache is not None else None
+        if entries is None:
+            bibliography = self.get_bibliography()
+            with stage("cite2c.citeproc"):
+                entries = ''.join('<p id="'+key+'">'+str(item)+'</p>\n'
+                                  for item, key in zip(bibliography.bibliography(), bibliography.keys))
+            if self.cache is not None:
+                self.cache.set(bibliography_key, entries)
+        return '<h2 id="bibliography">Bibliography</h2>' + entries
@@ -0,0 +1,401 @@
+# -*- coding: utf-8 -*-
+
+"""This preprocessor writes the figures of the code cell outputs to a
+content-addressed store for LaTeX output, instead of nbconvert's
+ExtractOutputPreprocessor. A figure is named after the hash of its data, so
+identical figures are written once, and figures that exist from a previous
+conversion are not decoded or written again. The base64 data is decoded in
+chunks straight to the file, figures spilled by the streaming notebook reader
+(nbstream) are decoded from their spill files without being loaded. SVG
+figures without another format LaTeX can draw are converted to PDF in the
+store, with the command of nbconvert's SVG2PDFPreprocessor (Inkscape).
+
+Disable the ExtractOutputPreprocessor and the SVG2PDFPreprocessor when
+using it:
+
+    c.Exporter.preprocessors = ['pre_figures.FigureStorePreprocessor']
+    c.ExtractOutputPreprocessor.enabled = False
+    c.SVG2PDFPreprocessor.enabled = False
+
+The FigureOptimizePreprocessor, run after it, downsamples the stored PNG
+figures to the resolution they are printed at and stores photographs as
+JPEG, if Pillow is installed.
+"""
+
+#-----------------------------------------------------------------------------
+# Imports
+#-----------------------------------------------------------------------------
+from __future__ import (absolute_import, division, print_function, unicode_literals)
+
+from nbconvert.preprocessors import *
+from traitlets import List, Unicode, Bool, Integer, Float
+import os
+import io
+import shutil
+import importlib.util
+import binascii
+import hashlib
+from collections import OrderedDict
+
+from cite2c_cache import cache_key
+from cellpool import map_cells
+from nbstream import SPILLED
+from instrumented import get_instrumentation, stage, notebook
+from publicationextensions.atomicfile import atomic_file
+
+# file extension by mime type, the figures the templates draw
+EXTENSIONS = {
+    "image/png": ".png",
+    "image/jpeg": ".jpg",
+    "image/svg+xml": ".svg",
+    "application/pdf": ".pdf",
+}
+
+# mime types stored as base64 in the notebook, the others are text
+BINARY = ("image/png", "image/jpeg", "application/pdf")
+
+# mime types LaTeX draws, an SVG figure is only converted without them
+DRAWABLE = ("application/pdf", "image/png", "image/jpeg")
+
+# characters of base64 data decoded at once, a multiple of 4
+CHUNK = 1 << 18
+
+#-----------------------------------------------------------------------------
+# Functions
+#-----------------------------------------------------------------------------
+def chunks(data):
+    for i in range(0, len(data), CHUNK):
+        yield data[i:i + CHUNK]
+
+
+def data_hash(data):
+    """
+    returns the hash of the data of an output as stored in the notebook, for
+    base64 data the hash of the encoded data so that it need not be decoded
+    """
+    h = hashlib.sha1()
+    for chunk in chunks(data):
+        h.update(chunk.encode("utf-8"))
+    return h.hexdigest()
+
+
+def file_chunks(filename, binary):
+    """
+    yields the output data in the spill file filename in chunks, base64 data
+    without line breaks and in groups of 4 characters
+    """
+    rest = ""
+    with io.open(filename, encoding="utf-8") as f:
+        for chunk in iter(lambda: f.read(CHUNK), ""):
+            if binary:
+                chunk = rest + "".join(chunk.split())
+                end = len(chunk) - len(chunk) % 4
+                chunk, rest = chunk[:end], chunk[end:]
+            yield chunk
+    if rest:
+        yield rest
+
+
+def write_figure(parts, filename, binary):
+    """
+    writes the data of an output, given in parts, to filename, decoding
+    base64 data chunk by chunk. The file is replaced atomically, concurrent
+    conversions writing the same figure do not see partial files.
+    """
+    with atomic_file(filename, "wb") as f:
+        for chunk in parts:
+            f.write(binascii.a2b_base64(chunk) if binary else chunk.encode("utf-8"))
+
+
+def store_figure(data, directory, mime_type):
+    """
+    returns the file of the output data of mime_type in directory, writing
+    it if it does not exist
+    """
+    binary = mime_type in BINARY
+    filename = os.path.join(directory, data_hash(data)[:20] + EXTENSIONS[mime_type])
+    if not os.path.exists(filename):
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        if binary:
+            # line breaks would shift the chunks off the 4 character groups
+            data = "".join(data.split())
+        write_figure(chunks(data), filename, binary)
+    return filename
+
+
+def store_pdf(svg, converter):
+    """
+    returns the PDF file converted from the stored SVG figure svg by
+    converter, an SVG2PDFPreprocessor, next to it and named like it
+    """
+    filename = os.path.splitext(svg)[0] + EXTENSIONS["application/pdf"]
+    if not os.path.exists(filename):
+        with io.open(svg, encoding="utf-8") as f:
+            data = converter.convert_figure("image/svg+xml", f.read())
+        write_figure(chunks("".join(data.split())), filename, True)
+    return filename
+
+
+def file_hash(filename):
+    h = hashlib.sha1()
+    with open(filename, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 16), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def store_spilled_figure(spilled, directory, mime_type):
+    """
+    like store_figure for the output data in the spill file spilled, the
+    figure gets the same name as if the data was in the notebook
+    """
+    binary = mime_type in BINARY
+    filename = os.path.join(directory, file_hash(spilled)[:20] + EXTENSIONS[mime_type])
+    if not os.path.exists(filename):
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        write_figure(file_chunks(spilled, binary), filename, binary)
+    return filename
+
+
+def optimize_figure(filename, width, dpi, quality, photos, directory):
+    """
+    returns the file of the PNG figure filename scaled down to at most
+    width inches at dpi, and as JPEG of the given quality if photos is set
+    and it has many colors and no transparency. Results are stored in
+    directory, named after the input and the settings, and looked up
+    there before any work is done. JPEG figures are returned as they are,
+    encoding them again would only lose quality.
+    """
+    directory = directory or os.path.dirname(filename)
+    key = cache_key(file_hash(filename), str(width), str(dpi), str(quality), str(photos))[:20]
+    for extension in (".png", ".jpg"):
+        optimized = os.path.join(directory, key + extension)
+        if os.path.exists(optimized):
+            return optimized
+
+    from PIL import Image
+    image = Image.open(filename)
+    if image.format == "JPEG":
+        return filename
+    image.load()
+    pixels = int(width * dpi)
+    resized = image.width > pixels
+    if resized:
+        image = image.resize((pixels, max(1, int(round(image.height * pixels / float(image.width))))),
+                             Image.LANCZOS)
+
+    if (photos and image.mode in ("RGB", "L") and image.getcolors(256) is None):
+        extension, options = ".jpg", dict(format="JPEG", quality=quality, optimize=True, dpi=(dpi, dpi))
+    else:
+        extension, options = ".png", dict(format="PNG", optimize=True, dpi=(dpi, dpi))
+    optimized = os.path.join(directory, key + extension)
+    with atomic_file(optimized, "wb") as f:
+        image.save(f, **options)
+        if not resized and f.tell() >= os.path.getsize(filename) \
+                and os.path.splitext(filename)[1] == extension:
+            # recompressing did not help, keep the original data
+            f.seek(0)
+            f.truncate()
+            with open(filename, "rb") as original:
+                shutil.copyfileobj(original, f)
+    return optimized
+
+#-----------------------------------------------------------------------------
+# Classes
+#-----------------------------------------------------------------------------
+class FigureStorePreprocessor(Preprocessor):
+
+    mime_types = List(Unicode(), default_value=list(EXTENSIONS),
+        help="Mime types of the outputs written to the figure store").tag(config=True)
+    figure_dir = Unicode("",
+        help="Directory of the figure store, relative to the output directory. Shared by all "
+             "notebooks if set, by default the output files directory of the notebook").tag(config=True)
+    drop_data = Bool(True,
+        help="Remove the stored data from the outputs, the LaTeX templates only use the file "
+             "names and the data would be copied along with the notebook").tag(config=True)
+    svg_to_pdf = Bool(True,
+        help="Convert SVG figures to PDF, which LaTeX can draw, with the command of the "
+             "SVG2PDFPreprocessor").tag(config=True)
+
+    def __init__(self, **kw):
+        """
+        Public constructor
+
+        Parameters
+        ----------
+        config : Config
+            Configuration file structure
+        `**kw`
+            Additional keyword arguments passed to parent
+        """
+        super(FigureStorePreprocessor, self).__init__(**kw)
+        get_instrumentation(self.config)
+        self.converter = None
+
+    def preprocess(self, nb, resources):
+        """
+        Preprocessing to apply on each notebook.
+
+        Must return modified nb, resources.
+
+        Parameters
+        ----------
+        nb : NotebookNode
+            Notebook being converted
+        resources : dictionary
+            Additional resources used in the conversion process.  Allows
+            preprocessors to pass variables into the Jinja engine.
+        """
+        if "tex" in resources["output_extension"]:
+            with notebook(resources.get("metadata", {}).get("name", "-")), stage("figures.store"):
+                for index, cell in enumerate(nb.cells):
+                    nb.cells[index], resources = self.preprocess_cell(cell, resources, index)
+        return nb, resources
+
+    def preprocess_cell(self, cell, resources, index):
+        """
+        Preprocess cell
+
+        Parameters
+        ----------
+        cell : NotebookNode cell
+            Notebook cell being processed
+        resources : dictionary
+            Additional resources used in the conversion process.  Allows
+            preprocessors to pass variables into the Jinja engine.
+        cell_index : int
+            Index of the cell being processed (see base.py)
+        """
+        if cell.cell_type != "code":
+            return cell, resources
+        directory = self.figure_dir or resources.get("output_files_dir") or ""
+        for output in cell.outputs:
+            if not "data" in output:
+                continue
+            spilled = output.get("metadata", {}).get(SPILLED, {})
+            for mime_type in self.mime_types:
+                data = output.data.get(mime_type)
+                if mime_type in spilled:
+                    filename = store_spilled_figure(spilled[mime_type], directory, mime_type)
+                    if self.drop_data:
+                        del spilled[mime_type]
+                elif data:
+                    if isinstance(data, list):
+                        data = "".join(data)
+                    filename = store_figure(data, directory, mime_type)
+                    if self.drop_data:
+                        output.data[mime_type] = ""
+                else:
+                    continue
+                output.metadata.setdefault("filenames", {})[mime_type] = filename.replace(os.sep, "/")
+            if SPILLED in output.get("metadata", {}) and not spilled:
+                del output.metadata[SPILLED]
+            filenames = output.get("metadata", {}).get("filenames", {})
+            if self.svg_to_pdf and "image/svg+xml" in filenames \
+                    and not any(mime_type in output.data for mime_type in DRAWABLE):
+                self.convert_svg(output, filenames)
+        return cell, resources
+
+    def convert_svg(self, output, filenames):
+        """
+        adds the PDF converted from the stored SVG figure of output, the
+        LaTeX templates prefer it. Its data is left empty, so that an
+        SVG2PDFPreprocessor that is not disabled skips the output.
+        """
+        if self.converter is None:
+            self.converter = SVG2PDFPreprocessor(parent=self)
+        with stage("figures.svg2pdf"):
+            try:
+                filename = store_pdf(filenames["image/svg+xml"], self.converter)
+            except (OSError, RuntimeError, TypeError) as e:
+                print("Warning: could not convert {} to PDF: {}".format(filenames["image/svg+xml"], e))
+                return
+        output.data["application/pdf"] = ""
+        filenames["application/pdf"] = filename.replace(os.sep, "/")
+
+
+class FigureOptimizePreprocessor(Preprocessor):
+    """ Downsamples the raster figures written by the FigureStorePreprocessor
+        to the resolution they are printed at, a column or, for cells with
+        widefigure metadata, the text width, and stores photographs as JPEG.
+        Requires Pillow, without it the figures are left as they are.
+        """
+    dpi = Integer(300,
+        help="Resolution of the optimized figures in dots per inch").tag(config=True)
+    column_width = Float(3.5,
+        help="Width of a figure in inches").tag(config=True)
+    wide_width = Float(7.2,
+        help="Width of a figure with widefigure metadata in inches").tag(config=True)
+    photos_to_jpeg = Bool(True,
+        help="Store figures with many colors and no transparency as JPEG").tag(config=True)
+    jpeg_quality = Integer(90,
+        help="Quality of the JPEG figures, 1 to 95").tag(config=True)
+    optimized_dir = Unicode("",
+        help="Directory of the optimized figures, by default the directory of each figure").tag(config=True)
+    workers = Integer(1,
+        help="Number of processes optimizing the figures of a notebook").tag(config=True)
+
+    def __init__(self, **kw):
+        """
+        Public constructor
+
+        Parameters
+        ----------
+        config : Config
+            Configuration file structure
+        `**kw`
+            Additional keyword arguments passed to parent
+        """
+        super(FigureOptimizePreprocessor, self).__init__(**kw)
+        get_instrumentation(self.config)
+        self.warned = False
+
+    def preprocess(self, nb, resources):
+        """
+        Preprocessing to apply on each notebook.
+
+        Must return modified nb, resources.
+
+        Parameters
+        ----------
+        nb : NotebookNode
+            Notebook being converted
+        resources : dictionary
+            Additional resources used in the conversion process.  Allows
+            preprocessors to pass variables into the Jinja engine.
+        """
+        if not "tex" in resources["output_extension"]:
+            return nb, resources
+        if importlib.util.find_spec("PIL") is None:
+            if not self.warned:
+                print("Warning: Pillow is not installed, figures are not optimized")
+                self.warned = True
+            return nb, resources
+
+        with notebook(resources.get("metadata", {}).get("name", "-")), stage("figures.optimize"):
+            # (output, arguments of optimize_figure) of the PNG figures
+            figures = []
+            for cell in nb.cells:
+                if cell.cell_type != "code":
+                    continue
+                width = self.wide_width if cell.metadata.get("widefigure") else self.column_width
+                for output in cell.outputs:
+                    filename = output.get("metadata", {}).get("filenames", {}).get("image/png")
+                    if filename and os.path.exists(filename):
+                        figures.append((output, (filename, width, self.dpi, self.jpeg_quality,
+                                                 self.photos_to_jpeg, self.optimized_dir)))
+            args = list(OrderedDict.fromkeys(a for _, a in figures))
+            optimized = dict(zip(args, map_cells(optimize_figure, args, self.workers)))
+            for output, a in figures:
+                filename = optimized[a].replace(os.sep, "/")
+                filenames = output.metadata.filenames
+                if os.path.splitext(filename)[1] == EXTENSIONS["image/jpeg"]:
+                    # a photograph stored as JPEG is drawn as one
+                    del filenames["image/png"], output.data["image/png"]
+                    output.data["image/jpeg"] = ""
+                    filenames["image/jpeg"] = filename
+                else:
+                    filenames["image/png"] = filename
+        return nb, resources
@@ -1,7 +1,9 @@
 # -*- coding: utf-8 -*-
 
-"""This preprocessor replaces HTML colors with latex colors in markdowncell
-(this might be extended to more nice things...)
+"""This preprocessor replaces HTML markup in markdowncells with LaTeX: colors,
+bold/italic/underlined text, super- and subscripts and images. Code spans
+and fenced code blocks are left as they are, HTML entities are left to
+pandoc. Further rules can be added with register_rule.
 """
 
 #-----------------------------------------------------------------------------
@@ -9,13 +11,116 @@
 #-----------------------------------------------------------------------------
 
 from nbconvert.preprocessors import *
+from traitlets import List, Unicode, Integer
 import re
+from collections import OrderedDict
+
+from cellpool import map_cells
+from instrumented import get_instrumentation, stage, notebook
+
+#-----------------------------------------------------------------------------
+# Rules
+#-----------------------------------------------------------------------------
+
+# name -> (pattern, replace), replace is called with the preprocessor and
+# the groups of pattern and returns the replacement text
+RULES = OrderedDict()
+
+def register_rule(name, pattern):
+    """
+    decorator registering a markdown rule. All enabled rules are merged into
+    a single regular expression, so pattern must not use backreferences.
+    Rules wrapping text should pass it through preprocessor.transform, so
+    that nested markup is replaced as well. A cell is scanned again as long
+    as rules change it, so a replacement must not be matched by a rule
+    again, unless it is returned unchanged.
+    """
+    def register(replace):
+        RULES[name] = (pattern, replace)
+        return replace
+    return register
+
+
+def element_pattern(tags, attributes=""):
+    """
+    returns the pattern of an HTML element with one of tags (an alternation)
+    and the given attribute pattern, its content is the last group. The
+    content ends at the first end tag and cannot hold another start tag of
+    the same tags, so that nested elements of the same kind are matched from
+    the innermost one.
+    """
+    other = r"<(?!(?:" + tags + r")[\s>]|/(?:" + tags + ")>)"
+    return "<(?:" + tags + ")" + attributes + ">([^<]*(?:" + other + "[^<]*)*)</(?:" + tags + ")>"
+
+
+@register_rule("color", element_pattern("font", r"""\s+color=["']?([^"'>]*)["']?"""))
+def color_rule(preprocessor, color, text):
+    return "\\textcolor{" + color + "}{" + preprocessor.transform(text) + "}"
+
+@register_rule("bold", element_pattern("b|strong"))
+def bold_rule(preprocessor, text):
+    return "\\textbf{" + preprocessor.transform(text) + "}"
+
+@register_rule("italic", element_pattern("i|em"))
+def italic_rule(preprocessor, text):
+    return "\\textit{" + preprocessor.transform(text) + "}"
+
+@register_rule("underline", element_pattern("u"))
+def underline_rule(preprocessor, text):
+    return "\\underline{" + preprocessor.transform(text) + "}"
+
+@register_rule("superscript", element_pattern("sup"))
+def superscript_rule(preprocessor, text):
+    return "\\textsuperscript{" + preprocessor.transform(text) + "}"
+
+@register_rule("subscript", element_pattern("sub"))
+def subscript_rule(preprocessor, text):
+    return "\\textsubscript{" + preprocessor.transform(text) + "}"
+
+# fenced code blocks and code spans, which are passed through unchanged.
+# The opening fence or backtick string is closed by one of the same length,
+# an unclosed fence extends to the end of the cell
+CODE_RE = re.compile(r"(?:\A|(?<=\n))[ \t]{0,3}(?P<fence>`{3,}(?![^\n]*`)|~{3,})"
+                     r"(?:.*?\n[ \t]{0,3}(?P=fence)[`~]*[ \t]*(?=\n|\Z)|.*\Z)"
+                     r"|(?<!`)(?P<ticks>`+)(?!`).+?(?<!`)(?P=ticks)(?!`)", re.DOTALL)
+
+# code is replaced by numbered placeholders while the rules are applied
+PLACEHOLDER_RE = re.compile("\0([0-9]+)\0")
+
+IMG_ATTR_RE = re.compile(r"""(src|alt)=["']([^"']*)["']""")
+
+@register_rule("image", r"<img\s([^>]*?)/?>")
+def image_rule(preprocessor, attributes):
+    # inline images become markdown images, converted by pandoc with the cell
+    attrs = dict(IMG_ATTR_RE.findall(attributes))
+    if not "src" in attrs:
+        return "<img " + attributes + ">"
+    return "![" + attrs.get("alt", "") + "](" + attrs["src"] + ")"
+
+# preprocessor of a worker process, see MarkdownPreprocessor.workers
+_worker = None
+
+def _init_worker(rules):
+    global _worker
+    _worker = MarkdownPreprocessor(rules=rules)
+
+def _transform(source):
+    return _worker.transform(source)
 
 #-----------------------------------------------------------------------------
 # Classes
 #-----------------------------------------------------------------------------
 
 class MarkdownPreprocessor(Preprocessor):
+
+    rules = List(Unicode(), default_value=list(RULES),
+        help="Names of the markdown rules to apply, see pre_markdown.RULES").tag(config=True)
+    cache_size = Integer(10000,
+        help="Number of converted markdown cells kept, so that repeated cells are converted once").tag(config=True)
+    workers = Integer(1,
+        help="Number of processes converting the markdown cells of a notebook, rules "
+             "registered at runtime are only available to them on fork-based platforms").tag(config=True)
+
     def __init__(self, **kw):
         """
         Public constructor
@@ -28,9 +133,73 @@ class MarkdownPreprocessor(Preprocessor):
             Additional keyword arguments passed to parent
         """
 
-        self.colormatch = re.compile(r"<font color='(.*?)'>(.*?)</font>", re.DOTALL)
-
         super(MarkdownPreprocessor, self).__init__(**kw)
+        get_instrumentation(self.config)
+
+        # all rules are merged into one alternation, the outer group of each
+        # rule is the last group closed when it matches (match.lastindex)
+        patterns = []
+        self.replacements = {}
+        index = 1
+        for name in self.rules:
+            pattern, replace = RULES[name]
+            patterns.append("(" + pattern + ")")
+            ngroups = re.compile(pattern).groups
+            self.replacements[index] = (replace, index + 1, index + 1 + ngroups)
+            index += 1 + ngroups
+        self.rulematch = re.compile("|".join(patterns), re.DOTALL)
+        # number of replacements of the current scan, see transform
+        self.replaced = 0
+        # converted markdown by cell source, least recently used first
+        self.cache = OrderedDict()
+
+    def replace(self, match):
+        replace, first, last = self.replacements[match.lastindex]
+        text = replace(self, *match.groups()[first - 1:last - 1])
+        if text != match.group(0):
+            self.replaced += 1
+        return text
+
+    def remember(self, source, replaced):
+        self.cache[source] = replaced
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+
+    def transform(self, source):
+        """
+        returns source with all rules applied outside of code. All rules are
+        applied in a single scan, which is repeated while it replaces
+        anything, as elements nested in one of the same kind are replaced
+        one level per scan.
+        """
+        try:
+            replaced = self.cache.pop(source)
+        except KeyError:
+            pass
+        else:
+            self.cache[source] = replaced
+            return replaced
+        code = []
+        if "`" in source or "~" in source:
+            def hide(match):
+                code.append(match.group(0))
+                return "\0" + str(len(code) - 1) + "\0"
+            replaced = CODE_RE.sub(hide, source)
+        else:
+            replaced = source
+
+        outer, self.replaced = self.replaced, 0
+        replaced = self.rulematch.sub(self.replace, replaced)
+        # only elements nested in one of the same kind are left over
+        while self.replaced and "<" in replaced:
+            self.replaced = 0
+            replaced = self.rulematch.sub(self.replace, replaced)
+        self.replaced = outer
+
+        if code:
+            replaced = PLACEHOLDER_RE.sub(lambda match: code[int(match.group(1))], replaced)
+        self.remember(source, replaced)
+        return replaced
 
     def preprocess(self, nb, resources):
         """
@@ -50,10 +219,29 @@ class MarkdownPreprocessor(Preprocessor):
             preprocessors to pass variables into the Jinja engine.
         """
         if "tex" in resources["output_extension"]:
-            for index, cell in enumerate(nb.cells):
-                nb.cells[index], resources = self.preprocess_cell(cell, resources, index)
+            with notebook(resources.get("metadata", {}).get("name", "-")), stage("markdown.cells"):
+                converted = self.transform_parallel(nb.cells) if self.workers > 1 else {}
+                for index, cell in enumerate(nb.cells):
+                    if cell.cell_type == "markdown" and cell.source in converted:
+                        cell.source = converted[cell.source]
+                    else:
+                        nb.cells[index], resources = self.preprocess_cell(cell, resources, index)
         return nb, resources
 
+    def transform_parallel(self, cells):
+        """
+        converts the distinct markdown sources of cells not converted before
+        in self.workers processes, adds them to the cache and returns them
+        by source
+        """
+        sources = list(OrderedDict.fromkeys(cell.source for cell in cells
+                       if cell.cell_type == "markdown" and not cell.source in self.cache))
+        replaced = map_cells(_transform, [(source,) for source in sources], self.workers,
+                             _init_worker, (list(self.rules),))
+        for source, text in zip(sources, replaced):
+            self.remember(source, text)
+        return dict(zip(sources, replaced))
+
     def preprocess_cell(self, cell, resources, index):
         """
         Preprocess cell
@@ -69,5 +257,5 @@ class MarkdownPreprocessor(Preprocessor):
             Index of the cell being processed (see base.py)
         """
         if cell.cell_type == "markdown":
-            cell.source = self.colormatch.sub(r"\\textcolor{\1}{\2}", cell.source)
+            cell.source = self.transform(cell.source)
         return cell, resources
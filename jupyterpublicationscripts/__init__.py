@@ -2,29 +2,17 @@ from __future__ import print_function
 
 import sys
 import os
-import json
-import io
 
 import logging
-from .compat import JUPYTER
+# jconfig, activate and deactivate were defined here before config.py
+from .config import jconfig, activate, deactivate, provision
+
+__all__ = ['jconfig', 'activate', 'deactivate', 'provision', 'install', 'main']
 
 log = logging.getLogger(__name__)
 log.setLevel(20)
 
 
-if JUPYTER:
-    import notebook.nbextensions as nbe
-    from IPython.paths import locate_profile
-    from IPython.utils.py3compat import cast_unicode_py2
-    from jupyter_core.paths import jupyter_config_dir
-    from traitlets.config import Config, JSONFileConfigLoader, ConfigFileNotFound
-else :
-    import IPython.html.nbextensions as nbe
-    from IPython.utils.path import locate_profile
-    from IPython.utils.py3compat import cast_unicode_py2
-    from IPython.config import Config, JSONFileConfigLoader, ConfigFileNotFound
-
-
 def install(profile='default', symlink=True, user=False,
             prefix=None, verbose=False, path=None):
 
@@ -47,89 +35,22 @@ def install(profile='default', symlink=True, user=False,
 
     activate(profile)
 
-class jconfig(object):
-
-    def __init__(self, profile):
-        """
-        A context manager that simply expose the configuration values.
-
-        Mutate the value of the configuration while in the context manager,
-        and it will be written to disk on exit.
-        """
-        self.profile = profile
-
-    def __enter__(self):
-        if JUPYTER:
-            self.pdir = jupyter_config_dir()
-            self.cff_name = 'jupyter_nbconvert_config.json'
-        else:
-            self.pdir = locate_profile(self.profile)
-            self.cff_name = 'ipython_nbconvert_config.json'
-
-        jc = JSONFileConfigLoader(self.cff_name, self.pdir)
-
-        try:
-            self.config = jc.load_config();
-        except (ConfigFileNotFound,ValueError):
-            self.config = Config()
-        return self.config
-
-
-    def __exit__( self, type, value, tb ):
-        self.config['format'] = 1
-        # option to cleanup empty dicts
-        if not os.path.exists(self.pdir):
-            os.mkdir(self.pdir)
-        with io.open(os.path.join(self.pdir,self.cff_name),'w', encoding='utf-8') as f:
-            f.write(cast_unicode_py2(json.dumps(self.config, indent=2, default=lambda _:{})))
-
-
-def activate(profile='default'):
-    if not profile:
-        raise ValueError('Profile cannot be NoneType')
-
-    return _activate(profile)
-
-def _activate(profile):
-    dname = os.path.dirname(__file__)
-
-    with jconfig(profile) as config:
-        if "Exporter" in config:
-            if (config["Exporter"].get("preprocessors",{})):
-                # manually merge setting if exist
-                if not 'pre_markdown.MarkdownPreprocessor' in config.Exporter.preprocessors:
-                    config['Exporter']['preprocessors'].append('pre_markdown.MarkdownPreprocessor')
-                if not 'pre_cit2c.BibTexPreprocessor' in config.Exporter.preprocessors:
-                    config['Exporter']['preprocessors'].append('pre_cite2c.BibTexPreprocessor')
-            else:
-                my_config  = JSONFileConfigLoader('jupyter_nbconvert_config.json', dname).load_config()
-                config.merge(my_config)
-
-        if not JUPYTER:
-            log.info('Activating preprocessors for profile "%s"' % profile)
-        else:
-            log.info('Activating preprocessors')
-
-
-def deactivate(profile='default'):
-    """should be a matter of just unsetting the above keys
-    """
-    with jconfig(profile) as config:
-        deact = True;
-        if not 'preprocessors' in config.Exporter:
-            deact=False
-        if deact:
-            if 'pre_markdown.MarkdownPreprocessor' in config.Exporter.preprocessors:
-                del config.Exporter.preprocessors[config.Exporter.preprocessors.index('pre_markdown.MarkdownPreprocessor')]
-            if 'pre_cite2c.BibTexPreprocessor' in config.Exporter.preprocessors:
-                del config.Exporter.preprocessors[config.Exporter.preprocessors.index('pre_cite2c.BibTexPreprocessor')]
+# commands with their own module and argument parser
+SUBCOMMANDS = ('build', 'typeset', 'watch', 'check', 'precompile', 'assemble', 'daemon')
 
 def main(argv=None):
+    if argv is None:
+        argv = sys.argv[1:]
+    if argv and argv[0] in SUBCOMMANDS:
+        import importlib
+        command = importlib.import_module('.' + argv[0], __name__)
+        sys.exit(command.main(argv[1:]))
+
     import argparse
     prog = '{} -m jupyter-publication-scripts'.format(os.path.basename(sys.executable))
     parser = argparse.ArgumentParser(prog=prog,
                     description='Install jupyter-publication-scripts.')
-    parser.add_argument('profile', nargs='?', default='default', metavar=('<profile_name>'), help='profile name in which to install google drive integration for IPython 3.x')
+    parser.add_argument('profile', nargs='*', default=['default'], metavar=('<profile_name>'), help='profile names in which to install google drive integration for IPython 3.x')
 
     parser.add_argument("-S", "--no-symlink", help="do not symlink at install time",
                     action="store_false", dest='symlink', default=True)
@@ -142,15 +63,37 @@ def main(argv=None):
     parser.add_argument("-v", "--verbose", help="increase verbosity",
                     action='store_true')
     parser.add_argument("--deactivate", help='deactivate', action='store_true')
+    parser.add_argument("--config-dir", help="configuration directory to (de)activate the preprocessors in, "
+                    "instead of the one of Jupyter, can be given several times",
+                    action='append', default=[], dest='config_dirs')
+    parser.add_argument("--config-dir-list", help="file listing configuration directories, one per line, - for stdin",
+                    default=None)
     args = parser.parse_args(argv)
 
-    if args.deactivate:
-        deactivate()
+    config_dirs = list(args.config_dirs)
+    if args.config_dir_list:
+        if args.config_dir_list == '-':
+            lines = sys.stdin.read().splitlines()
+        else:
+            with open(args.config_dir_list) as f:
+                lines = f.read().splitlines()
+        config_dirs += [line.strip() for line in lines if line.strip() and not line.startswith('#')]
+
+    if args.deactivate or config_dirs or len(args.profile) > 1:
+        results = provision(config_dirs, args.profile, active=not args.deactivate)
+        failed = [r for r in results if r[2]]
+        for filename, changed, error in results:
+            if args.verbose and not error:
+                print('{}: {}'.format(filename, 'changed' if changed else 'unchanged'))
+        print('{} the preprocessors in {} configurations: {} changed, {} failed'.format(
+            'Deactivated' if args.deactivate else 'Activated', len(results),
+            sum(1 for r in results if r[1]), len(failed)))
+        sys.exit(1 if failed else 0)
     else:
         install(   path=args.path,
                    user=args.user,
                  prefix=args.prefix,
-                profile=args.profile,
+                profile=args.profile[0],
                 symlink=args.symlink,
                 verbose=args.verbose
                 )
@@ -0,0 +1,284 @@
+"""Assembly of a long document from many notebooks
+
+The notebooks of e.g. a thesis are converted to LaTeX in parallel and
+incrementally by build. The body of every converted notebook becomes a
+chapter file, included with \\include by a main document that takes its
+preamble from the first chapter and cites a single bibliography merged from
+the references of all notebooks. Chapter files are only rewritten if their
+content changed, and with --draft the main document typesets only those
+(\\includeonly), LaTeX takes references and page numbers of the other
+chapters from their .aux files.
+"""
+from __future__ import print_function
+
+import os
+import io
+import re
+import sys
+import time
+import logging
+
+from .build import build, find_notebooks, load_config, setup_extensions, summary, DEFAULT_TEMPLATES
+from .typeset import typeset, TypesetError
+from publicationextensions.atomicfile import write_if_changed
+
+log = logging.getLogger(__name__)
+log.setLevel(20)
+
+# chapter files, below the output directory
+CHAPTERS_DIR = 'chapters'
+
+# document classes with \chapter
+CHAPTER_CLASSES = ('report', 'book', 'scrreprt', 'scrbook', 'memoir')
+
+BEGIN_DOCUMENT = '\\begin{document}'
+END_DOCUMENT = '\\end{document}'
+DOCUMENTCLASS_RE = re.compile(r'\\documentclass(\[[^\]]*\])?\{[^}]*\}')
+BIBSTYLE_RE = re.compile(r'\\bibliographystyle\{([^}]*)\}')
+
+# lines of a converted notebook that are replaced by the main document:
+# the title and the bibliography of the notebook
+MAIN_LINES_RE = re.compile(r'^[ \t]*\\(maketitle|title|author|date|bibliographystyle|bibliography)\b.*\n?',
+                           re.MULTILINE)
+
+
+def read_list(filename):
+    """
+    returns the notebooks listed in a text file, one per line relative to
+    the file, blank lines and lines starting with # are skipped
+    """
+    dirname = os.path.dirname(os.path.abspath(filename))
+    with io.open(filename, encoding='utf-8') as f:
+        lines = [line.strip() for line in f]
+    return [os.path.join(dirname, line) for line in lines if line and not line.startswith('#')]
+
+
+def chapter_notebooks(paths):
+    """
+    returns the notebooks of paths in order, notebook lists (.txt files)
+    are replaced by the notebooks they list
+    """
+    notebooks = []
+    for path in paths:
+        if path.endswith('.txt'):
+            notebooks.extend(find_notebooks(read_list(path)))
+        else:
+            notebooks.extend(find_notebooks([path]))
+    return notebooks
+
+
+def chapter_name(path):
+    return os.path.splitext(os.path.basename(path))[0].replace(' ', '_')
+
+
+def notebook_title(path):
+    """
+    returns the title in the latex_metadata of a notebook, if any
+    """
+    setup_extensions()
+    from nbstream import notebook_metadata
+    metadata = notebook_metadata(path)
+    return (metadata.get('latex_metadata') or {}).get('title')
+
+
+def split_document(tex):
+    """
+    returns preamble and body of a LaTeX document
+    """
+    start = tex.find(BEGIN_DOCUMENT)
+    end = tex.rfind(END_DOCUMENT)
+    if start < 0 or end < start:
+        raise ValueError('not a LaTeX document')
+    return tex[:start], tex[start + len(BEGIN_DOCUMENT):end]
+
+
+def chapter_body(tex, title=None):
+    """
+    returns the body of a converted notebook as a chapter, without its title
+    and bibliography and, if title is given, starting with a \\chapter
+    """
+    body = MAIN_LINES_RE.sub('', split_document(tex)[1]).strip('\n')
+    if title:
+        body = '\\chapter{' + title + '}\n' + body
+    return body + '\n'
+
+
+def main_document(preamble, chapters, bibfile=None, bibstyle='unsrt', title=None, documentclass=None, only=None):
+    """
+    returns the main document including the chapters
+
+    Parameters
+    ----------
+    preamble : str
+        preamble of the document, e.g. of the first chapter
+    chapters : list
+        chapter files, relative to the main document and without .tex
+    bibfile : str
+        .bib file cited by all chapters, without .bib
+    bibstyle : str
+        bibtex style
+    title : str
+        title of the document
+    documentclass : str
+        replaces the document class of preamble
+    only : list
+        chapters to typeset, with \\includeonly
+    """
+    if documentclass:
+        preamble = DOCUMENTCLASS_RE.sub(lambda m: '\\documentclass' + (m.group(1) or '') + '{' + documentclass + '}',
+                                        preamble, count=1)
+    lines = [preamble.rstrip()]
+    if only is not None:
+        lines.append('\\includeonly{' + ','.join(only) + '}')
+    lines.append(BEGIN_DOCUMENT)
+    if title:
+        lines += ['\\title{' + title + '}', '\\date{\\today}', '\\maketitle']
+    lines += ['\\include{' + chapter + '}' for chapter in chapters]
+    if bibfile:
+        lines += ['\\bibliographystyle{' + bibstyle + '}', '\\bibliography{' + bibfile + '}']
+    lines.append(END_DOCUMENT)
+    return '\n'.join(lines) + '\n'
+
+
+def merged_bibfile(notebooks, filename, config_file=None):
+    """
+    writes the references of all notebooks into filename, unless the
+    project .bib file of a reference store is configured, and returns the
+    .bib file cited by the main document or None without references
+    """
+    config = load_config(config_file)
+    if config.BibTexPreprocessor.get('project_bibfile'):
+        return config.BibTexPreprocessor.project_bibfile
+    setup_extensions()
+    from cite2c_store import notebook_references
+    references = {}
+    for path in notebooks:
+        references.update(notebook_references(path))
+    if not references:
+        return None
+    from pre_cite2c import BibTexPreprocessor
+    bibwriter = BibTexPreprocessor(config=config)
+    bibwriter.references = references
+    bibwriter.create_bibfile({'outputs': {}}, filename)
+    return filename
+
+
+def assemble(notebooks, output_dir, main='main', title=None, documentclass=None, draft=False, pdf=False,
+             jobs=None, verbose=False, **options):
+    """
+    converts the notebooks, as chapters of the main document main.tex in
+    output_dir, and returns the results of build and the main document, or
+    None if a notebook failed to convert
+
+    Parameters
+    ----------
+    notebooks : list
+        notebooks in the order of the chapters
+    output_dir : str
+        directory receiving the converted notebooks, chapters and main
+        document
+    main : str
+        name of the main document
+    title : str
+        title of the main document
+    documentclass : str
+        document class of the main document, with a \\chapter per notebook
+        for classes that have chapters
+    draft : bool
+        only typeset the chapters that changed since the last assembly
+    pdf : bool
+        typeset the main document
+    jobs : int
+        number of worker processes converting the notebooks
+    options
+        passed on to build
+    """
+    names = [chapter_name(path) for path in notebooks]
+    if len(set(names)) < len(names):
+        raise ValueError('notebooks of the same name cannot be chapters of one document')
+
+    output_dir = os.path.abspath(output_dir)
+    start = time.time()
+    results = build(notebooks, jobs=jobs, to='latex', output_dir=output_dir, pdf=False, **options)
+    log.info(summary(results, time.time() - start, verbose))
+    if any(r['error'] for r in results):
+        return results, None
+
+    preamble = None
+    bibstyle = None
+    chapters = []
+    changed = []
+    for path, name in zip(notebooks, names):
+        with io.open(os.path.join(output_dir, os.path.splitext(os.path.basename(path))[0] + '.tex'),
+                     encoding='utf-8') as f:
+            tex = f.read()
+        if preamble is None:
+            preamble = split_document(tex)[0]
+        style = BIBSTYLE_RE.search(tex)
+        if style and bibstyle is None:
+            bibstyle = style.group(1)
+        chapter = CHAPTERS_DIR + '/' + name
+        heading = notebook_title(path) if documentclass in CHAPTER_CLASSES else None
+        if write_if_changed(os.path.join(output_dir, chapter + '.tex'), chapter_body(tex, heading)):
+            changed.append(chapter)
+        chapters.append(chapter)
+
+    bibfile = merged_bibfile(notebooks, os.path.join(output_dir, main + '.bib'), options.get('config_file'))
+    if bibfile:
+        bibfile = os.path.splitext(os.path.relpath(bibfile, output_dir))[0].replace(os.sep, '/')
+    texfile = os.path.join(output_dir, main + '.tex')
+    # a draft without changes typesets all chapters
+    only = changed if draft and changed else None
+    write_if_changed(texfile, main_document(preamble, chapters, bibfile, bibstyle or 'unsrt', title, documentclass,
+                                            only))
+    log.info('%s: %d chapters, %d changed', texfile, len(chapters), len(changed))
+    if pdf:
+        return results, typeset(texfile, bibtex=bibfile is not None)
+    return results, texfile
+
+
+def main(argv=None):
+    import argparse
+    prog = '{} -m jupyterpublicationscripts assemble'.format(os.path.basename(sys.executable))
+    parser = argparse.ArgumentParser(prog=prog,
+                    description='Assemble the notebooks as chapters of one LaTeX document.')
+    parser.add_argument('paths', nargs='+', metavar='<notebook>',
+                    help='notebooks, directories or .txt files listing the notebooks, in chapter order')
+    parser.add_argument('-o', '--output-dir', required=True,
+                    help='directory for the chapters and the main document')
+    parser.add_argument('--main', default='main', help='name of the main document (default: main)')
+    parser.add_argument('--title', default=None, help='title of the main document')
+    parser.add_argument('--documentclass', default=None,
+                    help='document class of the main document, e.g. report for a chapter per notebook')
+    parser.add_argument('--template', default=None,
+                    help='template file of the chapters (default: latex_nocode)')
+    parser.add_argument('-c', '--config', default=None, dest='config_file',
+                    help='additional nbconvert configuration file (.json or .py)')
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                    help='number of worker processes (default: number of CPUs)')
+    parser.add_argument('--pdf', action='store_true', help='typeset the main document into PDF')
+    parser.add_argument('--draft', action='store_true',
+                    help='only typeset the chapters that changed since the last assembly')
+    parser.add_argument('-f', '--force', action='store_true',
+                    help='convert all notebooks, even if they did not change')
+    parser.add_argument('-v', '--verbose', action='store_true',
+                    help='print full tracebacks of failed notebooks')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(format='%(message)s')
+    notebooks = chapter_notebooks(args.paths)
+    if not notebooks:
+        parser.error('no notebooks found')
+    try:
+        results, output = assemble(notebooks, args.output_dir, main=args.main, title=args.title,
+                                   documentclass=args.documentclass, draft=args.draft, pdf=args.pdf,
+                                   jobs=args.jobs, verbose=args.verbose,
+                                   template=args.template or DEFAULT_TEMPLATES['latex'],
+                                   config_file=args.config_file, force=args.force)
+    except (ValueError, TypesetError) as e:
+        log.error(str(e))
+        return 1
+    if output is None:
+        return 1
+    print(output)
+    return 0
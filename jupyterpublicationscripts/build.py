@@ -0,0 +1,627 @@
+"""Batch conversion of whole notebook directories
+
+Every notebook is converted in its own worker process with the
+preprocessors from jupyter_nbconvert_config.json and the publication
+templates, a failing notebook is reported but does not stop the others.
+A manifest per notebook records the inputs of every conversion stage, so
+that rebuilds only redo the stages whose inputs changed. Output payloads
+larger than the spill size are kept in files while the notebook is
+preprocessed, see extensions/nbstream.py.
+"""
+from __future__ import print_function
+
+import os
+import sys
+import time
+import logging
+import traceback
+from collections import OrderedDict
+
+from .manifest import Manifest, hash_data, hash_files, hash_dir, file_signature
+from .typeset import typeset
+from . import fragments as fragment_cache
+from . import precompile
+from publicationextensions import instrument
+from publicationextensions.atomicfile import atomic_write
+from publicationextensions.instrument import stage, notebook
+
+log = logging.getLogger(__name__)
+log.setLevel(20)
+
+PACKAGE_DIR = os.path.dirname(os.path.abspath(__file__))
+SOURCE_DIR = os.path.dirname(PACKAGE_DIR)
+
+# per-notebook manifests and preprocessed notebooks, in the output directory
+CACHE_DIR = '.jps-cache'
+
+# output payloads longer than this many characters are spilled to files
+DEFAULT_SPILL = 1 << 20
+
+# default template per output format, None keeps the nbconvert default
+DEFAULT_TEMPLATES = {
+    'latex': 'latex_nocode',
+    'html': None,
+}
+
+
+def data_dirs():
+    """
+    returns the directories holding the extensions and templates: the
+    source checkout and the copies installed by setup.py
+    """
+    dirs = [SOURCE_DIR]
+    try:
+        from jupyter_core.paths import jupyter_data_dir
+        dirs.append(jupyter_data_dir())
+    except ImportError:
+        pass
+    return dirs
+
+
+def setup_extensions():
+    """
+    makes the preprocessors in extensions/ importable, as done by
+    example/jupyter_nbconvert_config.py for the installed copies
+    """
+    for d in data_dirs():
+        path = os.path.join(d, 'extensions')
+        if os.path.isdir(path) and path not in sys.path:
+            sys.path.append(path)
+
+
+def template_dirs():
+    return [os.path.join(d, 'templates') for d in data_dirs()
+            if os.path.isdir(os.path.join(d, 'templates'))]
+
+
+def find_notebooks(paths):
+    """
+    returns all notebooks given directly or found below the given
+    directories, skipping notebook checkpoints and preprocessed notebooks
+    """
+    notebooks = []
+    for path in paths:
+        if os.path.isfile(path):
+            notebooks.append(os.path.abspath(path))
+            continue
+        for root, dirs, files in os.walk(path):
+            dirs[:] = sorted(d for d in dirs if d not in ('.ipynb_checkpoints', CACHE_DIR))
+            for name in sorted(files):
+                if name.endswith('.ipynb'):
+                    notebooks.append(os.path.abspath(os.path.join(root, name)))
+    return notebooks
+
+
+def load_config(config_file=None):
+    """
+    returns the nbconvert configuration used for the conversion: the
+    preprocessors activated by this package, optionally extended by a
+    .json or .py nbconvert configuration file
+    """
+    from traitlets.config import JSONFileConfigLoader, PyFileConfigLoader
+
+    config = JSONFileConfigLoader('jupyter_nbconvert_config.json', PACKAGE_DIR).load_config()
+    # the shipped file pins a template path of the author's machine
+    config.pop('template_path', None)
+    config.Exporter.template_path = ['.'] + template_dirs()
+    if config_file:
+        dirname, filename = os.path.split(os.path.abspath(config_file))
+        if filename.endswith('.py'):
+            loader = PyFileConfigLoader(filename, dirname)
+        else:
+            loader = JSONFileConfigLoader(filename, dirname)
+        config.merge(loader.load_config())
+        # the shared references are located relative to the configuration
+        for trait in ('reference_store', 'project_bibfile'):
+            if config.BibTexPreprocessor.get(trait):
+                config.BibTexPreprocessor[trait] = os.path.join(dirname, config.BibTexPreprocessor[trait])
+    return config
+
+
+# exporters and preprocessors by (format, template, config file), kept
+# warm for all notebooks converted by the same worker process, the least
+# recently used are dropped beyond WARM_CACHE_SIZE, e.g. in a daemon whose
+# requests name many configurations
+WARM_CACHE_SIZE = 8
+_exporters = OrderedDict()
+_preprocessors = OrderedDict()
+
+
+def _warm(cache, key, create):
+    """
+    returns the value of key in cache, created by create() if missing, and
+    makes it the most recently used
+    """
+    try:
+        value = cache.pop(key)
+    except KeyError:
+        value = create()
+    cache[key] = value
+    if len(cache) > WARM_CACHE_SIZE:
+        cache.popitem(last=False)
+    return value
+
+
+def get_exporter(to, template, config_file):
+    """
+    returns the exporter rendering the preprocessed notebook, the
+    configured preprocessors are run separately by preprocess(). Its
+    template is wrapped to look up the cells in the fragment cache, and
+    compiled templates are kept in the template cache.
+    """
+    return _warm(_exporters, (to, template, config_file), lambda: _create_exporter(to, template, config_file))
+
+
+def _create_exporter(to, template, config_file):
+    from nbconvert.exporters import get_exporter as nbconvert_exporter
+    setup_extensions()
+    config = load_config(config_file)
+    if 'pre_figures.FigureStorePreprocessor' in config.Exporter.preprocessors:
+        # the figures were written, and SVG figures converted, by the
+        # preprocessor
+        config.ExtractOutputPreprocessor.enabled = False
+        config.SVG2PDFPreprocessor.enabled = False
+    config.Exporter.preprocessors = []
+    if template:
+        config.Exporter.template_file = template
+    if 're_replace' not in config.TemplateExporter.get('filters', {}):
+        from publicationextensions.replace import re_replace
+        config.TemplateExporter.filters = dict(config.TemplateExporter.get('filters', {}), re_replace=re_replace)
+    exporter = fragment_cache.install(nbconvert_exporter(to)(config=config))
+    return precompile.install(exporter)
+
+
+def get_preprocessors(config_file):
+    """
+    returns instances of the configured preprocessors, the .bib file is
+    not written by BibTexPreprocessor but by its own stage. Like
+    Exporter.register_preprocessor, the preprocessors are enabled.
+    """
+    return _warm(_preprocessors, config_file, lambda: _create_preprocessors(config_file))
+
+
+def _create_preprocessors(config_file):
+    from traitlets.utils.importstring import import_item
+    setup_extensions()
+    config = load_config(config_file)
+    # the store and the project .bib file are written by update_references
+    config.BibTexPreprocessor.write_bibfile = False
+    config.BibTexPreprocessor.update_store = False
+    return [(import_item(p) if isinstance(p, str) else p)(config=config, enabled=True)
+            for p in config.Exporter.preprocessors]
+
+
+def get_instrumentation(config_file):
+    """
+    returns the Instrumentation of this process, configured from the
+    nbconvert configuration on first use
+    """
+    if instrument.active is None:
+        return instrument.get_instrumentation(load_config(config_file))
+    return instrument.active
+
+
+def preprocess(nb, resources, config_file):
+    for preprocessor in get_preprocessors(config_file):
+        nb, resources = preprocessor(nb, resources)
+    return nb, resources
+
+
+_asset_hashes = None
+
+def asset_hashes():
+    """
+    returns the hashes of the extension sources and templates, which are
+    inputs of every notebook conversion
+    """
+    global _asset_hashes
+    if _asset_hashes is None:
+        _asset_hashes = {
+            'extensions': hash_data(*[hash_dir(os.path.join(d, 'extensions'), ['.py']) for d in data_dirs()]),
+            'templates': hash_data(*[hash_dir(d, ['.tplx', '.tpl']) for d in template_dirs()]),
+        }
+    return _asset_hashes
+
+
+def options_hash(to, template, config_file, pdf):
+    return hash_data(to, template, hash_files([config_file]) if config_file else None, pdf)
+
+
+def cache_path(output_dir, path, suffix):
+    """
+    returns the cache file of the notebook path with the given suffix. It is
+    named after the notebook, for notebooks outside of output_dir together
+    with a hash of their path relative to it, so that notebooks of the same
+    name in different directories of a project do not share cache files,
+    which are still found after the project is moved.
+    """
+    name = os.path.splitext(os.path.basename(path))[0]
+    try:
+        relative = os.path.relpath(path, output_dir)
+    except ValueError:
+        # on another drive
+        relative = os.path.abspath(path)
+    if os.path.dirname(relative):
+        name += '-' + hash_data(relative.replace(os.sep, '/'))[:8]
+    return os.path.join(output_dir, CACHE_DIR, name + suffix)
+
+
+def cited_from_store(nb, config):
+    """
+    returns the citation keys of the notebook nb that are not in its cite2c
+    metadata, which are taken from the reference store of config, if any
+    """
+    if not config.BibTexPreprocessor.get('reference_store'):
+        return []
+    setup_extensions()
+    from cite2c_check import CITE_RE
+    cited = set()
+    for cell in nb.cells:
+        if cell.cell_type == 'markdown':
+            cited.update(CITE_RE.findall(cell.source))
+    return sorted(cited.difference(nb.metadata.get('cite2c', {}).get('citations', {})))
+
+
+def store_references(keys, config):
+    """
+    returns the references of keys in the reference store of config by
+    citation key, the store is only read
+    """
+    if not keys:
+        return {}
+    setup_extensions()
+    from cite2c_store import ReferenceStore
+    store = ReferenceStore(config.BibTexPreprocessor.reference_store)
+    try:
+        return store.get(keys)
+    finally:
+        store.close()
+
+
+def up_to_date(path, to='latex', template=None, output_dir=None, config_file=None, pdf=False, force=False,
+               fragments=True, spill=DEFAULT_SPILL):
+    """
+    returns True if the notebook, the templates, the extensions, the
+    options and the references it takes from the reference store are
+    unchanged since its last conversion. Only file signatures, the manifest
+    and the store are looked at, so this is cheap for large notebooks.
+    """
+    if force:
+        return False
+    output_dir = os.path.abspath(output_dir or os.path.dirname(path))
+    manifest = Manifest(cache_path(output_dir, path, '.' + to + '.json'))
+    outputs = [manifest['output']] + ([manifest['pdf']] if pdf else [])
+    return (manifest['source'] == file_signature(path)
+            and manifest['options'] == options_hash(to, template, config_file, pdf)
+            and manifest['assets'] == asset_hashes()
+            and all(o and os.path.exists(o) for o in outputs)
+            and (not manifest['references'] or manifest['references'][1] ==
+                 hash_data(store_references(manifest['references'][0], load_config(config_file)))))
+
+
+def convert_notebook(path, to='latex', template=None, output_dir=None, config_file=None, pdf=False, force=False,
+                     fragments=True, spill=DEFAULT_SPILL):
+    """
+    converts a single notebook and returns a dictionary describing the
+    result. Exceptions are caught and reported in the result, so that one
+    broken notebook does not abort a batch.
+
+    The conversion is split into stages (preprocess, bib, render, pdf),
+    each stage is only run if its inputs changed since the last build.
+
+    Parameters
+    ----------
+    path : str
+        notebook to convert
+    to : str
+        nbconvert output format, e.g. 'latex' or 'html'
+    template : str
+        template file, e.g. 'latex_nocode' or 'revtex_nocode'
+    output_dir : str
+        directory receiving the output, defaults to the notebook directory
+    config_file : str
+        additional nbconvert configuration file
+    pdf : bool
+        typeset LaTeX output into a PDF
+    force : bool
+        run all stages regardless of the manifest
+    fragments : bool
+        render only the cells that are not in the fragment cache
+    spill : int
+        output payloads longer than this many characters are written to
+        files while preprocessing, 0 reads the whole notebook at once
+    """
+    import nbformat
+    from nbconvert.writers import FilesWriter
+
+    start = time.time()
+    name = os.path.splitext(os.path.basename(path))[0]
+    output_dir = os.path.abspath(output_dir or os.path.dirname(path))
+    result = {'notebook': path, 'output': None, 'error': None, 'stages': [], 'instrumentation': None}
+    instrumentation = get_instrumentation(config_file)
+    manifest = Manifest(cache_path(output_dir, path, '.' + to + '.json'))
+    cwd = os.getcwd()
+    try:
+        if not os.path.isdir(os.path.join(output_dir, CACHE_DIR)):
+            os.makedirs(os.path.join(output_dir, CACHE_DIR))
+        # BibTexPreprocessor writes relative to the working directory,
+        # every worker process handles a single notebook at a time
+        os.chdir(output_dir)
+        source = file_signature(path)
+        options = options_hash(to, template, config_file, pdf)
+        assets = asset_hashes()
+        if force:
+            manifest.data['stages'] = {}
+
+        with notebook(name), stage('build.read'):
+            if spill and source[1] > spill:
+                setup_extensions()
+                from nbstream import read_notebook
+                # per format, as conversions to other formats may run at once
+                nb = read_notebook(path, cache_path(output_dir, path, '.' + to + '.spill'), spill)
+            else:
+                nb = nbformat.read(path, as_version=4)
+        cells = hash_data([cell for cell in nb.cells])
+        cite2c = nb.metadata.get('cite2c', {})
+        # the references cited from the reference store, which other
+        # notebooks may change
+        config = load_config(config_file)
+        from_store = cited_from_store(nb, config)
+        references = store_references(from_store, config)
+        exporter = get_exporter(to, template, config_file)
+        resources = {
+            'metadata': {'name': name, 'path': os.path.dirname(path)},
+            'unique_key': name,
+            'output_files_dir': name + '_files',
+            'output_extension': exporter.file_extension,
+            'outputs': {},
+        }
+
+        # preprocess: markdown and citation rewriting of the cells
+        inputs = hash_data(cells, cite2c, references, assets['extensions'], options)
+        preprocessed = cache_path(output_dir, path, '.' + to + '.ipynb')
+        if manifest.changed('preprocess', inputs) or not os.path.exists(preprocessed):
+            with notebook(name), stage('build.preprocess'):
+                nb, _ = preprocess(nb, dict(resources), config_file)
+            atomic_write(preprocessed, nbformat.writes(nb))
+            manifest.record('preprocess', inputs)
+            result['stages'].append('preprocess')
+        else:
+            nb = nbformat.read(preprocessed, as_version=4)
+
+        # bib: the .bib file with the references of the notebook for LaTeX
+        # output. The project .bib file of the reference store is written
+        # by update_references before the conversions and only read here
+        bibfile = None
+        project_bibfile = config.BibTexPreprocessor.get('project_bibfile')
+        if 'tex' in exporter.file_extension and project_bibfile:
+            bibfile = project_bibfile
+        elif 'tex' in exporter.file_extension and ('citations' in cite2c or references):
+            bibfile = os.path.join(resources['output_files_dir'], name + '.bib')
+            inputs = hash_data(cite2c, references, assets['extensions'])
+            if manifest.changed('bib', inputs) or not os.path.exists(bibfile):
+                from pre_cite2c import BibTexPreprocessor
+                with notebook(name), stage('build.bib'):
+                    bibwriter = BibTexPreprocessor(config=config)
+                    bibwriter.references = dict(references, **cite2c.get('citations', {}))
+                    bibwriter.create_bibfile({'outputs': {}}, bibfile)
+                manifest.record('bib', inputs)
+                result['stages'].append('bib')
+
+        # render: the template applied to the preprocessed notebook, with
+        # the spilled payloads that were not stored by a preprocessor
+        inputs = hash_data(hash_files([preprocessed]), assets['templates'], options)
+        if manifest.changed('render', inputs) or not (manifest['output'] and os.path.exists(manifest['output'])):
+            with notebook(name), stage('build.render'):
+                if spill and source[1] > spill:
+                    from nbstream import restore
+                    nb = restore(nb)
+                if fragments and not force:
+                    context = [assets['templates'], options, template, type(exporter).__name__,
+                               dict((k, v) for k, v in nb.metadata.items() if k != 'cite2c'),
+                               resources['output_files_dir']]
+                    cache = fragment_cache.FragmentCache(cache_path(output_dir, path, '.' + to + '.fragments.json'),
+                                                         context)
+                    with cache:
+                        output, resources = exporter.from_notebook_node(nb, resources)
+                    cache.save()
+                else:
+                    output, resources = exporter.from_notebook_node(nb, resources)
+                writer = FilesWriter(build_directory=output_dir)
+                manifest['output'] = str(writer.write(output, resources, notebook_name=name))
+            manifest.record('render', inputs)
+            result['stages'].append('render')
+        result['output'] = manifest['output']
+
+        # pdf: typesetting of the LaTeX output
+        if pdf:
+            files_dir = resources['output_files_dir']
+            inputs = hash_data(hash_files([manifest['output'], bibfile or '']),
+                               hash_dir(files_dir) if os.path.isdir(files_dir) else None)
+            if manifest.changed('pdf', inputs) or not (manifest['pdf'] and os.path.exists(manifest['pdf'])):
+                with notebook(name), stage('build.pdf'):
+                    manifest['pdf'] = typeset(manifest['output'], bibtex=bibfile is not None)
+                manifest.record('pdf', inputs)
+                result['stages'].append('pdf')
+            result['output'] = manifest['pdf']
+
+        manifest['source'] = source
+        manifest['references'] = [from_store, hash_data(references)] if from_store else None
+        manifest['options'] = options
+        manifest['assets'] = assets
+    except Exception:
+        result['error'] = traceback.format_exc()
+    finally:
+        os.chdir(cwd)
+    try:
+        # stages completed before a failure are kept
+        manifest.save()
+    except Exception:
+        result['error'] = result['error'] or traceback.format_exc()
+    result['seconds'] = time.time() - start
+    if instrumentation.enabled:
+        # sent back to the main process by worker processes
+        result['instrumentation'] = instrumentation.pop(name)
+    return result
+
+
+def update_references(notebooks, config_file=None, retain=None):
+    """
+    records the references of notebooks in the project reference store and
+    writes the project .bib file, if configured and the store changed or
+    the file is missing. This is done once before the notebooks are
+    converted, which then only read the store and the .bib file. If retain
+    is given, the notebooks not in it are dropped from the store.
+    """
+    config = load_config(config_file)
+    if not config.BibTexPreprocessor.get('reference_store'):
+        return
+    setup_extensions()
+    from cite2c_store import build_store
+    from pre_cite2c import BibTexPreprocessor
+    store = build_store(config.BibTexPreprocessor.reference_store, notebooks, retain)
+    bibfile = config.BibTexPreprocessor.get('project_bibfile')
+    if bibfile and (store.changed or not os.path.exists(bibfile)):
+        bibwriter = BibTexPreprocessor(config=config)
+        bibwriter.references = store.all()
+        bibwriter.create_bibfile({'outputs': {}}, config.BibTexPreprocessor.project_bibfile)
+    store.close()
+
+
+def build(notebooks, jobs=None, **options):
+    """
+    converts all notebooks that are not up to date, in a pool of jobs
+    worker processes, and returns the list of results in completion order.
+    options are passed on to convert_notebook. The instrumentation of
+    the workers, if enabled, is collected in the Instrumentation of this
+    process.
+    """
+    instrumentation = get_instrumentation(options.get('config_file'))
+
+    def collect(result):
+        if result['instrumentation']:
+            name = os.path.splitext(os.path.basename(result['notebook']))[0]
+            instrumentation.merge(name, result['instrumentation'])
+        report(result)
+
+    if options.get('output_dir'):
+        names = {}
+        for path in notebooks:
+            names.setdefault(os.path.basename(path), []).append(path)
+        for paths in names.values():
+            if len(paths) > 1:
+                log.warning('%s are written to the same output file in %s', ', '.join(paths), options['output_dir'])
+
+    with stage('build.references'):
+        update_references(notebooks, options.get('config_file'), retain=notebooks)
+
+    results = []
+    stale = []
+    for path in notebooks:
+        if up_to_date(path, **options):
+            results.append({'notebook': path, 'output': None, 'error': None, 'stages': [], 'seconds': 0.0,
+                            'instrumentation': None})
+        else:
+            stale.append(path)
+
+    if jobs == 1 or len(stale) <= 1:
+        for path in stale:
+            results.append(convert_notebook(path, **options))
+            collect(results[-1])
+        return results
+
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        futures = [pool.submit(convert_notebook, path, **options) for path in stale]
+        for future in as_completed(futures):
+            results.append(future.result())
+            collect(results[-1])
+    return results
+
+
+def report(result):
+    if result['error']:
+        log.error('FAILED %s (%.2f s)', result['notebook'], result['seconds'])
+    else:
+        log.info('%s -> %s (%s, %.2f s)', result['notebook'], result['output'],
+                 ', '.join(result['stages']) or 'up to date', result['seconds'])
+
+
+def summary(results, elapsed, verbose=False):
+    """
+    returns a printable summary of a batch: counts, throughput, timing
+    and the errors of all failed notebooks, with full tracebacks if verbose
+    """
+    failed = [r for r in results if r['error']]
+    current = [r for r in results if not r['error'] and not r['stages']]
+    times = sorted(r['seconds'] for r in results)
+    lines = ['{} notebooks: {} converted, {} up to date, {} failed in {:.2f} s ({:.2f} notebooks/s)'.format(
+        len(results), len(results) - len(failed) - len(current), len(current), len(failed), elapsed,
+        len(results) / elapsed if elapsed else 0.0)]
+    if times:
+        lines.append('Per notebook: min {:.2f} s, median {:.2f} s, max {:.2f} s, total {:.2f} s'.format(
+            times[0], times[len(times) // 2], times[-1], sum(times)))
+    for r in failed:
+        if verbose:
+            lines.append('')
+            lines.append('FAILED {}:'.format(r['notebook']))
+            lines.append(r['error'].rstrip())
+        else:
+            lines.append('FAILED {}: {}'.format(r['notebook'], r['error'].rstrip().splitlines()[-1]))
+    return '\n'.join(lines)
+
+
+def add_arguments(parser):
+    """
+    adds the conversion options of build to an argument parser, shared
+    with the other commands converting notebooks
+    """
+    parser.add_argument('paths', nargs='+', metavar='<dir>', help='notebooks or directories to search for notebooks')
+    parser.add_argument('-t', '--to', default='latex', help='output format (default: latex)')
+    parser.add_argument('--template', default=None,
+                    help='template file, e.g. revtex_nocode (default: latex_nocode for latex)')
+    parser.add_argument('-o', '--output-dir', default=None,
+                    help='directory for the output (default: next to each notebook)')
+    parser.add_argument('-c', '--config', default=None, dest='config_file',
+                    help='additional nbconvert configuration file (.json or .py)')
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                    help='number of worker processes (default: number of CPUs)')
+    parser.add_argument('-v', '--verbose', action='store_true',
+                    help='print full tracebacks of failed notebooks')
+    parser.add_argument('--pdf', action='store_true',
+                    help='typeset LaTeX output into PDF')
+    parser.add_argument('-f', '--force', action='store_true',
+                    help='rebuild all stages, even if their inputs did not change')
+    parser.add_argument('--no-fragment-cache', action='store_false', dest='fragments',
+                    help='render all cells, instead of only those not in the fragment cache')
+    parser.add_argument('--spill', type=int, default=DEFAULT_SPILL, metavar='<size>',
+                    help='keep output payloads longer than this many characters in files while preprocessing, '
+                         '0 to disable (default: {})'.format(DEFAULT_SPILL))
+
+
+def main(argv=None):
+    import argparse
+    prog = '{} -m jupyterpublicationscripts build'.format(os.path.basename(sys.executable))
+    parser = argparse.ArgumentParser(prog=prog,
+                    description='Convert all notebooks in the given directories.')
+    add_arguments(parser)
+    parser.add_argument('--check', action='store_true',
+                    help='check the citations of all notebooks first and stop if keys are missing')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(format='%(message)s')
+    template = args.template or DEFAULT_TEMPLATES.get(args.to)
+    notebooks = find_notebooks(args.paths)
+    if not notebooks:
+        parser.error('no notebooks found')
+    if args.check:
+        from .check import run
+        if run(notebooks, args.config_file, unused=False):
+            return 1
+
+    start = time.time()
+    results = build(notebooks, jobs=args.jobs, to=args.to, template=template, output_dir=args.output_dir,
+                    config_file=args.config_file, pdf=args.pdf, force=args.force, fragments=args.fragments,
+                    spill=args.spill)
+    print(summary(results, time.time() - start, args.verbose))
+    return 1 if any(r['error'] for r in results) else 0
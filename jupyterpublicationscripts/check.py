@@ -0,0 +1,95 @@
+"""Check of the citations of notebooks before they are converted
+
+Reports cited keys missing from the cite2c references of a notebook, as
+well as references that are never cited or stored twice. Only the notebook
+JSON is read, neither nbconvert nor citeproc are loaded, so that the check
+is cheap enough to run on every commit:
+
+    python -m jupyterpublicationscripts check $(git diff --cached --name-only -- '*.ipynb')
+"""
+from __future__ import print_function
+
+import os
+import sys
+import time
+
+from .build import find_notebooks, setup_extensions, load_config
+
+
+def check(notebooks, shared=False):
+    """
+    returns the problems of the citations of every notebook as a list of
+    (path, problems), see cite2c_check.check_references. With shared, the
+    notebooks are part of a project with a reference store, and keys cited
+    by one notebook may be taken from the references of the others.
+    """
+    setup_extensions()
+    from cite2c_check import read_citations, check_references
+
+    citations = [(path,) + read_citations(path) for path in notebooks]
+    references = {}
+    if shared:
+        for _, _, r in citations:
+            references.update(r)
+    return [(path, check_references(cited, r, references)) for path, cited, r in citations]
+
+
+def failed(problems, strict=False):
+    return bool(problems['missing'] or (strict and (problems['unused'] or problems['duplicates'])))
+
+
+def format_problems(path, problems):
+    """
+    returns the lines reporting the problems of a notebook
+    """
+    lines = []
+    for key, count in problems['missing'].items():
+        lines.append("{}: missing reference '{}' ({} citation{})".format(path, key, count, 's' if count > 1 else ''))
+    for keys in problems['duplicates']:
+        lines.append('{}: duplicate references {}'.format(path, ', '.join("'{}'".format(k) for k in keys)))
+    for key in problems['unused']:
+        lines.append("{}: unused reference '{}'".format(path, key))
+    return lines
+
+
+def summary(results, elapsed, strict=False):
+    counts = [sum(len(problems[kind]) for _, problems in results) for kind in ('missing', 'duplicates', 'unused')]
+    return 'Checked {} notebooks in {:.2f} s: {} missing, {} duplicate and {} unused references, {} failed'.format(
+        len(results), elapsed, counts[0], counts[1], counts[2], sum(failed(p, strict) for _, p in results))
+
+
+def run(notebooks, config_file=None, strict=False, unused=True):
+    """
+    checks the notebooks and prints the problems, returns 1 if any notebook
+    failed the check, else 0
+    """
+    shared = bool(config_file and load_config(config_file).BibTexPreprocessor.get('reference_store'))
+    start = time.time()
+    results = check(notebooks, shared)
+    for path, problems in results:
+        if not unused:
+            problems['unused'] = []
+        for line in format_problems(os.path.relpath(path), problems):
+            print(line)
+    print(summary(results, time.time() - start, strict))
+    return 1 if any(failed(p, strict) for _, p in results) else 0
+
+
+def main(argv=None):
+    import argparse
+    prog = '{} -m jupyterpublicationscripts check'.format(os.path.basename(sys.executable))
+    parser = argparse.ArgumentParser(prog=prog,
+                    description='Check the citations of notebooks against their cite2c references.')
+    parser.add_argument('paths', nargs='+', metavar='<dir>', help='notebooks or directories to search for notebooks')
+    parser.add_argument('-c', '--config', default=None, dest='config_file',
+                    help='nbconvert configuration file, for the reference store of a project')
+    parser.add_argument('--strict', action='store_true',
+                    help='fail on unused and duplicate references too, not only on missing ones')
+    parser.add_argument('--no-unused', action='store_false', dest='unused',
+                    help='do not report unused references')
+    args = parser.parse_args(argv)
+
+    notebooks = find_notebooks(args.paths)
+    if not notebooks:
+        parser.error('no notebooks found')
+    return run(notebooks, args.config_file, args.strict, args.unused)
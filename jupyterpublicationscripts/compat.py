@@ -2,46 +2,76 @@ from __future__ import print_function, absolute_import
 
 import sys
 
+# Whether to use Jupyter or the IPython < 4 backends is only determined, and
+# the backends are only imported, once a command needs them. Importing
+# notebook or IPython takes longer than everything else the command line does.
 
-# loaded as a content manager, we can check wether IPython/jupyter is in sys
-# module, then the answer is unambiguous/
+_jupyter = None
 
-DEFINITIVELY_JUPYTER = 'notebook' in sys.modules
+def is_jupyter():
+    global _jupyter
+    if _jupyter is not None:
+        return _jupyter
 
-# we might want to check wether this is in an IPython context (ie there is
-# IPython is sys.modules, but then we need to check version)
+    # loaded as a content manager, we can check wether IPython/jupyter is in sys
+    # module, then the answer is unambiguous/
 
-MAYBE_IPYTHON = 'IPython' in sys.modules
+    definitively_jupyter = 'notebook' in sys.modules or 'jupyter_core' in sys.modules
 
-if MAYBE_IPYTHON and not DEFINITIVELY_JUPYTER:
-    import IPython
-    # IPython 4.0+ context, so we definitively
-    # should have Jupyter installed
-    if IPython.version_info >= (4, 0):
-        DEFINITIVELY_JUPYTER = True
+    # we might want to check wether this is in an IPython context (ie there is
+    # IPython is sys.modules, but then we need to check version)
 
-JUPYTER = False
+    if not definitively_jupyter and 'IPython' in sys.modules:
+        # IPython 4.0+ context, so we definitively
+        # should have Jupyter installed
+        definitively_jupyter = sys.modules['IPython'].version_info >= (4, 0)
 
-if DEFINITIVELY_JUPYTER:
-    JUPYTER = True
-else:
-    # none of above in sys.module,
-    # we might be at install time.
-    # guess for the best.
-    try:
-        # if jupyter is installed, assume jupyter
-        import notebook.nbextensions
-        # silence pyflakes
-        notebook.nbextensions
-        JUPYTER = True
-    except ImportError:
-        pass
+    if definitively_jupyter:
+        _jupyter = True
+    else:
+        # none of above in sys.module,
+        # we might be at install time.
+        # guess for the best: if jupyter is installed, assume jupyter.
+        # Only look for the package instead of importing it.
+        try:
+            from importlib.util import find_spec
+            _jupyter = find_spec('jupyter_core') is not None
+        except ImportError:
+            # Python 2
+            import imp
+            try:
+                imp.find_module('jupyter_core')
+                _jupyter = True
+            except ImportError:
+                _jupyter = False
+    return _jupyter
 
 
-if JUPYTER:
-    import notebook.nbextensions as nbe
-else:
-    import IPython.html.nbextensions as nbe
+def nbextensions():
+    """
+    returns the nbextensions module of the notebook server
+    """
+    if is_jupyter():
+        import notebook.nbextensions as nbe
+    else:
+        import IPython.html.nbextensions as nbe
+    return nbe
 
-# silence pyflakes
-nbe
+
+def cast_unicode_py2(s):
+    """
+    returns s as unicode, json.dumps returns byte strings on Python 2
+    """
+    if isinstance(s, bytes):
+        return s.decode('utf-8')
+    return s
+
+
+def __getattr__(name):
+    # JUPYTER and nbe used to be computed at import, Python 3.7+ computes
+    # them on first access instead
+    if name == 'JUPYTER':
+        return is_jupyter()
+    if name == 'nbe':
+        return nbextensions()
+    raise AttributeError(name)
@@ -0,0 +1,176 @@
+"""Activation of the preprocessors in nbconvert configuration files
+
+The preprocessors of the shipped jupyter_nbconvert_config.json are merged
+into Exporter.preprocessors of a configuration as a set: missing ones are
+appended, duplicates are dropped and the order of the others is kept, so
+that activating any number of times gives the same configuration. A
+configuration file is only serialized if it changed and is then replaced
+atomically, never left half written, keeping its permissions and owner.
+provision() activates or
+deactivates the preprocessors in many configuration directories or
+profiles in one run, e.g. of all user environments of a machine.
+"""
+from __future__ import print_function
+
+import os
+import io
+import copy
+import json
+import logging
+from collections import OrderedDict
+
+from . import compat
+from publicationextensions.atomicfile import atomic_write
+
+log = logging.getLogger(__name__)
+log.setLevel(20)
+
+PACKAGE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def _config_class():
+    """
+    returns the Config class of Jupyter or, for IPython < 4, of IPython,
+    imported only when a configuration is accessed
+    """
+    if compat.is_jupyter():
+        from traitlets.config import Config
+    else:
+        from IPython.config import Config
+    return Config
+
+
+_preprocessors = None
+
+def preprocessors():
+    """
+    returns the preprocessors activated by this package, those of the
+    shipped configuration
+    """
+    global _preprocessors
+    if _preprocessors is None:
+        with io.open(os.path.join(PACKAGE_DIR, 'jupyter_nbconvert_config.json'), encoding='utf-8') as f:
+            _preprocessors = tuple(json.load(f)['Exporter']['preprocessors'])
+    return _preprocessors
+
+
+def merged(current, add=(), remove=()):
+    """
+    returns the list current with the entries of add appended unless they are
+    in it and the entries of remove dropped, every entry once and in order
+    """
+    remove = set(remove)
+    return [p for p in OrderedDict.fromkeys(list(current) + list(add)) if p not in remove]
+
+
+def config_path(profile='default', config_dir=None):
+    """
+    returns directory and file name of the nbconvert configuration of
+    config_dir or, by default, of the Jupyter configuration directory or of
+    the IPython profile
+    """
+    if compat.is_jupyter():
+        if config_dir is None:
+            from jupyter_core.paths import jupyter_config_dir
+            config_dir = jupyter_config_dir()
+        return config_dir, 'jupyter_nbconvert_config.json'
+    if config_dir is None:
+        from IPython.utils.path import locate_profile
+        config_dir = locate_profile(profile)
+    return config_dir, 'ipython_nbconvert_config.json'
+
+
+class jconfig(object):
+
+    def __init__(self, profile='default', config_dir=None):
+        """
+        A context manager that simply expose the configuration values.
+
+        Mutate the value of the configuration while in the context manager,
+        and it will be written to disk on exit if it changed, with the mode
+        and owner of the file it replaces. Nothing is written if the context
+        is left with an exception.
+
+        Parameters
+        ----------
+        profile : str
+            IPython profile, for IPython < 4
+        config_dir : str
+            configuration directory, by default the one of Jupyter or of
+            the IPython profile
+        """
+        self.profile = profile
+        self.config_dir = config_dir
+        self.changed = False
+
+    def __enter__(self):
+        Config = _config_class()
+        self.pdir, self.cff_name = config_path(self.profile, self.config_dir)
+        self.filename = os.path.join(self.pdir, self.cff_name)
+        try:
+            with io.open(self.filename, encoding='utf-8') as f:
+                data = json.load(f)
+            # like JSONFileConfigLoader, without reading the file again
+            if data.pop('version', 1) != 1:
+                raise ValueError('Unknown version of JSON config file')
+            self.config = Config(data)
+        except (IOError, OSError, ValueError):
+            self.config = Config()
+        self.config['format'] = 1
+        self.original = copy.deepcopy(self.config)
+        return self.config
+
+    def __exit__(self, type, value, tb):
+        if type is not None or self.config == self.original:
+            return
+        # lazy values of missing keys are written as empty dicts
+        text = compat.cast_unicode_py2(json.dumps(self.config, indent=2, default=lambda _: {}))
+        atomic_write(self.filename, text)
+        self.changed = True
+
+
+def activate(profile='default', config_dir=None):
+    """
+    adds the preprocessors to the nbconvert configuration, returns True if
+    it changed
+    """
+    if not profile:
+        raise ValueError('Profile cannot be NoneType')
+    context = jconfig(profile, config_dir)
+    with context as config:
+        exporter = config['Exporter']
+        exporter['preprocessors'] = merged(dict.get(exporter, 'preprocessors', []), add=preprocessors())
+    return context.changed
+
+
+def deactivate(profile='default', config_dir=None):
+    """
+    removes the preprocessors from the nbconvert configuration, returns True
+    if it changed
+    """
+    context = jconfig(profile, config_dir)
+    with context as config:
+        exporter = dict.get(config, 'Exporter', {})
+        if dict.get(exporter, 'preprocessors'):
+            exporter['preprocessors'] = merged(exporter['preprocessors'], remove=preprocessors())
+    return context.changed
+
+
+def provision(config_dirs=None, profiles=('default',), active=True):
+    """
+    activates, or with active=False deactivates, the preprocessors in every
+    configuration directory of config_dirs or, without them, in every
+    profile, and returns the list of (configuration file, changed, error).
+    A failure is reported and does not stop the others.
+    """
+    action = activate if active else deactivate
+    targets = [('default', d) for d in config_dirs] if config_dirs else [(p, None) for p in profiles]
+    results = []
+    for profile, config_dir in targets:
+        try:
+            filename = os.path.join(*config_path(profile, config_dir))
+            results.append((filename, action(profile, config_dir), None))
+        except Exception as e:
+            results.append((config_dir or profile, False, '{}: {}'.format(type(e).__name__, e)))
+            log.error('%s: %s', config_dir or profile, results[-1][2])
+    return results
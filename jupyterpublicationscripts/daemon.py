@@ -0,0 +1,546 @@
+"""Conversion server keeping warm worker processes
+
+The daemon starts a pool of worker processes that load the exporters,
+templates, preprocessors and citation styles once, and converts the
+notebooks sent to it over HTTP, on localhost or on a Unix socket:
+
+    POST /convert   {"notebook": "/path/to/paper.ipynb", "to": "latex", ...}
+    GET  /metrics   queue depth, job counts and latencies
+
+A conversion request returns the result of build.convert_notebook once the
+notebook is converted. Requests for a notebook that is up to date return at
+once, identical requests arriving before their job started share that job,
+and a notebook is never converted by two workers at the same time: requests
+arriving while it is converted share a single job run afterwards, as the
+notebook may have changed in between.
+
+The configuration files given are executed and the outputs written where
+requested, so requests may only name the configuration file, output
+directory and template file the daemon was started with or ones in the
+directories it allows. Requests must be JSON, and requests from browsers,
+which carry an Origin header, are refused, so that web pages cannot send
+conversions to a daemon on localhost.
+
+Restart the daemon after changing the templates or extensions.
+"""
+from __future__ import print_function
+
+import os
+import sys
+import json
+import time
+import errno
+import socket
+import logging
+import threading
+from collections import deque, OrderedDict
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from http.client import HTTPConnection
+    from socketserver import ThreadingMixIn, UnixStreamServer
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from httplib import HTTPConnection
+    from SocketServer import ThreadingMixIn, UnixStreamServer
+
+from .build import (convert_notebook, get_instrumentation, update_references, up_to_date, DEFAULT_SPILL,
+                    DEFAULT_TEMPLATES)
+from .manifest import hash_data
+from .watch import warm_up
+
+log = logging.getLogger(__name__)
+log.setLevel(20)
+
+DEFAULT_PORT = 8642
+
+# options of a conversion request with their defaults, see convert_notebook
+OPTIONS = {
+    'to': 'latex',
+    'template': None,
+    'output_dir': None,
+    'config_file': None,
+    'pdf': False,
+    'force': False,
+    'fragments': True,
+    'spill': DEFAULT_SPILL,
+}
+
+# latencies kept for the metrics
+LATENCIES = 1000
+
+
+def job_options(request, defaults=None):
+    """
+    returns the options of convert_notebook for a conversion request, the
+    options not given are taken from defaults and OPTIONS. Raises
+    ValueError for unknown options.
+    """
+    unknown = set(request) - set(OPTIONS) - set(['notebook'])
+    if unknown:
+        raise ValueError('unknown options: ' + ', '.join(sorted(unknown)))
+    options = dict(OPTIONS, **(defaults or {}))
+    if 'to' in request and 'template' not in request and request['to'] != options['to']:
+        # the default template is one of the default format
+        options['template'] = None
+    options.update((k, v) for k, v in request.items() if k != 'notebook')
+    options['template'] = options['template'] or DEFAULT_TEMPLATES.get(options['to'])
+    for key in ('output_dir', 'config_file'):
+        if options[key]:
+            options[key] = os.path.abspath(options[key])
+    return options
+
+
+def inside(path, directories):
+    """
+    returns True if path is in one of directories or their subdirectories,
+    symbolic links resolved
+    """
+    path = os.path.realpath(path)
+    for directory in directories:
+        directory = os.path.join(os.path.realpath(directory), '')
+        if path == directory[:-1] or path.startswith(directory):
+            return True
+    return False
+
+
+def forbidden_options(options, defaults, allowed_dirs=()):
+    """
+    returns the options among output_dir, config_file and template naming
+    paths that are neither those of defaults nor in allowed_dirs
+    """
+    forbidden = []
+    for key in ('output_dir', 'config_file', 'template'):
+        value = options[key]
+        if not value or defaults.get(key) and os.path.abspath(value) == os.path.abspath(defaults[key]):
+            continue
+        if key == 'template' and os.path.basename(value) == value:
+            # a template name is looked up in the template directories
+            continue
+        if not inside(value, allowed_dirs):
+            forbidden.append(key)
+    return forbidden
+
+
+def percentiles(values):
+    """
+    returns count, mean, median, 95th percentile and maximum of values
+    """
+    values = sorted(values)
+    if not values:
+        return {'count': 0}
+    return {
+        'count': len(values),
+        'mean': sum(values) / len(values),
+        'p50': values[len(values) // 2],
+        'p95': values[min(len(values) - 1, int(len(values) * 0.95))],
+        'max': values[-1],
+    }
+
+
+def warm_worker(options):
+    """
+    initializer of the worker processes, a failure is reported by the
+    conversions instead of breaking the pool
+    """
+    try:
+        warm_up(options['to'], options['template'], options['config_file'])
+    except Exception as e:
+        log.warning('Could not warm up the worker: %s: %s', type(e).__name__, e)
+
+
+class Job(object):
+    """ A conversion of one notebook with one set of options, shared by all
+        requests for it that arrive before it starts.
+        """
+    def __init__(self, key, notebook, options):
+        self.key = key
+        # jobs writing the same manifest and output do not run concurrently
+        self.slot = hash_data(notebook, options['to'], options['output_dir'])
+        self.notebook = notebook
+        self.options = options
+        self.requests = 1
+        self.submitted = time.time()
+        self.started = None
+        self.pool = None
+        self.result = None
+        self.done = threading.Event()
+
+    def wait(self, timeout=None):
+        self.done.wait(timeout)
+        return self.result
+
+
+class Scheduler(object):
+    """ Runs the jobs in a pool of warm worker processes, at most one job per
+        notebook, output format and output directory at a time, and keeps
+        the metrics.
+        """
+    def __init__(self, workers=None, defaults=None):
+        """
+        Public constructor
+
+        Parameters
+        ----------
+        workers : int
+            number of worker processes, default: number of CPUs
+        defaults : dictionary
+            options of the requests that do not give them, the workers
+            are warmed up for these
+        """
+        self.defaults = dict(OPTIONS, **(defaults or {}))
+        self.workers = workers or os.cpu_count() or 1
+        self.pool = self.start_pool()
+        self.lock = threading.Lock()
+        # the reference store and project .bib file are written by one
+        # request at a time, the workers only read them
+        self.references = threading.Lock()
+        # jobs not started yet by key in submission order, running jobs by slot
+        self.queued = OrderedDict()
+        self.running = {}
+        self.started = time.time()
+        self.counts = dict.fromkeys(('requests', 'jobs', 'shared', 'up_to_date', 'failed', 'restarts'), 0)
+        self.latency = deque(maxlen=LATENCIES)
+        self.queue_wait = deque(maxlen=LATENCIES)
+        self.instrumentation = get_instrumentation(self.defaults['config_file'])
+
+    def start_pool(self):
+        from concurrent.futures import ProcessPoolExecutor
+        return ProcessPoolExecutor(max_workers=self.workers, initializer=warm_worker,
+                                   initargs=(job_options({}, self.defaults),))
+
+    def restart_pool(self, pool):
+        """
+        replaces pool, broken by a worker process that died, by a new pool,
+        unless this was already done. Called with the lock held.
+        """
+        if self.pool is not pool:
+            return
+        log.warning('A worker process died, restarting the workers')
+        # the jobs of the broken pool fail, waiting for them would deadlock
+        # when called from their callbacks
+        pool.shutdown(wait=False)
+        self.pool = self.start_pool()
+        self.counts['restarts'] += 1
+
+    def submit(self, notebook, options):
+        """
+        returns the job converting notebook with options, None if the
+        notebook is up to date
+        """
+        notebook = os.path.abspath(notebook)
+        with self.references:
+            try:
+                update_references([notebook], options['config_file'])
+            except Exception as e:
+                # reported by the conversion, if it fails as well
+                log.warning('Could not record the references of %s: %s: %s', notebook, type(e).__name__, e)
+        key = hash_data(notebook, options)
+        current = up_to_date(notebook, **options)
+        with self.lock:
+            self.counts['requests'] += 1
+            job = self.queued.get(key)
+            if job is not None:
+                job.requests += 1
+                self.counts['shared'] += 1
+                return job
+            job = Job(key, notebook, options)
+            if current and job.slot not in self.running:
+                self.counts['up_to_date'] += 1
+                return None
+            self.queued[key] = job
+            started = self.dispatch()
+        self.watch(started)
+        return job
+
+    def dispatch(self):
+        # called with the lock held, starts the oldest jobs whose slot is free
+        # and returns them with their futures, see watch
+        from concurrent.futures.process import BrokenProcessPool
+        started = []
+        for key, job in list(self.queued.items()):
+            if len(self.running) >= self.workers:
+                break
+            if job.slot in self.running:
+                continue
+            self.running[job.slot] = self.queued.pop(key)
+            job.started = time.time()
+            self.counts['jobs'] += 1
+            try:
+                future = self.pool.submit(convert_notebook, job.notebook, **job.options)
+            except BrokenProcessPool:
+                # the pool broke before the callbacks of its jobs ran
+                self.restart_pool(self.pool)
+                future = self.pool.submit(convert_notebook, job.notebook, **job.options)
+            job.pool = self.pool
+            started.append((job, future))
+        return started
+
+    def watch(self, started):
+        # called without the lock, as the callback of a future that already
+        # finished runs at once in this thread
+        for job, future in started:
+            future.add_done_callback(lambda future, job=job: self.finish(job, future))
+
+    def finish(self, job, future):
+        from concurrent.futures.process import BrokenProcessPool
+        try:
+            result = future.result()
+        except Exception as e:
+            if isinstance(e, BrokenProcessPool):
+                # a worker process died, e.g. killed for its memory, and
+                # took the pool with it
+                with self.lock:
+                    self.restart_pool(job.pool)
+            result = {'notebook': job.notebook, 'output': None, 'error': '{}: {}'.format(type(e).__name__, e),
+                      'stages': [], 'seconds': 0.0, 'instrumentation': None}
+        instrumentation = result.pop('instrumentation', None)
+        if instrumentation:
+            self.instrumentation.merge(os.path.splitext(os.path.basename(job.notebook))[0], instrumentation)
+        now = time.time()
+        result['queued'] = job.started - job.submitted
+        result['latency'] = now - job.submitted
+        result['requests'] = job.requests
+        with self.lock:
+            del self.running[job.slot]
+            self.latency.append(result['latency'])
+            self.queue_wait.append(result['queued'])
+            if result['error']:
+                self.counts['failed'] += 1
+            started = self.dispatch()
+        self.watch(started)
+        job.result = result
+        job.done.set()
+        log.info('%s -> %s (%s, %.2f s, %d request%s)', job.notebook, result['output'],
+                 'FAILED' if result['error'] else ', '.join(result['stages']) or 'up to date',
+                 result['latency'], job.requests, 's' if job.requests > 1 else '')
+
+    def metrics(self):
+        with self.lock:
+            return dict(self.counts, queued=len(self.queued), running=len(self.running), workers=self.workers,
+                        uptime=time.time() - self.started, latency=percentiles(self.latency),
+                        queue_wait=percentiles(self.queue_wait))
+
+    def shutdown(self):
+        self.pool.shutdown(wait=True)
+
+
+class Handler(BaseHTTPRequestHandler):
+    """ JSON requests to the scheduler of the server
+        """
+    def reply(self, status, data):
+        body = json.dumps(data, indent=1, sort_keys=True).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def refused(self):
+        """
+        replies with an error and returns True for requests sent by a web
+        browser, identified by their Origin header
+        """
+        if self.headers.get('Origin') is None:
+            return False
+        self.reply(403, {'error': 'requests from web pages are not accepted'})
+        return True
+
+    def do_GET(self):
+        if self.refused():
+            return
+        if self.path.rstrip('/') == '/metrics':
+            self.reply(200, self.server.scheduler.metrics())
+        else:
+            self.reply(404, {'error': 'not found: ' + self.path})
+
+    def do_POST(self):
+        if self.path.rstrip('/') != '/convert':
+            self.reply(404, {'error': 'not found: ' + self.path})
+            return
+        if self.refused():
+            return
+        if self.headers.get('Content-Type', '').split(';')[0].strip().lower() != 'application/json':
+            self.reply(415, {'error': 'the request must be application/json'})
+            return
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))).decode('utf-8'))
+            options = job_options(request, self.server.scheduler.defaults)
+            notebook = request['notebook']
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            self.reply(400, {'error': 'bad request: {}'.format(e)})
+            return
+        forbidden = forbidden_options(options, self.server.scheduler.defaults, self.server.allowed_dirs)
+        if forbidden:
+            self.reply(403, {'error': 'not allowed, use the ones of the daemon or --allow-dir: ' +
+                                      ', '.join(forbidden)})
+            return
+        if not os.path.isfile(notebook):
+            self.reply(404, {'error': 'no such notebook: ' + notebook})
+            return
+        job = self.server.scheduler.submit(notebook, options)
+        if job is None:
+            self.reply(200, {'notebook': os.path.abspath(notebook), 'output': None, 'error': None, 'stages': [],
+                             'seconds': 0.0, 'queued': 0.0, 'latency': 0.0, 'requests': 1})
+            return
+        result = job.wait()
+        self.reply(500 if result['error'] else 200, result)
+
+    def address_string(self):
+        # Unix socket clients have no address
+        return str(self.client_address[0]) if self.client_address else 'local'
+
+    def log_message(self, format, *args):
+        log.debug('%s %s', self.address_string(), format % args)
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class ThreadingUnixHTTPServer(ThreadingMixIn, UnixStreamServer):
+    daemon_threads = True
+
+    def server_bind(self):
+        UnixStreamServer.server_bind(self)
+        # only the user running the daemon may send conversions
+        os.chmod(self.server_address, 0o600)
+
+
+def make_server(scheduler, host='127.0.0.1', port=DEFAULT_PORT, unix_socket=None, allowed_dirs=()):
+    """
+    returns the HTTP server passing requests to scheduler, listening on the
+    Unix socket unix_socket if given, else on host and port. Requests may
+    name output directories, configuration and template files in
+    allowed_dirs besides those of the scheduler defaults.
+    """
+    if unix_socket:
+        try:
+            os.remove(unix_socket)
+        except OSError as e:
+            if e.errno != errno.ENOENT:
+                raise
+        server = ThreadingUnixHTTPServer(unix_socket, Handler)
+    else:
+        server = ThreadingHTTPServer((host, port), Handler)
+    server.scheduler = scheduler
+    server.allowed_dirs = [os.path.abspath(d) for d in allowed_dirs]
+    return server
+
+
+class UnixHTTPConnection(HTTPConnection):
+
+    def __init__(self, path, timeout=None):
+        HTTPConnection.__init__(self, 'localhost', timeout=timeout)
+        self.unix_socket = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.unix_socket)
+
+
+def request(method, path, data=None, host='127.0.0.1', port=DEFAULT_PORT, unix_socket=None, timeout=None):
+    """
+    sends a request to a running daemon and returns the HTTP status and the
+    decoded JSON reply
+    """
+    if unix_socket:
+        connection = UnixHTTPConnection(unix_socket, timeout=timeout)
+    else:
+        connection = HTTPConnection(host, port, timeout=timeout)
+    try:
+        body = json.dumps(data).encode('utf-8') if data is not None else None
+        connection.request(method, path, body, {'Content-Type': 'application/json'})
+        response = connection.getresponse()
+        return response.status, json.loads(response.read().decode('utf-8'))
+    finally:
+        connection.close()
+
+
+def convert(notebook, host='127.0.0.1', port=DEFAULT_PORT, unix_socket=None, timeout=None, **options):
+    """
+    converts notebook with a running daemon and returns the result, see
+    build.convert_notebook, options not given are those of the daemon
+    """
+    data = dict(options, notebook=os.path.abspath(notebook))
+    return request('POST', '/convert', data, host, port, unix_socket, timeout)[1]
+
+
+def serve(workers=None, host='127.0.0.1', port=DEFAULT_PORT, unix_socket=None, allowed_dirs=(), **defaults):
+    """
+    runs the daemon until interrupted
+
+    Parameters
+    ----------
+    workers : int
+        number of worker processes
+    host, port : str, int
+        address to listen on, without unix_socket
+    unix_socket : str
+        Unix socket to listen on
+    allowed_dirs : list of str
+        directories whose output directories, configuration and template
+        files requests may name, besides those of defaults
+    defaults
+        options of the conversions, see convert_notebook, requests may
+        override them
+    """
+    scheduler = Scheduler(workers, defaults)
+    server = make_server(scheduler, host, port, unix_socket, allowed_dirs)
+    log.info('Converting with %d workers on %s, press Ctrl-C to stop', scheduler.workers,
+             unix_socket or 'http://{}:{}'.format(*server.server_address[:2]))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        scheduler.shutdown()
+        if unix_socket and os.path.exists(unix_socket):
+            os.remove(unix_socket)
+    return 0
+
+
+def main(argv=None):
+    import argparse
+    prog = '{} -m jupyterpublicationscripts daemon'.format(os.path.basename(sys.executable))
+    parser = argparse.ArgumentParser(prog=prog,
+                    description='Convert notebooks sent over HTTP with warm worker processes.')
+    parser.add_argument('--socket', default=None, dest='unix_socket', metavar='<path>',
+                    help='listen on this Unix socket instead of localhost')
+    parser.add_argument('--host', default='127.0.0.1', help='address to listen on (default: 127.0.0.1)')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT,
+                    help='port to listen on (default: {})'.format(DEFAULT_PORT))
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                    help='number of worker processes (default: number of CPUs)')
+    parser.add_argument('-t', '--to', default='latex', help='default output format (default: latex)')
+    parser.add_argument('--template', default=None,
+                    help='default template file (default: latex_nocode for latex)')
+    parser.add_argument('-c', '--config', default=None, dest='config_file',
+                    help='default nbconvert configuration file (.json or .py)')
+    parser.add_argument('--allow-dir', action='append', default=[], dest='allowed_dirs', metavar='<dir>',
+                    help='directory whose output directories, configuration and template files requests may '
+                         'name, besides the defaults (repeatable)')
+    parser.add_argument('--send', nargs='+', default=None, metavar='<notebook>',
+                    help='convert notebooks with the running daemon, instead of starting one')
+    parser.add_argument('--metrics', action='store_true',
+                    help='print the metrics of the running daemon, instead of starting one')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(format='%(message)s')
+    address = dict(host=args.host, port=args.port, unix_socket=args.unix_socket)
+    if args.metrics:
+        print(json.dumps(request('GET', '/metrics', **address)[1], indent=1, sort_keys=True))
+        return 0
+    if args.send:
+        failed = False
+        for notebook in args.send:
+            result = convert(notebook, **address)
+            failed = failed or bool(result.get('error'))
+            print(json.dumps(result, indent=1, sort_keys=True))
+        return 1 if failed else 0
+
+    defaults = dict(to=args.to, template=args.template or DEFAULT_TEMPLATES.get(args.to),
+                    config_file=os.path.abspath(args.config_file) if args.config_file else None)
+    return serve(args.jobs, allowed_dirs=args.allowed_dirs, **dict(address, **defaults))
@@ -0,0 +1,173 @@
+"""Cache of the rendered output of single cells
+
+The template of an exporter is wrapped in a template overriding the
+any_cell block of the nbconvert skeleton: a cell whose rendered fragment is
+in the cache is not rendered again, the fragments of the other cells are
+stored. Fragments are keyed on the cell (source, outputs and metadata), the
+notebook metadata, the template and the conversion options, so that after
+a change to one cell of a large notebook only that cell is rendered.
+
+The fragments of a notebook are stored as JSON next to its build manifest,
+only the fragments used by the last conversion are kept.
+"""
+from __future__ import print_function
+
+import os
+import io
+import json
+
+from publicationextensions.atomicfile import atomic_write
+
+from .manifest import hash_data
+
+WRAPPER = 'jps_fragments'
+
+# the cache of the notebook being rendered, the filters leave the template
+# untouched while it is None
+active = None
+
+
+def fragment_key(cell):
+    """
+    template filter returning the cache key of cell
+    """
+    if active is None:
+        return None
+    return active.key(cell)
+
+
+def cached_fragment(key):
+    """
+    template filter returning the cached fragment of key, or None
+    """
+    if active is None or key is None:
+        return None
+    fragment = active.get(key)
+    if fragment is None:
+        return None
+    from markupsafe import Markup
+    return Markup(fragment)
+
+
+def store_fragment(fragment, key):
+    """
+    template filter storing the rendered fragment under key, returns it
+    unchanged
+    """
+    if active is not None and key is not None:
+        active.set(key, fragment)
+    return fragment
+
+
+FILTERS = {
+    'fragment_key': fragment_key,
+    'cached_fragment': cached_fragment,
+    'store_fragment': store_fragment,
+}
+
+
+def wrapper(template, block_start='{%', block_end='%}', variable_start='{{', variable_end='}}'):
+    """
+    returns the source of the template extending template with the cached
+    any_cell block, in the delimiters of the template's environment
+    """
+    def block(s):
+        return block_start + '- ' + s + ' -' + block_end
+
+    def variable(s):
+        return variable_start + ' ' + s + ' ' + variable_end
+
+    return ''.join([
+        block('extends ' + json.dumps(template)),
+        block('block any_cell'),
+        block('set fragment_key = cell | fragment_key'),
+        block('set fragment = fragment_key | cached_fragment'),
+        block('if fragment is none'),
+        variable('super() | store_fragment(fragment_key)'),
+        block('else'),
+        variable('fragment'),
+        block('endif'),
+        block('endblock any_cell'),
+    ])
+
+
+def install(exporter):
+    """
+    wraps the template of exporter so that its cells are looked up in the
+    active FragmentCache. Exporters without any_cell block, e.g. of
+    templates not derived from the nbconvert skeleton, render as before.
+    """
+    from jinja2 import DictLoader
+
+    template = exporter.template_file
+    if not os.path.splitext(template)[1]:
+        template += exporter.template_extension
+    env = exporter.environment
+    name = WRAPPER + exporter.template_extension
+    source = wrapper(template, env.block_start_string, env.block_end_string,
+                     env.variable_start_string, env.variable_end_string)
+    exporter.extra_loaders = [DictLoader({name: source})] + list(exporter.extra_loaders)
+    exporter.filters = dict(exporter.filters, **FILTERS)
+    exporter.template_file = name
+    return exporter
+
+
+class FragmentCache(object):
+    """ Rendered cell fragments of one notebook by cache key, active while
+        the notebook is rendered.
+        """
+    def __init__(self, filename, context):
+        """
+        Public constructor
+
+        Parameters
+        ----------
+        filename : str
+            JSON file holding the fragments, need not exist yet
+        context :
+            JSON serializable inputs of the rendering besides the cell,
+            e.g. template version, notebook metadata and options
+        """
+        self.filename = filename
+        self.context = hash_data(context)
+        try:
+            with io.open(filename, encoding='utf-8') as f:
+                self.fragments = json.load(f)
+        except (IOError, OSError, ValueError):
+            self.fragments = {}
+        self.used = {}
+        self.hits = 0
+        self.misses = 0
+
+    def __enter__(self):
+        global active
+        active = self
+        return self
+
+    def __exit__(self, type, value, tb):
+        global active
+        active = None
+
+    def key(self, cell):
+        return hash_data(self.context, cell)
+
+    def get(self, key):
+        fragment = self.fragments.get(key)
+        if fragment is not None:
+            self.used[key] = fragment
+            self.hits += 1
+        return fragment
+
+    def set(self, key, fragment):
+        self.used[key] = fragment
+        self.misses += 1
+
+    def save(self):
+        """
+        writes the fragments used by the last rendering, if they differ from
+        the stored ones
+        """
+        if set(self.used) == set(self.fragments):
+            return
+        atomic_write(self.filename, json.dumps(self.used, ensure_ascii=False))
+        self.fragments = dict(self.used)
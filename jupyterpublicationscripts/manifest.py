@@ -0,0 +1,113 @@
+"""Build manifest recording the inputs of every conversion stage
+
+A stage only has to be redone if the hash of its inputs differs from the
+one recorded after its last successful run.
+"""
+from __future__ import print_function
+
+import os
+import io
+import json
+import hashlib
+
+from publicationextensions.atomicfile import atomic_write
+
+
+def hash_data(*parts):
+    """
+    returns a hash of JSON serializable data
+    """
+    data = json.dumps(parts, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+    return hashlib.sha1(data.encode('utf-8')).hexdigest()
+
+
+def hash_files(paths):
+    """
+    returns a hash of the names and contents of the given files, files
+    that do not exist are hashed as empty
+    """
+    h = hashlib.sha1()
+    for path in paths:
+        h.update(path.encode('utf-8') + b'\0')
+        try:
+            with open(path, 'rb') as f:
+                for chunk in iter(lambda: f.read(1 << 16), b''):
+                    h.update(chunk)
+        except (IOError, OSError):
+            pass
+        h.update(b'\0')
+    return h.hexdigest()
+
+
+def hash_dir(path, extensions=None):
+    """
+    returns a hash of all files below path, optionally only of the files
+    ending in one of extensions
+    """
+    paths = []
+    for root, dirs, files in os.walk(path):
+        dirs.sort()
+        for name in sorted(files):
+            if extensions is None or name.endswith(tuple(extensions)):
+                paths.append(os.path.join(root, name))
+    return hash_files(paths)
+
+
+def file_signature(path):
+    """
+    returns modification time and size of a file, a cheap test whether it
+    changed before hashing its content
+    """
+    st = os.stat(path)
+    return [st.st_mtime, st.st_size]
+
+
+class Manifest(object):
+    """ Input hashes of the stages of a single notebook's conversion,
+        stored as JSON and only rewritten if something was recorded.
+        """
+    def __init__(self, filename):
+        """
+        Public constructor
+
+        Parameters
+        ----------
+        filename : str
+            JSON file holding the manifest, need not exist yet
+        """
+        self.filename = filename
+        self.dirty = False
+        try:
+            with io.open(filename, encoding='utf-8') as f:
+                self.data = json.load(f)
+        except (IOError, OSError, ValueError):
+            self.data = {}
+        self.data.setdefault('stages', {})
+
+    def __getitem__(self, key):
+        return self.data.get(key)
+
+    def __setitem__(self, key, value):
+        if self.data.get(key) != value:
+            self.data[key] = value
+            self.dirty = True
+
+    def changed(self, stage, inputs):
+        """
+        returns True if stage has not been run with these inputs before
+        """
+        return self.data['stages'].get(stage) != inputs
+
+    def record(self, stage, inputs):
+        """
+        records a successful run of stage with the given inputs
+        """
+        if self.data['stages'].get(stage) != inputs:
+            self.data['stages'][stage] = inputs
+            self.dirty = True
+
+    def save(self):
+        if not self.dirty:
+            return
+        atomic_write(self.filename, json.dumps(self.data, indent=1, sort_keys=True, ensure_ascii=False))
+        self.dirty = False
@@ -0,0 +1,120 @@
+"""Precompiled publication templates
+
+nbconvert parses and compiles the Jinja templates of an exporter again in
+every process. The exporters of build use a Jinja bytecode cache on disk
+instead, so that a template is only compiled by the first process after it
+changed. Running this command, e.g. at install time, fills the cache for
+the templates in templates/ and the default templates of nbconvert.
+"""
+from __future__ import print_function
+
+import os
+import sys
+import glob
+import logging
+
+log = logging.getLogger(__name__)
+log.setLevel(20)
+
+# output format of the templates by file extension
+FORMATS = {
+    '.tplx': 'latex',
+    '.tpl': 'html',
+}
+
+
+def default_cache_dir():
+    """
+    returns the default bytecode cache directory, following the XDG base
+    directory spec
+    """
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'jupyter-publication-scripts', 'jinja')
+
+
+def install(exporter, directory=None):
+    """
+    makes the Jinja environment of exporter store compiled templates in
+    directory, the template is not cached if it cannot be created
+    """
+    from jinja2 import FileSystemBytecodeCache
+
+    directory = directory or default_cache_dir()
+    try:
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+    except OSError as e:
+        log.warning('Templates are not cached: %s', e)
+        return exporter
+    exporter.environment.bytecode_cache = FileSystemBytecodeCache(directory)
+    return exporter
+
+
+def compile_template(env, name, seen=None):
+    """
+    loads the template name and the templates it extends, includes or
+    imports, which stores them in the bytecode cache of env
+    """
+    from jinja2 import meta
+
+    seen = set() if seen is None else seen
+    if name in seen:
+        return
+    seen.add(name)
+    env.get_template(name)
+    source = env.loader.get_source(env, name)[0]
+    for referenced in meta.find_referenced_templates(env.parse(source)):
+        if referenced:
+            compile_template(env, referenced, seen)
+
+
+def templates():
+    """
+    returns (format, template file) of the publication templates and of the
+    default templates of the formats
+    """
+    from .build import template_dirs
+    found = [(to, None) for to in sorted(set(FORMATS.values()))]
+    for d in template_dirs():
+        for path in sorted(glob.glob(os.path.join(d, '*'))):
+            name, extension = os.path.splitext(os.path.basename(path))
+            if extension in FORMATS and (FORMATS[extension], name) not in found:
+                found.append((FORMATS[extension], name))
+    return found
+
+
+def precompile(config_file=None):
+    """
+    compiles all templates into the bytecode cache, returns the list of
+    (template, error) of the templates that failed to compile. Every
+    template is rendered for an empty notebook first, as some exporters
+    only register the filters of their templates when converting.
+    """
+    import nbformat
+    from .build import get_exporter
+    failed = []
+    for to, template in templates():
+        try:
+            exporter = get_exporter(to, template, config_file)
+            exporter.from_notebook_node(nbformat.v4.new_notebook())
+            compile_template(exporter.environment, exporter.template_file)
+            log.info('Compiled %s', template or 'the default ' + to + ' template')
+        except Exception as e:
+            # e.g. templates of an other nbconvert version
+            failed.append((template, e))
+            log.warning('Could not compile %s: %s: %s', template, type(e).__name__, e)
+    return failed
+
+
+def main(argv=None):
+    import argparse
+    prog = '{} -m jupyterpublicationscripts precompile'.format(os.path.basename(sys.executable))
+    parser = argparse.ArgumentParser(prog=prog,
+                    description='Compile the publication templates into the template cache.')
+    parser.add_argument('-c', '--config', default=None, dest='config_file',
+                    help='additional nbconvert configuration file (.json or .py)')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(format='%(message)s')
+    precompile(args.config_file)
+    return 0
@@ -0,0 +1,192 @@
+"""Typesetting of converted LaTeX files into PDF
+
+Instead of a fixed pdflatex/bibtex/pdflatex/pdflatex sequence, pdflatex is
+rerun only until the auxiliary files it reads back reach a fixed point, and
+bibtex only runs if the cited keys or the bibliography files changed since
+its last run.
+"""
+from __future__ import print_function
+
+import os
+import io
+import re
+import sys
+import json
+import hashlib
+import logging
+import subprocess
+
+from publicationextensions.instrument import stage
+
+log = logging.getLogger(__name__)
+log.setLevel(20)
+
+# files written by one pdflatex pass and read by the next
+AUX_EXTENSIONS = ['.aux', '.toc', '.lof', '.lot', '.out', '.bbl']
+
+# log messages of LaTeX and common packages asking for another pass
+RERUN_RE = re.compile(br'Rerun to get|Please rerun|Please \(re\)run|Label\(s\) may have changed'
+                      br'|Rerun LaTeX|has changed\. Rerun')
+
+# lines of .aux files bibtex depends on
+BIBTEX_AUX_RE = re.compile(r'^\\(citation|bibdata|bibstyle)\{.*\}$|^\\@input\{(.*)\}$', re.MULTILINE)
+
+
+class TypesetError(Exception):
+    pass
+
+
+def run(command, cwd, allowed=(0,)):
+    """
+    runs a TeX tool in cwd and raises TypesetError with its output if it
+    exits with a status not in allowed
+    """
+    proc = subprocess.Popen(command, cwd=cwd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                            stdin=subprocess.PIPE)
+    output, _ = proc.communicate()
+    if proc.returncode not in allowed:
+        raise TypesetError('{} failed:\n{}'.format(' '.join(command),
+                           output.decode('utf-8', 'replace')[-2000:]))
+    return output
+
+
+def file_hash(path):
+    try:
+        with open(path, 'rb') as f:
+            return hashlib.sha1(f.read()).hexdigest()
+    except (IOError, OSError):
+        return None
+
+
+# .aux files of \include'd files, listed in the main .aux file
+INPUT_AUX_RE = re.compile(br'^\\@input\{(.*)\}$', re.MULTILINE)
+
+
+def aux_hashes(cwd, job):
+    hashes = [file_hash(os.path.join(cwd, job + ext)) for ext in AUX_EXTENSIONS]
+    try:
+        with open(os.path.join(cwd, job + '.aux'), 'rb') as f:
+            included = INPUT_AUX_RE.findall(f.read())
+    except (IOError, OSError):
+        included = []
+    return hashes + [file_hash(os.path.join(cwd, aux.decode('utf-8', 'replace'))) for aux in included]
+
+
+def rerun_requested(cwd, job):
+    try:
+        with open(os.path.join(cwd, job + '.log'), 'rb') as f:
+            return RERUN_RE.search(f.read()) is not None
+    except (IOError, OSError):
+        return False
+
+
+def bibtex_inputs(cwd, job):
+    """
+    returns a hash of everything bibtex reads: the citation, style and
+    database lines of the .aux files (following \\@input of included
+    files) and the content of the .bib files
+    """
+    h = hashlib.sha1()
+    auxfiles = [job + '.aux']
+    bibfiles = []
+    while auxfiles:
+        try:
+            with io.open(os.path.join(cwd, auxfiles.pop(0)), encoding='utf-8', errors='replace') as f:
+                aux = f.read()
+        except (IOError, OSError):
+            continue
+        for match in BIBTEX_AUX_RE.finditer(aux):
+            if match.group(2):
+                auxfiles.append(match.group(2))
+                continue
+            h.update(match.group(0).encode('utf-8') + b'\n')
+            if match.group(1) == 'bibdata':
+                bibfiles.extend(match.group(0)[len('\\bibdata{'):-1].split(','))
+    for bib in bibfiles:
+        if not bib.endswith('.bib'):
+            bib += '.bib'
+        h.update((file_hash(os.path.join(cwd, bib)) or '').encode('utf-8'))
+    return h.hexdigest()
+
+
+def typeset(texfile, bibtex=True, max_passes=5, strict=False):
+    """
+    typesets texfile into a PDF next to it and returns the PDF filename.
+
+    pdflatex is rerun as long as the auxiliary files change between passes
+    or the log asks for a rerun. If bibtex is True, bibtex runs whenever the
+    citations or bibliography files differ from its previous run, which is
+    recorded in <job>.jps-typeset.json.
+
+    pdflatex exits with an error status on any LaTeX error, even if it
+    wrote the PDF. Unless strict is True, this is only a warning as long as
+    the PDF was written, a pass that writes no PDF raises TypesetError.
+    """
+    cwd = os.path.dirname(os.path.abspath(texfile))
+    job = os.path.splitext(os.path.basename(texfile))[0]
+    pdflatex = ['pdflatex', '-interaction=nonstopmode', job + '.tex']
+    statefile = os.path.join(cwd, job + '.jps-typeset.json')
+    try:
+        with io.open(statefile, encoding='utf-8') as f:
+            state = json.load(f)
+    except (IOError, OSError, ValueError):
+        state = {}
+
+    pdf = os.path.join(cwd, job + '.pdf')
+    errors = None
+    passes = 0
+    while True:
+        before = aux_hashes(cwd, job)
+        written = os.path.getmtime(pdf) if os.path.exists(pdf) else None
+        with stage('typeset.pdflatex'):
+            try:
+                run(pdflatex, cwd)
+                errors = None
+            except TypesetError as e:
+                if strict or not os.path.exists(pdf) or os.path.getmtime(pdf) == written:
+                    raise
+                errors = e
+        passes += 1
+        if bibtex:
+            inputs = bibtex_inputs(cwd, job)
+            if inputs != state.get('bibtex') or not os.path.exists(os.path.join(cwd, job + '.bbl')):
+                # bibtex exits with 1 on warnings, e.g. missing fields
+                with stage('typeset.bibtex'):
+                    run(['bibtex', job], cwd, allowed=(0, 1))
+                state['bibtex'] = inputs
+                with io.open(statefile, 'w', encoding='utf-8') as f:
+                    f.write(json.dumps(state, ensure_ascii=False))
+        if aux_hashes(cwd, job) == before and not rerun_requested(cwd, job):
+            break
+        if passes >= max_passes:
+            log.warning('%s did not converge after %d pdflatex passes', texfile, passes)
+            break
+    if errors is not None:
+        log.warning('%s has LaTeX errors, the PDF may be incomplete: %s', texfile, errors)
+    log.info('%s typeset in %d pdflatex pass%s', texfile, passes, '' if passes == 1 else 'es')
+    return pdf
+
+
+def main(argv=None):
+    import argparse
+    prog = '{} -m jupyterpublicationscripts typeset'.format(os.path.basename(sys.executable))
+    parser = argparse.ArgumentParser(prog=prog,
+                    description='Typeset LaTeX files with as few pdflatex and bibtex runs as possible.')
+    parser.add_argument('texfiles', nargs='+', metavar='<file.tex>', help='LaTeX files to typeset')
+    parser.add_argument('--no-bibtex', action='store_false', dest='bibtex',
+                    help='never run bibtex')
+    parser.add_argument('--max-passes', type=int, default=5,
+                    help='maximum number of pdflatex passes (default: 5)')
+    parser.add_argument('--strict', action='store_true',
+                    help='fail on LaTeX errors, even if pdflatex wrote the PDF')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(format='%(message)s')
+    status = 0
+    for texfile in args.texfiles:
+        try:
+            typeset(texfile, args.bibtex, args.max_passes, args.strict)
+        except TypesetError as e:
+            log.error(str(e))
+            status = 1
+    return status
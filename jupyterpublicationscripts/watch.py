@@ -0,0 +1,255 @@
+"""Continuous conversion of notebooks whenever they are saved
+
+After an initial build, the notebooks are watched for changes and every
+saved notebook is converted again in this process. Exporters, templates,
+preprocessors, citation styles and the reference store are loaded once and
+kept warm, and the build manifest and the caches of the preprocessors make
+sure that only the stages and cells that changed are redone.
+
+Changes are detected with watchdog if it is installed, otherwise by
+polling the modification times of the notebooks. A save usually produces
+several file system events, a notebook is converted once no further event
+arrived for the debounce delay.
+"""
+from __future__ import print_function
+
+import os
+import sys
+import time
+import logging
+import threading
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+from .build import (add_arguments, build, convert_notebook, find_notebooks, get_exporter, get_preprocessors,
+                    get_instrumentation, update_references, report, summary, CACHE_DIR, DEFAULT_TEMPLATES)
+from .manifest import file_signature
+from publicationextensions.instrument import stage
+
+log = logging.getLogger(__name__)
+log.setLevel(20)
+
+
+def watched(path, paths):
+    """
+    returns True if path is a notebook given in paths or found below one of
+    its directories by find_notebooks
+    """
+    path = os.path.abspath(path)
+    if not path.endswith('.ipynb'):
+        return False
+    parts = path.split(os.sep)
+    if '.ipynb_checkpoints' in parts or CACHE_DIR in parts:
+        return False
+    for p in paths:
+        p = os.path.abspath(p)
+        if path == p or (os.path.isdir(p) and path.startswith(p.rstrip(os.sep) + os.sep)):
+            return True
+    return False
+
+
+def snapshot(paths):
+    """
+    returns the file signatures of all notebooks by path
+    """
+    signatures = {}
+    for path in find_notebooks(paths):
+        try:
+            signatures[path] = file_signature(path)
+        except OSError:
+            # removed while walking the directories
+            pass
+    return signatures
+
+
+def poll(paths, changes, interval, stopped):
+    """
+    puts the notebooks whose signature changed into the changes queue every
+    interval seconds, until stopped is set
+    """
+    signatures = snapshot(paths)
+    while not stopped.wait(interval):
+        current = snapshot(paths)
+        for path, signature in current.items():
+            if signatures.get(path) != signature:
+                changes.put(path)
+        for path in set(signatures) - set(current):
+            changes.put(path)
+        signatures = current
+
+
+def observe(paths, changes):
+    """
+    returns a started watchdog observer putting the changed notebooks into
+    the changes queue, raises ImportError without watchdog
+    """
+    from watchdog.observers import Observer
+    from watchdog.events import FileSystemEventHandler
+
+    class Handler(FileSystemEventHandler):
+        def on_any_event(self, event):
+            if event.is_directory:
+                return
+            # notebooks are saved by writing a temporary file and moving it
+            for path in (getattr(event, 'dest_path', None), event.src_path):
+                if path and watched(path, paths):
+                    changes.put(os.path.abspath(path))
+
+    observer = Observer()
+    handler = Handler()
+    for path in paths:
+        if os.path.isdir(path):
+            observer.schedule(handler, path, recursive=True)
+        else:
+            observer.schedule(handler, os.path.dirname(os.path.abspath(path)), recursive=False)
+    observer.start()
+    return observer
+
+
+def debounced(changes, delay):
+    """
+    returns the set of notebooks changed in the next burst of changes, that
+    is once no change arrived for delay seconds
+    """
+    batch = set([changes.get()])
+    while True:
+        try:
+            batch.add(changes.get(timeout=delay))
+        except queue.Empty:
+            return batch
+
+
+def warm_up(to, template, config_file):
+    """
+    loads the exporter with its template, the preprocessors and the citation
+    style, so that the first conversion after a save does not pay for them
+    """
+    exporter = get_exporter(to, template, config_file)
+    try:
+        # loaded lazily on first use by nbconvert
+        getattr(exporter, 'template')
+    except Exception:
+        pass
+    for preprocessor in get_preprocessors(config_file):
+        if hasattr(preprocessor, 'citation_style') and 'html' in exporter.file_extension:
+            from pre_cite2c import get_style
+            get_style(preprocessor.citation_style, preprocessor.citation_locale)
+
+
+def convert(changed, paths, notebooks, **options):
+    """
+    converts the changed notebooks in this process, after recording their
+    references in the reference store, and returns the results. notebooks
+    is the set of notebooks found in paths. If notebooks were added or
+    removed, it is updated and the removed ones are dropped from the store.
+    """
+    existing = set(path for path in changed if os.path.exists(path))
+    retain = None
+    if notebooks.intersection(changed) - existing or existing - notebooks:
+        notebooks.clear()
+        notebooks.update(find_notebooks(paths))
+        retain = sorted(notebooks)
+    changed = sorted(existing.intersection(notebooks))
+    if changed or retain is not None:
+        with stage('build.references'):
+            update_references(changed, options.get('config_file'), retain)
+    instrumentation = get_instrumentation(options.get('config_file'))
+    results = []
+    for path in changed:
+        result = convert_notebook(path, **options)
+        if result['instrumentation']:
+            instrumentation.merge(os.path.splitext(os.path.basename(path))[0], result['instrumentation'])
+        report(result)
+        results.append(result)
+    return results
+
+
+def watch(paths, jobs=None, debounce=0.3, interval=1.0, polling=False, initial=True, verbose=False, **options):
+    """
+    converts the notebooks found in paths whenever they change, until
+    interrupted
+
+    Parameters
+    ----------
+    paths : list
+        notebooks or directories to search for notebooks
+    jobs : int
+        worker processes of the initial build
+    debounce : float
+        seconds without further changes before a notebook is converted
+    interval : float
+        seconds between two looks at the notebooks when polling
+    polling : bool
+        poll the modification times even if watchdog is installed
+    initial : bool
+        build all notebooks that are not up to date before watching
+    verbose : bool
+        print full tracebacks of failed notebooks
+    options
+        passed on to convert_notebook
+    """
+    notebooks = set(find_notebooks(paths))
+    if initial:
+        start = time.time()
+        print(summary(build(sorted(notebooks), jobs=jobs, **options), time.time() - start, verbose))
+    warm_up(options.get('to', 'latex'), options.get('template'), options.get('config_file'))
+
+    changes = queue.Queue()
+    stopped = threading.Event()
+    observer = None
+    if not polling:
+        try:
+            observer = observe(paths, changes)
+        except ImportError:
+            log.info('watchdog is not installed, polling for changes every %.1f s', interval)
+    if observer is None:
+        poller = threading.Thread(target=poll, args=(paths, changes, interval, stopped))
+        poller.daemon = True
+        poller.start()
+
+    log.info('Watching %s, press Ctrl-C to stop', ', '.join(paths))
+    try:
+        while True:
+            changed = debounced(changes, debounce)
+            start = time.time()
+            results = convert(changed, paths, notebooks, **options)
+            if results:
+                print(summary(results, time.time() - start, verbose))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stopped.set()
+        if observer is not None:
+            observer.stop()
+            observer.join()
+    return 0
+
+
+def main(argv=None):
+    import argparse
+    prog = '{} -m jupyterpublicationscripts watch'.format(os.path.basename(sys.executable))
+    parser = argparse.ArgumentParser(prog=prog,
+                    description='Convert notebooks whenever they are saved.')
+    add_arguments(parser)
+    parser.add_argument('--debounce', type=float, default=0.3,
+                    help='seconds without further changes before converting a notebook (default: 0.3)')
+    parser.add_argument('--interval', type=float, default=1.0,
+                    help='seconds between two looks at the notebooks when polling (default: 1.0)')
+    parser.add_argument('--polling', action='store_true',
+                    help='poll for changes even if watchdog is installed')
+    parser.add_argument('--no-initial', action='store_false', dest='initial',
+                    help='do not build the notebooks before watching them')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(format='%(message)s')
+    if not find_notebooks(args.paths):
+        parser.error('no notebooks found')
+
+    return watch(args.paths, jobs=args.jobs, debounce=args.debounce, interval=args.interval,
+                 polling=args.polling, initial=args.initial, verbose=args.verbose, to=args.to,
+                 template=args.template or DEFAULT_TEMPLATES.get(args.to), output_dir=args.output_dir,
+                 config_file=args.config_file, pdf=args.pdf, force=args.force, fragments=args.fragments,
+                 spill=args.spill)
@@ -1,5 +1,116 @@
 # class PrettyTable
-import collections
+import sys
+import itertools
+try:
+    from collections.abc import Iterable
+except ImportError:
+    from collections import Iterable
+
+from .instrument import stage
+
+
+def _chunks(rows, chunksize):
+    """ Yields lists of at most chunksize rows from an iterable of rows. """
+    rows = iter(rows)
+    while True:
+        chunk = list(itertools.islice(rows, chunksize))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _array_columns(data):
+    """ Returns the header and the columns of a numpy array or pandas DataFrame,
+        or None for any other input. Neither package is imported here, if it is
+        not loaded yet the data cannot be one of its types.
+        """
+    np = sys.modules.get("numpy")
+    if np is not None and isinstance(data, np.ndarray) and data.ndim in (1, 2):
+        if data.ndim == 1:
+            return None, [data]
+        return None, [data[:, j] for j in range(data.shape[1])]
+    pd = sys.modules.get("pandas")
+    if pd is not None and isinstance(data, pd.DataFrame):
+        return ([format(c) for c in data.columns],
+                [data.iloc[:, j].to_numpy() for j in range(data.shape[1])])
+    return None
+
+
+def _column_formats(formatstring, ncols):
+    """ Returns the format string of each of ncols columns, formatstring is
+        either a single format string or a list with one per column.
+        """
+    if isinstance(formatstring, (list, tuple)):
+        if len(formatstring) != ncols:
+            raise ValueError("Format string list must have same length as data has columns.")
+        return list(formatstring)
+    return [formatstring] * ncols
+
+
+def _format_column(column, formatstring):
+    """ Formats a whole numpy column. tolist() converts all elements to
+        Python scalars in one go, which format() handles much faster than
+        numpy scalars; this also beats numpy's own string conversions
+        (astype(str), np.char.mod).
+        """
+    return list(map(format, column.tolist(), itertools.repeat(formatstring)))
+
+
+def iter_html(rows, chunksize=1000):
+    """ Yields the HTML table of rows in pieces of chunksize rows. """
+    yield "<table>"
+    for chunk in _chunks(rows, chunksize):
+        yield ''.join("<tr>" + ''.join("<td>{0}</td>".format(col) for col in row) + "</tr>" for row in chunk)
+    yield "</table>"
+
+
+def iter_latex_tabular(rows, span_page=False, chunksize=1000):
+    """ Yields the LaTeX tabular environment of rows in pieces of chunksize rows,
+        nothing if there are no rows.
+        """
+    rows = iter(rows)
+    first = next(rows, None)
+    if first is None:
+        return
+    if span_page:
+        yield "\\begin{table*}"
+    else:
+        yield "\\begin{table}[ht]"
+    yield "\\begin{tabular}"
+    yield "{"+"|".join((["l"]*len(first)))+"}\n"
+    yield " & ".join(map(format, first)) + "\\\\ \n" + "\\hline \n"
+    for chunk in _chunks(rows, chunksize):
+        yield ''.join(" & ".join(map(format, row)) + "\\\\ \n" for row in chunk)
+    yield "\\end{tabular}"
+    if span_page:
+        yield "\\end{table*}"
+    else:
+        yield "\\end{table}"
+
+
+def iter_latex_longtable(rows, span_page=False, chunksize=1000):
+    """ Yields the LaTeX longtable environment of rows in pieces of chunksize rows,
+        nothing if there are no rows.
+        """
+    rows = iter(rows)
+    first = next(rows, None)
+    if first is None:
+        return
+    if span_page:
+        yield "\\begin{longtable*}[c]{@{}"
+    else:
+        yield "\\begin{longtable}[c]{@{}"
+    yield "".join((["l"]*len(first)))
+    yield "@{}}\n"
+    yield "\\toprule\\addlinespace\n"
+    yield " & ".join(map(format, first)) + "\\\\\\addlinespace \n" + "\\midrule\\endhead\n"
+    for chunk in _chunks(rows, chunksize):
+        yield ''.join(" & ".join(map(format, row)) + "\\\\\\addlinespace \n" for row in chunk)
+    if span_page:
+        yield "\\bottomrule \n \\end{longtable*}"
+    else:
+        yield "\\bottomrule \n \\end{longtable}"
+
 
 class PrettyTable(list):
     """ Overridden list class which takes a 2-dimensional list of
@@ -7,93 +118,164 @@ class PrettyTable(list):
         IPython Notebook. For LaTeX export two styles can be chosen.
         If the list is one dimensional it is converted to a single-column list, extra_header may
         then be either a list containing a single element or a string.
+        For tables too large to be held in memory use PrettyTable.stream.
         """
-    def __init__(self, initlist=[], extra_header=None, print_latex_longtable=True, 
+    def __init__(self, initlist=[], extra_header=None, print_latex_longtable=True,
             span_page=False, formatstring=""):
         """
         Public constructor
 
         Parameters
         ----------
-        initlist : list
-            list to be converted into pretty table
+        initlist : list, numpy.ndarray or pandas.DataFrame
+            list to be converted into pretty table, arrays and DataFrames are formatted column-wise
         extra_header : list
-            list of captions for each column of initlist, can also be a string for one dimensional lists
+            list of captions for each column of initlist, can also be a string for one dimensional lists.
+            defaults to the column names for DataFrames
         print_latex_longtable : bool
             if True create longtable in latex representation, otherwise output a simple tabular environment
         span_page : bool
             if True make table span the page using tge table* environment
-        formatstring : str
-            custom format string for number conversion
+        formatstring : str or list
+            custom format string for number conversion, or a list of format strings, one per column
         """
         self.print_latex_longtable = print_latex_longtable
         self.span_page = span_page
         self.formatstring = formatstring
-        if not isinstance(initlist[0], collections.Iterable):
-            initlist = list(map(lambda x: [x], initlist))
-            if isinstance(extra_header, str):
-                extra_header = [extra_header]
-        if extra_header is not None:
-            if len(initlist[0]) != len(extra_header):
+        if isinstance(extra_header, str):
+            extra_header = [extra_header]
+
+        array = _array_columns(initlist)
+        if array is not None:
+            header, columns = array
+            if extra_header is None:
+                extra_header = header
+            if extra_header is not None and len(columns) != len(extra_header):
                 raise ValueError("Header list must have same length as data has columns.")
-            initlist = [extra_header]+list(map(lambda x: list(map(lambda xx: format(xx, self.formatstring), x)), initlist))
-#            initlist = [extra_header] + [format(xx, self.formatstring) for x in initlist for xx in x]
-        super(PrettyTable, self).__init__(initlist)
+            formats = _column_formats(self.formatstring, len(columns))
+            rows = list(zip(*[_format_column(c, f) for c, f in zip(columns, formats)]))
+            super(PrettyTable, self).__init__(rows if extra_header is None else [extra_header] + rows)
+            return
+
+        initlist = list(initlist)
+        if not initlist:
+            super(PrettyTable, self).__init__([] if extra_header is None else [extra_header])
+            return
+        if not isinstance(initlist[0], Iterable):
+            initlist = list(map(lambda x: [x], initlist))
+        if extra_header is not None and len(initlist[0]) != len(extra_header):
+            raise ValueError("Header list must have same length as data has columns.")
+        formats = _column_formats(self.formatstring, len(initlist[0]))
+        rows = [list(map(format, x, formats)) for x in initlist]
+        super(PrettyTable, self).__init__(rows if extra_header is None else [extra_header] + rows)
+
+    @staticmethod
+    def stream(rows, extra_header=None, print_latex_longtable=True, span_page=False,
+            formatstring="", chunksize=1000):
+        """
+        Returns a StreamingTable rendering any iterable or generator of rows
+        lazily, see StreamingTable for the parameters.
+        """
+        return StreamingTable(rows, extra_header, print_latex_longtable, span_page, formatstring, chunksize)
 
     def latex_table_tabular(self):
-        latex = []
-        if self.span_page:
-            latex.append("\\begin{table*}")
-        else:
-            latex.append("\\begin{table}[ht]")
-        latex.append("\\begin{tabular}")
-        latex.append("{"+"|".join((["l"]*len(self[0])))+"}\n")
-        first = True
-        for row in self:
-            latex.append(" & ".join(map(format, row)))
-            latex.append("\\\\ \n")
-            if first:
-                latex.append("\\hline \n")
-                first = False
-        latex.append("\\end{tabular}")
-        if self.span_page:
-            latex.append("\\end{table*}")
-        else:
-            latex.append("\\end{table}")
-        return ''.join(latex)
+        with stage("prettytable.latex"):
+            return ''.join(iter_latex_tabular(self, self.span_page))
     def latex_longtable(self):
-        latex = []
-        if self.span_page:
-            latex.append("\\begin{longtable*}[c]{@{}")
-        else:
-            latex.append("\\begin{longtable}[c]{@{}")
-        latex.append("".join((["l"]*len(self[0]))))
-        latex.append("@{}}\n")
-        latex.append("\\toprule\\addlinespace\n")
-        first = True
-        for row in self:
-            latex.append(" & ".join(map(format, row)))
-            latex.append("\\\\\\addlinespace \n")
-            if first:
-                latex.append("\\midrule\\endhead\n")
-                first = False
-        if self.span_page:
-            latex.append("\\bottomrule \n \\end{longtable*}")
-        else:
-            latex.append("\\bottomrule \n \\end{longtable}")
-        return ''.join(latex)
+        with stage("prettytable.latex"):
+            return ''.join(iter_latex_longtable(self, self.span_page))
 
     def _repr_html_(self):
-        html = ["<table>"]
-        for row in self:
-            html.append("<tr>")
-            for col in row:
-                html.append("<td>{0}</td>".format(col))
-            html.append("</tr>")
-        html.append("</table>")
-        return ''.join(html)
+        with stage("prettytable.html"):
+            return ''.join(iter_html(self))
     def _repr_latex_(self):
         if self.print_latex_longtable:
             return self.latex_longtable()
         else:
             return self.latex_table_tabular()
+
+
+class StreamingTable(object):
+    """ Table rendered lazily from an iterable or generator of rows, e.g.
+        rows read from a file, so that HTML and LaTeX output can be written
+        without holding the table, or its string form, in memory. Rows are
+        formatted and rendered in chunks while they are consumed, so the
+        table can only be rendered once if rows is an iterator.
+        """
+    def __init__(self, rows, extra_header=None, print_latex_longtable=True, span_page=False,
+            formatstring="", chunksize=1000):
+        """
+        Public constructor
+
+        Parameters
+        ----------
+        rows : iterable
+            rows of the table, single values are rendered as a single-column table
+        extra_header : list
+            list of captions for each column of rows, can also be a string for single-column tables
+        print_latex_longtable : bool
+            if True create longtable in latex representation, otherwise output a simple tabular environment
+        span_page : bool
+            if True make table span the page using tge table* environment
+        formatstring : str or list
+            custom format string for number conversion, or a list of format strings, one per column
+        chunksize : int
+            number of rows rendered into a single string
+        """
+        self.rows = rows
+        self.extra_header = extra_header
+        self.print_latex_longtable = print_latex_longtable
+        self.span_page = span_page
+        self.formatstring = formatstring
+        self.chunksize = chunksize
+
+    def __iter__(self):
+        """ Yields the header, if any, and the formatted rows. """
+        rows = iter(self.rows)
+        first = next(rows, None)
+        extra_header = self.extra_header
+        if isinstance(extra_header, str):
+            extra_header = [extra_header]
+        if first is None:
+            if extra_header is not None:
+                yield extra_header
+            return
+        rows = itertools.chain([first], rows)
+        if not isinstance(first, Iterable) or isinstance(first, str):
+            first = [first]
+            rows = ([x] for x in rows)
+        if extra_header is not None:
+            if len(first) != len(extra_header):
+                raise ValueError("Header list must have same length as data has columns.")
+            yield extra_header
+        formats = _column_formats(self.formatstring, len(first))
+        for row in rows:
+            yield list(map(format, row, formats))
+
+    def iter_html(self):
+        return iter_html(self, self.chunksize)
+
+    def iter_latex(self):
+        if self.print_latex_longtable:
+            return iter_latex_longtable(self, self.span_page, self.chunksize)
+        else:
+            return iter_latex_tabular(self, self.span_page, self.chunksize)
+
+    def write_html(self, f):
+        """ Writes the HTML table to the file object f chunk by chunk. """
+        with stage("prettytable.html"):
+            for chunk in self.iter_html():
+                f.write(chunk)
+
+    def write_latex(self, f):
+        """ Writes the LaTeX table to the file object f chunk by chunk. """
+        with stage("prettytable.latex"):
+            for chunk in self.iter_latex():
+                f.write(chunk)
+
+    def _repr_html_(self):
+        with stage("prettytable.html"):
+            return ''.join(self.iter_html())
+    def _repr_latex_(self):
+        with stage("prettytable.latex"):
+            return ''.join(self.iter_latex())
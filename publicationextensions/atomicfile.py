@@ -0,0 +1,96 @@
+"""Atomic file replacement
+
+Files read by concurrent conversions, e.g. a project .bib file, manifests
+or the figures of the figure store, are written to a temporary file in the
+same directory that then replaces them, so that a reader never sees a
+partially written file. The temporary file gets the permissions and the
+owner of the file it replaces or, for a new file, the permissions the
+umask gives new files, instead of the private mode of mkstemp.
+"""
+from __future__ import print_function
+
+import os
+import io
+import errno
+import stat
+import tempfile
+from contextlib import contextmanager
+
+# os.replace overwrites existing files on all platforms, but is Python 3 only
+replace = getattr(os, 'replace', os.rename)
+
+# the umask can only be read by setting it, this is done once on import
+_umask = os.umask(0o022)
+os.umask(_umask)
+
+
+def _set_permissions(tmp, filename):
+    """
+    gives tmp the mode and owner of filename or, if it does not exist, the
+    mode of a new file
+    """
+    try:
+        st = os.stat(filename)
+    except OSError:
+        os.chmod(tmp, 0o666 & ~_umask)
+        return
+    os.chmod(tmp, stat.S_IMODE(st.st_mode))
+    if hasattr(os, 'chown'):
+        current = os.stat(tmp)
+        if (current.st_uid, current.st_gid) != (st.st_uid, st.st_gid):
+            try:
+                os.chown(tmp, st.st_uid, st.st_gid)
+            except OSError:
+                # only root may give files away
+                pass
+
+
+@contextmanager
+def atomic_file(filename, mode='w', encoding='utf-8'):
+    """
+    context manager returning a file opened with mode ('w' or 'wb') that
+    replaces filename when the context is left without an exception
+    """
+    dirname = os.path.dirname(filename)
+    if dirname:
+        try:
+            os.makedirs(dirname)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+    fd, tmp = tempfile.mkstemp(dir=dirname or '.', suffix='.tmp')
+    try:
+        with io.open(fd, mode, encoding=None if 'b' in mode else encoding) as f:
+            yield f
+        _set_permissions(tmp, filename)
+        replace(tmp, filename)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+
+
+def atomic_write(filename, data, encoding='utf-8'):
+    """
+    replaces filename by a file holding data, bytes or text
+    """
+    with atomic_file(filename, 'wb' if isinstance(data, bytes) else 'w', encoding) as f:
+        f.write(data)
+
+
+def write_if_changed(filename, text):
+    """
+    writes text to filename unless the file already has exactly this
+    content, so that its modification time only changes with its content.
+    Returns True if the file was written, which is done atomically.
+    """
+    try:
+        with io.open(filename, encoding='utf-8') as f:
+            if f.read() == text:
+                return False
+    except (IOError, OSError):
+        pass
+    atomic_write(filename, text)
+    return True
@@ -0,0 +1,66 @@
+"""Per-stage timing and profiling of the publication conversion
+
+Stages are named pieces of work, e.g. citeproc formatting or template
+rendering, recorded per notebook with their call count, wall time and peak
+memory. Instrumentation is off by default and enabled through the
+configuration, e.g. in jupyter_nbconvert_config.py:
+
+    c.Instrumentation.enabled = True
+    c.Instrumentation.report_file = 'instrumentation.json'
+    c.Instrumentation.profile_dir = 'profiles'
+
+Code marks its stages with
+
+    with stage('citeproc'):
+        ...
+
+which costs a single function call while instrumentation is disabled.
+The Instrumentation itself is defined in publicationextensions.instrumentation
+and only imported by get_instrumentation, so that PrettyTable and the command
+line do not pay for importing traitlets.
+"""
+from __future__ import print_function
+
+# the Instrumentation of this process, if it was created
+active = None
+
+
+class _Disabled(object):
+    """ context manager doing nothing, returned while instrumentation is disabled """
+    def __enter__(self):
+        pass
+    def __exit__(self, *exc_info):
+        return False
+
+_disabled = _Disabled()
+
+
+def get_instrumentation(config=None):
+    """
+    returns the Instrumentation, created with config on first use
+    """
+    if active is not None:
+        return active
+    from .instrumentation import Instrumentation
+    return Instrumentation.instance(config=config) if config is not None else Instrumentation.instance()
+
+
+def stage(name):
+    """
+    returns a context manager recording name as a stage of the current
+    notebook, or doing nothing if instrumentation is disabled or was not
+    set up with get_instrumentation
+    """
+    if active is not None and active.enabled:
+        return active.stage(name)
+    return _disabled
+
+
+def notebook(name):
+    """
+    returns a context manager attributing the stages recorded in it to
+    notebook name
+    """
+    if active is not None and active.enabled:
+        return active.notebook(name)
+    return _disabled
@@ -0,0 +1,177 @@
+"""The Instrumentation recording the stages of a conversion, see
+publicationextensions.instrument
+"""
+from __future__ import print_function
+
+import os
+import io
+import json
+import time
+import atexit
+from contextlib import contextmanager
+
+from traitlets import Bool, Unicode
+from traitlets.config import SingletonConfigurable
+
+from . import instrument
+
+try:
+    import tracemalloc
+except ImportError:
+    # Python 2, peak memory is not recorded
+    tracemalloc = None
+
+try:
+    from multiprocessing import parent_process
+except ImportError:
+    parent_process = lambda: None
+
+# name of the notebook of stages recorded outside of any notebook
+GLOBAL = '-'
+
+
+class Instrumentation(SingletonConfigurable):
+    """ Records stages per notebook, see publicationextensions.instrument. """
+
+    enabled = Bool(False,
+        help="Record wall time, call counts and peak memory of the conversion stages").tag(config=True)
+    trace_memory = Bool(True,
+        help="Record peak memory with tracemalloc, which slows down Python code considerably").tag(config=True)
+    report_file = Unicode('',
+        help="JSON file receiving the report when the process exits, empty to disable").tag(config=True)
+    profile_dir = Unicode('',
+        help="Directory receiving a cProfile dump <notebook>.prof of the stages of every notebook, "
+             "empty to disable").tag(config=True)
+
+    def __init__(self, **kw):
+        super(Instrumentation, self).__init__(**kw)
+        # notebook -> stage -> {'calls', 'seconds', 'peak_memory'}
+        self.stats = {}
+        self.notebooks = [GLOBAL]
+        # number of open stages, and their [start memory, highest peak seen so far]
+        self.depth = 0
+        self.frames = []
+        self.profiles = {}
+        instrument.active = self
+        # worker processes change their working directory
+        self.report_file = self.report_file and os.path.abspath(self.report_file)
+        self.profile_dir = self.profile_dir and os.path.abspath(self.profile_dir)
+        if self.enabled and self.trace_memory and tracemalloc is not None and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        # worker processes return their stats to the main process instead
+        if self.enabled and (self.report_file or self.profile_dir) and parent_process() is None:
+            atexit.register(self.save)
+
+    @contextmanager
+    def notebook(self, name):
+        """
+        context manager attributing the stages recorded in it to notebook name
+        """
+        self.notebooks.append(name)
+        try:
+            yield
+        finally:
+            self.notebooks.pop()
+
+    @contextmanager
+    def stage(self, name):
+        """
+        context manager recording name as a stage of the current notebook.
+        Nested stages are recorded separately, and included in the time and
+        memory of the enclosing stage.
+        """
+        notebook = self.notebooks[-1]
+        tracing = tracemalloc is not None and tracemalloc.is_tracing()
+        if tracing:
+            current, peak = tracemalloc.get_traced_memory()
+            if self.frames:
+                self.frames[-1][1] = max(self.frames[-1][1], peak)
+            if hasattr(tracemalloc, 'reset_peak'):
+                tracemalloc.reset_peak()
+            self.frames.append([current, current])
+        # only the outermost stage switches the profiler
+        profile = None
+        if self.profile_dir and self.depth == 0:
+            if notebook not in self.profiles:
+                import cProfile
+                self.profiles[notebook] = cProfile.Profile()
+            profile = self.profiles[notebook]
+            profile.enable()
+        self.depth += 1
+        start = time.time()
+        try:
+            yield
+        finally:
+            seconds = time.time() - start
+            self.depth -= 1
+            if profile is not None:
+                profile.disable()
+            stats = self.stats.setdefault(notebook, {}).setdefault(name,
+                        {'calls': 0, 'seconds': 0.0, 'peak_memory': None})
+            stats['calls'] += 1
+            stats['seconds'] += seconds
+            if tracing:
+                start_memory, peak = self.frames.pop()
+                peak = max(peak, tracemalloc.get_traced_memory()[1])
+                if self.frames:
+                    self.frames[-1][1] = max(self.frames[-1][1], peak)
+                stats['peak_memory'] = max(stats['peak_memory'] or 0, peak - start_memory)
+
+    def pop(self, notebook):
+        """
+        returns and removes the stats of notebook, e.g. to send them from a
+        worker process to the main process. Its profile, if any, is dumped.
+        """
+        if notebook in self.profiles:
+            self.dump_profile(notebook)
+        return self.stats.pop(notebook, {})
+
+    def merge(self, notebook, stats):
+        """
+        adds stats as returned by pop to the stats of notebook
+        """
+        mine = self.stats.setdefault(notebook, {})
+        for name, s in stats.items():
+            if name not in mine:
+                mine[name] = dict(s)
+                continue
+            mine[name]['calls'] += s['calls']
+            mine[name]['seconds'] += s['seconds']
+            if s['peak_memory'] is not None:
+                mine[name]['peak_memory'] = max(mine[name]['peak_memory'] or 0, s['peak_memory'])
+
+    def report(self):
+        """
+        returns the recorded stats per notebook and their totals per stage
+        """
+        totals = {}
+        for notebook, stats in self.stats.items():
+            for name, s in stats.items():
+                total = totals.setdefault(name, {'calls': 0, 'seconds': 0.0, 'peak_memory': None})
+                total['calls'] += s['calls']
+                total['seconds'] += s['seconds']
+                if s['peak_memory'] is not None:
+                    total['peak_memory'] = max(total['peak_memory'] or 0, s['peak_memory'])
+        return {'notebooks': self.stats, 'stages': totals}
+
+    def save(self, filename=None):
+        """
+        writes the report as JSON to filename, by default report_file, and
+        the pending cProfile dumps
+        """
+        filename = filename or self.report_file
+        if filename:
+            with io.open(filename, 'w', encoding='utf-8') as f:
+                f.write(json.dumps(self.report(), indent=1, sort_keys=True, ensure_ascii=False))
+        for notebook in list(self.profiles):
+            self.dump_profile(notebook)
+
+    def dump_profile(self, notebook):
+        """
+        writes the cProfile statistics of notebook to profile_dir, cumulated
+        over all stages recorded for it
+        """
+        if not os.path.isdir(self.profile_dir):
+            os.makedirs(self.profile_dir)
+        profile = self.profiles.pop(notebook)
+        profile.dump_stats(os.path.join(self.profile_dir, notebook + '.prof'))
@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+
+"""Jinja filters for the publication templates
+
+re_replace is registered in example/jupyter_nbconvert_config.py and used by
+the templates to insert captions and labels into the LaTeX of PrettyTable
+outputs:
+
+    ((( (output.data['text/latex'], "(\\\\end{[a-z]*table.*})", "\\caption{...}\\1") | re_replace )))
+"""
+
+from __future__ import print_function
+
+import re
+
+# backslashes of the replacement not starting a group reference
+LITERAL_BACKSLASH_RE = re.compile(r"\\(?!\d|g<)")
+
+# compiled patterns and escaped replacements, the templates use a handful of
+# them for every cell
+_patterns = {}
+_replacements = {}
+
+
+def re_replace(args):
+    """
+    returns text with all matches of pattern replaced by replacement. Group
+    references (\\1, \\g<name>) in replacement are expanded as by re.sub, all
+    other backslashes are kept, so that LaTeX commands can be inserted.
+
+    Parameters
+    ----------
+    args : tuple
+        (text, pattern, replacement)
+    """
+    text, pattern, replacement = args
+    try:
+        compiled = _patterns[pattern]
+    except KeyError:
+        compiled = _patterns[pattern] = re.compile(pattern)
+    try:
+        escaped = _replacements[replacement]
+    except KeyError:
+        escaped = _replacements[replacement] = LITERAL_BACKSLASH_RE.sub(r"\\\\", replacement)
+    return compiled.sub(escaped, text)
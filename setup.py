@@ -5,11 +5,17 @@ setup(name = 'jupyter-publication-scripts',
       maintainer = 'Alexander Schlaich',
       maintainer_email = 'aschlaich@physik.fu-berlin.de',
       download_url = 'https://github.com/schlaicha/jupyter-publication-scripts',
-      py_modules = ['publicationextensions.PrettyTable', 'publicationextensions.replace'],
+      py_modules = ['publicationextensions.PrettyTable', 'publicationextensions.replace',
+                    'publicationextensions.instrument', 'publicationextensions.instrumentation',
+                    'publicationextensions.atomicfile'],
       install_requires=[
           'unicode_tex',
           'citeproc-py'
       ],
+      extras_require={
+          'watch': ['watchdog'],
+          'figures': ['Pillow'],
+      },
 )
 
 
@@ -69,3 +75,12 @@ src = 'templates'
 destination = os.path.join(data_dir, 'templates')
 print("Install templates to %s" % destination)
 recursive_overwrite(src, destination)
+
+# Precompile the installed templates into the template cache, so that the
+# first conversions do not compile them
+try:
+    from jupyterpublicationscripts.precompile import precompile
+    print("Precompile templates")
+    precompile()
+except Exception as e:
+    print("Templates not precompiled: %s" % e)
@@ -0,0 +1,9 @@
+import os
+import sys
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+# the extensions are not a package, nbconvert finds them on sys.path
+for path in (ROOT, os.path.join(ROOT, 'extensions')):
+    if path not in sys.path:
+        sys.path.insert(0, path)
@@ -0,0 +1,44 @@
+import nbformat
+import pytest
+
+from jupyterpublicationscripts.assemble import chapter_body, chapter_notebooks, main_document, split_document
+
+TEX = r'''\documentclass[11pt]{article}
+\usepackage{graphicx}
+\title{Notebook}
+\begin{document}
+\maketitle
+Some text.
+\bibliographystyle{unsrt}
+\bibliography{notebook}
+\end{document}
+'''
+
+
+def test_chapter_body():
+    assert chapter_body(TEX) == 'Some text.\n'
+    assert chapter_body(TEX, 'Methods') == '\\chapter{Methods}\nSome text.\n'
+    with pytest.raises(ValueError):
+        split_document('Some text.')
+
+
+def test_main_document():
+    preamble = split_document(TEX)[0]
+    main = main_document(preamble, ['chapters/a', 'chapters/b'], bibfile='refs', title='Thesis',
+                         documentclass='report', only=['chapters/b'])
+    assert main.startswith('\\documentclass[11pt]{report}\n')
+    lines = main.splitlines()
+    assert lines[lines.index('\\includeonly{chapters/b}') + 1] == '\\begin{document}'
+    assert '\\title{Thesis}' in lines
+    assert lines[-5:] == ['\\include{chapters/a}', '\\include{chapters/b}', '\\bibliographystyle{unsrt}',
+                          '\\bibliography{refs}', '\\end{document}']
+    assert '\\include' not in main_document(preamble, [])
+
+
+def test_chapter_notebooks_follows_lists(tmpdir):
+    for name in ['intro', 'methods', 'appendix']:
+        nbformat.write(nbformat.v4.new_notebook(), str(tmpdir.join(name + '.ipynb')))
+    listing = tmpdir.join('thesis.txt')
+    listing.write('# chapters in order\nmethods.ipynb\n\nintro.ipynb\n')
+    notebooks = chapter_notebooks([str(listing), str(tmpdir.join('appendix.ipynb'))])
+    assert notebooks == [str(tmpdir.join(name + '.ipynb')) for name in ['methods', 'intro', 'appendix']]
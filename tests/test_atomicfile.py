@@ -0,0 +1,30 @@
+import os
+import stat
+
+import pytest
+
+from publicationextensions.atomicfile import atomic_file, write_if_changed
+
+
+def test_write_if_changed_keeps_the_file_mode(tmpdir):
+    filename = str(tmpdir.join('refs.bib'))
+    umask = os.umask(0)
+    os.umask(umask)
+    assert write_if_changed(filename, u'@book{a}')
+    assert stat.S_IMODE(os.stat(filename).st_mode) == 0o666 & ~umask
+    os.chmod(filename, 0o640)
+    assert not write_if_changed(filename, u'@book{a}')
+    assert write_if_changed(filename, u'@book{b}')
+    assert stat.S_IMODE(os.stat(filename).st_mode) == 0o640
+    assert tmpdir.listdir() == [tmpdir.join('refs.bib')]
+
+
+def test_failed_write_keeps_the_file(tmpdir):
+    filename = tmpdir.join('refs.bib')
+    filename.write('@book{a}')
+    with pytest.raises(ValueError):
+        with atomic_file(str(filename)) as f:
+            f.write(u'@book{b}')
+            raise ValueError('interrupted')
+    assert filename.read() == '@book{a}'
+    assert tmpdir.listdir() == [filename]
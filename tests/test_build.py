@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+import io
+import os
+import shutil
+
+import nbformat
+import pytest
+
+from jupyterpublicationscripts.build import build, up_to_date, update_references
+
+REFERENCE = {'type': 'book', 'title': 'First edition', 'author': [{'family': 'Adams', 'given': 'A.'}],
+             'issued': {'year': 2001}}
+
+
+def write_notebook(path, source, citations=None):
+    nb = nbformat.v4.new_notebook(metadata={'cite2c': {'citations': citations}} if citations else {})
+    nb.cells = [nbformat.v4.new_markdown_cell(source),
+                nbformat.v4.new_markdown_cell('<div class="cite2c-biblio"></div>')]
+    nbformat.write(nb, str(path))
+    return str(path)
+
+
+def test_reference_changed_by_another_notebook(tmpdir):
+    config = tmpdir.join('config.py')
+    config.write("c.BibTexPreprocessor.citation_style = 'apa'\n"
+                 "c.BibTexPreprocessor.cache_dir = ''\n"
+                 "c.BibTexPreprocessor.reference_store = 'refs.db'\n")
+    source = write_notebook(tmpdir.join('source.ipynb'), 'References', {'adams': REFERENCE})
+    citing = write_notebook(tmpdir.join('citing.ipynb'), 'As shown <cite data-cite="adams"></cite>.')
+    options = dict(to='html', config_file=str(config), output_dir=str(tmpdir.join('out')), jobs=1)
+    results = build([source, citing], **options)
+    assert not any(result['error'] for result in results)
+    options.pop('jobs')
+    assert up_to_date(citing, **options)
+
+    write_notebook(tmpdir.join('source.ipynb'), 'References', {'adams': dict(REFERENCE, title='Second edition')})
+    results = dict((result['notebook'], result) for result in build([source, citing], jobs=1, **options))
+    assert 'preprocess' in results[citing]['stages']
+    with io.open(str(tmpdir.join('out', 'citing.html')), encoding='utf-8') as f:
+        assert 'Second edition' in f.read()
+    assert up_to_date(citing, **options)
+
+
+@pytest.fixture
+def project(tmpdir):
+    config = tmpdir.join('config.py')
+    config.write("c.BibTexPreprocessor.reference_store = 'refs.db'\n"
+                 "c.BibTexPreprocessor.project_bibfile = 'refs.bib'\n")
+    source = write_notebook(tmpdir.join('source.ipynb'), 'As shown <cite data-cite="adams"></cite>.',
+                            {'adams': REFERENCE})
+    return str(config), source
+
+
+def test_project_bibfile_is_only_written_if_the_store_changed(tmpdir, project):
+    config, source = project
+    bibfile = str(tmpdir.join('refs.bib'))
+    update_references([source], config)
+    assert '@book{adams' in tmpdir.join('refs.bib').read()
+    os.utime(bibfile, (0, 0))
+    update_references([source], config)
+    assert os.path.getmtime(bibfile) == 0
+    write_notebook(source, 'Unchanged', {'adams': dict(REFERENCE, title='Second edition')})
+    update_references([source], config)
+    assert 'Second edition' in tmpdir.join('refs.bib').read()
+
+
+@pytest.mark.skipif(shutil.which('pandoc') is None, reason='LaTeX output requires pandoc')
+def test_conversions_only_read_the_project_bibfile(tmpdir, project):
+    config, source = project
+    results = build([source], jobs=1, to='latex', config_file=config, output_dir=str(tmpdir.join('out')))
+    assert not results[0]['error']
+    assert 'bib' not in results[0]['stages']
+    assert '\\bibliography{' + str(tmpdir.join('refs')) + '}' in tmpdir.join('out', 'source.tex').read()
+
+
+def test_spill_directory_per_format(tmpdir):
+    nb = nbformat.v4.new_notebook()
+    nb.cells = [nbformat.v4.new_code_cell('print()', outputs=[
+        nbformat.v4.new_output('display_data', {'text/html': '<b>' + 'x' * 100 + '</b>'})])]
+    path = str(tmpdir.join('large.ipynb'))
+    nbformat.write(nb, path)
+    results = build([path], jobs=1, to='html', spill=50)
+    assert not results[0]['error']
+    assert tmpdir.join('.jps-cache', 'large.html.spill').listdir()
+    assert 'x' * 100 in tmpdir.join('large.html').read()
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+import nbformat
+import pytest
+
+from cite2c_store import ReferenceStore, build_store, notebook_references
+
+A = {'type': 'book', 'title': 'A'}
+B = {'type': 'article-journal', 'title': 'B'}
+C = {'type': 'article-journal', 'title': 'C'}
+
+
+@pytest.fixture
+def store(tmpdir):
+    store = ReferenceStore(str(tmpdir.join('refs.db')))
+    yield store
+    store.close()
+
+
+def test_update_and_get(store):
+    assert store.update('/a.ipynb', {'a': A, 'b': B})
+    assert not store.update('/a.ipynb', {'a': A, 'b': B})
+    assert store.get(['a', 'missing']) == {'a': A}
+    assert store.all() == {'a': A, 'b': B}
+
+
+def test_reference_shared_by_notebooks_is_kept(store):
+    store.update('/a.ipynb', {'a': A, 'b': B})
+    store.update('/b.ipynb', {'b': B})
+    store.update('/a.ipynb', {'a': A})
+    assert store.all() == {'a': A, 'b': B}
+    store.update('/b.ipynb', {})
+    assert store.all() == {'a': A}
+
+
+def test_changed_reference_replaces_the_stored_one(store):
+    store.update('/a.ipynb', {'a': A})
+    changed = dict(A, title='A, second edition')
+    store.update('/b.ipynb', {'a': changed})
+    assert store.get(['a']) == {'a': changed}
+
+
+def test_retain_drops_removed_notebooks(store):
+    store.update('/a.ipynb', {'a': A, 'b': B})
+    store.update('/b.ipynb', {'b': B, 'c': C})
+    store.retain(['/a.ipynb'])
+    assert store.all() == {'a': A, 'b': B}
+
+
+def write_notebook(path, citations):
+    nb = nbformat.v4.new_notebook(metadata={'cite2c': {'citations': citations}})
+    nbformat.write(nb, str(path))
+    return str(path)
+
+
+def test_build_store(tmpdir):
+    a = write_notebook(tmpdir.join('a.ipynb'), {'a': A, 'b': B})
+    b = write_notebook(tmpdir.join('b.ipynb'), {'c': C})
+    assert notebook_references(a) == {'a': A, 'b': B}
+    filename = str(tmpdir.join('refs.db'))
+    build_store(filename, [a, b], retain=[a, b]).close()
+
+    store = build_store(filename, [a], retain=[a])
+    assert store.all() == {'a': A, 'b': B}
+    store.close()
+
+    write_notebook(tmpdir.join('a.ipynb'), {'a': A})
+    store = build_store(filename, [a])
+    assert store.all() == {'a': A}
+    store.close()
@@ -0,0 +1,66 @@
+import io
+import json
+import os
+import stat
+
+from publicationextensions import atomicfile
+from jupyterpublicationscripts.config import activate, deactivate, merged, preprocessors, provision
+
+
+def test_merged_appends_missing_entries_once():
+    assert merged(['a', 'b'], add=['b', 'c']) == ['a', 'b', 'c']
+    assert merged(['a', 'b', 'a'], add=['c', 'c']) == ['a', 'b', 'c']
+
+
+def test_merged_removes_entries_and_keeps_the_order():
+    assert merged(['c', 'a', 'b'], remove=['a']) == ['c', 'b']
+    assert merged(['a'], add=['b'], remove=['b']) == ['a']
+    assert merged([], remove=['a']) == []
+
+
+def read(config_dir):
+    with io.open(os.path.join(str(config_dir), 'jupyter_nbconvert_config.json'), encoding='utf-8') as f:
+        return json.load(f)
+
+
+def test_activate_is_idempotent(tmpdir):
+    assert activate(config_dir=str(tmpdir))
+    config = read(tmpdir)
+    assert config['Exporter']['preprocessors'] == list(preprocessors())
+    assert not activate(config_dir=str(tmpdir))
+    assert read(tmpdir) == config
+
+
+def test_activate_keeps_other_preprocessors(tmpdir):
+    tmpdir.join('jupyter_nbconvert_config.json').write(json.dumps(
+        {'Exporter': {'preprocessors': ['mine.Preprocessor', preprocessors()[0], preprocessors()[0]]}}))
+    assert activate(config_dir=str(tmpdir))
+    assert read(tmpdir)['Exporter']['preprocessors'] == merged(['mine.Preprocessor'], add=preprocessors())
+    assert deactivate(config_dir=str(tmpdir))
+    assert read(tmpdir)['Exporter']['preprocessors'] == ['mine.Preprocessor']
+    assert not deactivate(config_dir=str(tmpdir))
+
+
+def test_activate_keeps_the_file_mode(tmpdir):
+    filename = tmpdir.join('jupyter_nbconvert_config.json')
+    filename.write('{}')
+    os.chmod(str(filename), 0o644)
+    assert activate(config_dir=str(tmpdir))
+    assert stat.S_IMODE(os.stat(str(filename)).st_mode) == 0o644
+    os.chmod(str(filename), 0o640)
+    assert deactivate(config_dir=str(tmpdir))
+    assert stat.S_IMODE(os.stat(str(filename)).st_mode) == 0o640
+
+
+def test_activate_creates_a_file_with_the_umask_mode(tmpdir):
+    assert activate(config_dir=str(tmpdir))
+    mode = os.stat(str(tmpdir.join('jupyter_nbconvert_config.json'))).st_mode
+    assert stat.S_IMODE(mode) == 0o666 & ~atomicfile._umask
+
+
+def test_provision_reports_every_directory(tmpdir):
+    dirs = [str(tmpdir.mkdir(name)) for name in ('a', 'b')]
+    results = provision(dirs)
+    assert [changed for filename, changed, error in results] == [True, True]
+    results = provision(dirs + [str(tmpdir.join('a', 'missing', 'deeper'))])
+    assert [changed for filename, changed, error in results] == [False, False, True]
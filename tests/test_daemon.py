@@ -0,0 +1,103 @@
+import os
+import threading
+
+import pytest
+
+from concurrent.futures import Future
+
+from jupyterpublicationscripts import build, daemon
+from jupyterpublicationscripts.daemon import OPTIONS, forbidden_options, inside, job_options, make_server
+
+try:
+    from http.client import HTTPConnection
+except ImportError:
+    from httplib import HTTPConnection
+
+
+def test_inside_resolves_parent_references(tmpdir):
+    allowed = str(tmpdir.join('allowed'))
+    assert inside(os.path.join(allowed, 'out'), [allowed])
+    assert inside(allowed, [allowed])
+    assert not inside(os.path.join(allowed, '..', 'other'), [allowed])
+    assert not inside(allowed + '-other', [allowed])
+
+
+def test_forbidden_options(tmpdir):
+    defaults = dict(OPTIONS, config_file=str(tmpdir.join('default.py')))
+    allowed = [str(tmpdir.join('allowed'))]
+    check = lambda request: forbidden_options(job_options(request, defaults), defaults, allowed)
+    assert check({}) == []
+    assert check({'config_file': str(tmpdir.join('default.py'))}) == []
+    assert check({'output_dir': str(tmpdir.join('allowed', 'out')), 'template': 'basic'}) == []
+    assert check({'config_file': '/tmp/evil.py'}) == ['config_file']
+    assert check({'output_dir': '/etc', 'template': '/tmp/evil.tplx'}) == ['output_dir', 'template']
+
+
+class FinishedPool(object):
+    """ runs the jobs at once, their futures are done when submitted """
+    def submit(self, fn, notebook, **options):
+        future = Future()
+        future.set_result({'notebook': notebook, 'output': notebook + '.tex', 'error': None, 'stages': ['render'],
+                           'seconds': 0.0, 'instrumentation': None})
+        return future
+
+    def shutdown(self, wait=True):
+        pass
+
+
+def test_job_finished_at_once(monkeypatch, tmpdir):
+    monkeypatch.setattr(daemon.Scheduler, 'start_pool', lambda self: FinishedPool())
+    monkeypatch.setattr(daemon, 'up_to_date', lambda notebook, **options: False)
+    scheduler = daemon.Scheduler(1)
+    notebook = str(tmpdir.join('paper.ipynb'))
+    for i in range(2):
+        result = scheduler.submit(notebook, job_options({}, scheduler.defaults)).wait(5)
+        assert result['output'] == notebook + '.tex'
+    assert scheduler.metrics()['jobs'] == 2
+    assert scheduler.metrics()['running'] == 0
+
+
+class Scheduler(object):
+    defaults = dict(OPTIONS)
+
+    def submit(self, notebook, options):
+        raise AssertionError('the request should have been refused')
+
+
+@pytest.fixture
+def server():
+    server = make_server(Scheduler(), port=0)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def post(server, body, headers):
+    connection = HTTPConnection(*server.server_address[:2])
+    try:
+        connection.request('POST', '/convert', body, headers)
+        return connection.getresponse().status
+    finally:
+        connection.close()
+
+
+def test_requests_from_web_pages_are_refused(server, tmpdir):
+    body = '{{"notebook": "{}"}}'.format(tmpdir.join('paper.ipynb'))
+    assert post(server, body, {'Content-Type': 'text/plain'}) == 415
+    assert post(server, body, {'Content-Type': 'application/json', 'Origin': 'https://example.com'}) == 403
+    assert post(server, '{"notebook": "x.ipynb", "config_file": "/tmp/evil.py"}',
+                {'Content-Type': 'application/json'}) == 403
+
+
+def test_warm_caches_are_bounded(monkeypatch):
+    monkeypatch.setattr(build, '_preprocessors', build.OrderedDict())
+    created = []
+    for key in list(range(build.WARM_CACHE_SIZE + 2)) + [0]:
+        build._warm(build._preprocessors, key, lambda: created.append(key) or key)
+    assert len(build._preprocessors) == build.WARM_CACHE_SIZE
+    # 0 and 1 were dropped, 0 was created again
+    assert created == list(range(build.WARM_CACHE_SIZE + 2)) + [0]
+    assert list(build._preprocessors)[-1] == 0
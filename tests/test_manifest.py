@@ -0,0 +1,49 @@
+import os
+
+from jupyterpublicationscripts.manifest import Manifest, hash_data, hash_files
+
+
+def test_hash_data_is_independent_of_key_order():
+    assert hash_data({'a': 1, 'b': 2}) == hash_data({'b': 2, 'a': 1})
+    assert hash_data({'a': 1}) != hash_data({'a': 2})
+
+
+def test_hash_files_covers_names_and_contents(tmpdir):
+    a, b = tmpdir.join('a'), tmpdir.join('b')
+    a.write('x')
+    b.write('x')
+    assert hash_files([str(a)]) != hash_files([str(b)])
+    before = hash_files([str(a)])
+    a.write('y')
+    assert hash_files([str(a)]) != before
+    assert hash_files([str(tmpdir.join('missing'))]) == hash_files([str(tmpdir.join('missing'))])
+
+
+def test_manifest_round_trip(tmpdir):
+    filename = str(tmpdir.join('cache', 'notebook.latex.json'))
+    manifest = Manifest(filename)
+    assert manifest.changed('render', 'abc')
+    manifest.record('render', 'abc')
+    manifest['output'] = 'notebook.tex'
+    manifest.save()
+
+    manifest = Manifest(filename)
+    assert not manifest.changed('render', 'abc')
+    assert manifest.changed('render', 'def')
+    assert manifest['output'] == 'notebook.tex'
+
+
+def test_unchanged_manifest_is_not_written(tmpdir):
+    filename = str(tmpdir.join('notebook.latex.json'))
+    manifest = Manifest(filename)
+    manifest.record('render', 'abc')
+    manifest.save()
+    mtime = os.path.getmtime(filename)
+    os.utime(filename, (mtime - 10, mtime - 10))
+
+    manifest = Manifest(filename)
+    manifest.record('render', 'abc')
+    manifest['output'] = None
+    manifest.save()
+    assert os.path.getmtime(filename) == mtime - 10
+
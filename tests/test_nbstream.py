@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+import base64
+import os
+
+import nbformat
+import pytest
+
+from nbstream import SPILLED, iter_notebook, notebook_metadata, read_notebook, restore
+
+THRESHOLD = 1000
+LARGE = base64.b64encode(os.urandom(3 * THRESHOLD)).decode('ascii')
+SMALL = base64.b64encode(b'small').decode('ascii')
+
+
+def notebook_v4():
+    from nbformat import v4
+    nb = v4.new_notebook(metadata={'cite2c': {'citations': {'key': {'title': 'Title'}}}})
+    nb.cells.append(v4.new_markdown_cell('# Title'))
+    nb.cells.append(v4.new_code_cell('plot()', outputs=[
+        v4.new_output('display_data', data={'image/png': LARGE, 'text/plain': '<Figure>'}),
+        v4.new_output('display_data', data={'image/png': SMALL}),
+        v4.new_output('execute_result', data={'text/html': '<p>' + 'x' * 2 * THRESHOLD + '</p>',
+                                              'application/json': {'a': 'y' * 2 * THRESHOLD}},
+                      execution_count=1),
+    ]))
+    return nb
+
+
+def notebook_v3():
+    from nbformat import v3
+    cells = [
+        v3.new_text_cell('markdown', source='# Title'),
+        v3.new_code_cell(input='plot()', outputs=[
+            v3.new_output('display_data', output_png=LARGE, output_text='<Figure>'),
+            v3.new_output('display_data', output_png=SMALL),
+        ]),
+    ]
+    return v3.new_notebook(worksheets=[v3.new_worksheet(cells=cells)])
+
+
+@pytest.fixture(params=[4, 3])
+def notebook(request, tmpdir):
+    path = str(tmpdir.join('notebook.ipynb'))
+    if request.param == 4:
+        nbformat.write(notebook_v4(), path)
+    else:
+        from nbformat import v3
+        with open(path, 'w') as f:
+            f.write(v3.writes_json(notebook_v3()))
+    return path
+
+
+def same_notebook(a, b):
+    # converting older notebooks gives the cells random ids
+    for nb in (a, b):
+        for cell in nb.cells:
+            cell.pop('id', None)
+    return a == b
+
+
+def spilled_outputs(nb):
+    return [output for cell in nb.cells for output in cell.get('outputs', [])
+            if SPILLED in output.get('metadata', {})]
+
+
+def test_spills_large_outputs_only(notebook, tmpdir):
+    directory = str(tmpdir.join('spill'))
+    nb = read_notebook(notebook, directory, THRESHOLD)
+    assert nb.nbformat == 4
+    outputs = nb.cells[1].outputs
+    assert outputs[0].data['image/png'] == ''
+    assert list(outputs[0].metadata[SPILLED]) == ['image/png']
+    assert outputs[0].data['text/plain'] == '<Figure>'
+    assert outputs[1].data['image/png'] == SMALL
+    assert SPILLED not in outputs[1].get('metadata', {})
+    files = [f for output in spilled_outputs(nb) for f in output.metadata[SPILLED].values()]
+    assert sorted(files) == sorted(os.path.join(directory, name) for name in os.listdir(directory))
+
+
+def test_json_outputs_are_not_spilled(tmpdir):
+    path = str(tmpdir.join('notebook.ipynb'))
+    nbformat.write(notebook_v4(), path)
+    nb = read_notebook(path, str(tmpdir.join('spill')), THRESHOLD)
+    result = nb.cells[1].outputs[2]
+    assert result.data['text/html'] == ''
+    assert result.data['application/json'] == {'a': 'y' * 2 * THRESHOLD}
+
+
+def test_restore_gives_the_notebook_back(notebook, tmpdir):
+    nb = restore(read_notebook(notebook, str(tmpdir.join('spill')), THRESHOLD))
+    assert not spilled_outputs(nb)
+    assert same_notebook(nb, nbformat.read(notebook, as_version=4))
+
+
+def test_without_large_outputs_nothing_is_spilled(notebook, tmpdir):
+    directory = str(tmpdir.join('spill'))
+    nb = read_notebook(notebook, directory, 10 * THRESHOLD)
+    assert not spilled_outputs(nb)
+    assert os.listdir(directory) == []
+    assert same_notebook(nb, nbformat.read(notebook, as_version=4))
+
+
+def test_unused_spill_files_are_removed(tmpdir):
+    path = str(tmpdir.join('notebook.ipynb'))
+    directory = str(tmpdir.join('spill'))
+    nb = notebook_v4()
+    nbformat.write(nb, path)
+    read_notebook(path, directory, THRESHOLD)
+    before = set(os.listdir(directory))
+    nb.cells[1].outputs[0].data['image/png'] = base64.b64encode(os.urandom(3 * THRESHOLD)).decode('ascii')
+    nbformat.write(nb, path)
+    read_notebook(path, directory, THRESHOLD)
+    after = set(os.listdir(directory))
+    assert len(after) == len(before)
+    assert len(after - before) == 1
+
+
+def test_iter_notebook_yields_cells_one_at_a_time(tmpdir):
+    path = str(tmpdir.join('notebook.ipynb'))
+    nbformat.write(notebook_v4(), path)
+    items = list(iter_notebook(path))
+    assert [value['cell_type'] for key, value in items if key == 'cell'] == ['markdown', 'code']
+    assert notebook_metadata(path)['cite2c']['citations']['key']['title'] == 'Title'
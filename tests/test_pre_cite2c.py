@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+import nbformat
+import pytest
+
+from pre_cite2c import BibTexPreprocessor
+
+REFERENCES = dict(
+    (key, {'type': 'article-journal', 'title': 'Title ' + key, 'author': [{'family': family, 'given': 'A.'}],
+           'issued': {'date-parts': [[year]]}, 'container-title': 'Journal'})
+    for key, family, year in [('a', 'Adams', 2001), ('b', 'Brown', 2002), ('c', 'Clark', 2003), ('d', 'Davis', 2004)])
+
+
+def cite(keys):
+    return ''.join('<cite data-cite="{}"></cite>'.format(key) for key in keys)
+
+
+def notebook(*sources):
+    nb = nbformat.v4.new_notebook(metadata={'cite2c': {'citations': REFERENCES}})
+    nb.cells = [nbformat.v4.new_markdown_cell(source) for source in sources]
+    nb.cells.append(nbformat.v4.new_markdown_cell('<div class="cite2c-biblio"></div>'))
+    return nb
+
+
+def convert(nb, extension='.html', **options):
+    options.setdefault('citation_style', 'apa')
+    options.setdefault('cache_dir', '')
+    resources = {'output_extension': extension, 'metadata': {'name': 'paper'}, 'unique_key': 'paper',
+                 'output_files_dir': 'paper_files', 'outputs': {}}
+    nb, resources = BibTexPreprocessor(write_bibfile=False, **options).preprocess(nb, resources)
+    return [cell.source for cell in nb.cells]
+
+
+def test_citations_are_replaced_by_anchors():
+    first, second, bibliography = convert(notebook('See ' + cite('ab') + '.', 'Again ' + cite('a')))
+    assert first == 'See <a href="#a">(Adams, 2001)</a><a href="#b">(Brown, 2002)</a>.'
+    assert second == 'Again <a href="#a">(Adams, 2001)</a>'
+    assert bibliography.startswith('<h2 id="bibliography">Bibliography</h2><p id="a">Adams')
+    assert bibliography.count('<p id=') == 2
+
+
+def test_unknown_key_is_reported(capsys):
+    convert(notebook(cite(['missing'])))
+    assert "Reference with key 'missing' not found" in capsys.readouterr().out
+
+
+def test_latex_output_cites_the_bib_file():
+    cell, bibliography = convert(notebook(cite('a')), '.tex')
+    assert cell == cite('a')
+    assert bibliography == '\\bibliography{paper_files/paper} \n '
+
+
+@pytest.mark.parametrize('style', ['ieee', 'apa'])
+def test_cached_citations_depend_on_citation_order(tmpdir, style):
+    # numeric styles number the references in the order they are cited
+    cache_dir = str(tmpdir.join('cache'))
+    convert(notebook(cite('abcd')), citation_style=style, cache_dir=cache_dir)
+    cached = convert(notebook(cite('dcba')), citation_style=style, cache_dir=cache_dir)
+    assert cached == convert(notebook(cite('dcba')), citation_style=style)
+    if style == 'ieee':
+        assert cached[0].startswith('<a href="#d">[1]</a>')
+
+
+def bibentry(reference):
+    return BibTexPreprocessor(cache_dir='').create_bibentry('key', reference)
+
+
+def test_book_series_is_its_collection_title():
+    entry = bibentry({'type': 'book', 'title': 'T', 'container-title': 'Ignored', 'collection-title': 'S',
+                      'publisher-place': 'Zürich', 'issued': {'date-parts': [[2010, 5]]}})
+    assert entry == ('@book{key,\n  title = {T}, \n  series = {S}, \n  year = {2010}, \n'
+                     '  address = {Z\\"{u}rich}, \n}\n\n')
+
+
+def test_field_names_depend_on_the_entry_type():
+    entry = bibentry({'type': 'chapter', 'title': 'C', 'container-title': 'B', 'page': '1-2'})
+    assert '@inbook{key,' in entry
+    assert '  chapter = {C}, \n  title = {B}, \n  pages = {1--2}, \n' in entry
+    assert '  booktitle = {P}, \n' in bibentry({'type': 'paper-conference', 'container-title': 'P'})
+
+
+def test_unknown_type_is_misc(capsys):
+    assert bibentry({'type': 'hologram', 'title': 'T'}).startswith('@misc{key,')
+    assert 'Unknown type of reference key' in capsys.readouterr().out
+
+
+def test_parallel_rewriting_matches_serial():
+    sources = [cite(keys) for keys in ('ab', 'c', 'ba', 'dx')]
+    assert convert(notebook(*sources), workers=2) == convert(notebook(*sources))
+    assert convert(notebook(*sources), '.tex', workers=2) == convert(notebook(*sources), '.tex')
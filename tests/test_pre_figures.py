@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+import base64
+import io
+import os
+
+import nbformat
+import pytest
+from nbconvert.preprocessors import SVG2PDFPreprocessor
+from traitlets.config import Config
+
+from pre_figures import FigureOptimizePreprocessor, FigureStorePreprocessor
+
+SVG = '<svg xmlns="http://www.w3.org/2000/svg" width="10" height="10"><rect width="10" height="10"/></svg>'
+
+
+def notebook(*outputs):
+    nb = nbformat.v4.new_notebook()
+    nb.cells = [nbformat.v4.new_code_cell('figure()', outputs=list(outputs))]
+    return nb
+
+
+def preprocess(preprocessor, nb, directory):
+    resources = {'output_extension': '.tex', 'output_files_dir': str(directory), 'metadata': {'name': 'paper'}}
+    return preprocessor.preprocess(nb, resources)[0]
+
+
+def test_svg_is_converted_to_pdf_in_the_store(tmpdir):
+    config = Config()
+    # a copy stands in for Inkscape
+    config.SVG2PDFPreprocessor.command = ['cp', '{from_filename}', '{to_filename}']
+    nb = notebook(nbformat.v4.new_output('display_data', {'image/svg+xml': SVG}))
+    nb = preprocess(FigureStorePreprocessor(config=config), nb, tmpdir)
+    output = nb.cells[0].outputs[0]
+    filenames = output.metadata.filenames
+    assert output.data == {'image/svg+xml': '', 'application/pdf': ''}
+    assert filenames['application/pdf'] == os.path.splitext(filenames['image/svg+xml'])[0] + '.pdf'
+    with io.open(filenames['application/pdf'], encoding='utf-8') as f:
+        assert f.read() == SVG
+    # a later SVG2PDFPreprocessor leaves the output alone
+    SVG2PDFPreprocessor(config=config).preprocess(nb, {})
+    assert output.data['application/pdf'] == ''
+
+
+def test_svg_with_a_raster_version_is_not_converted(tmpdir):
+    png = base64.b64encode(b'\x89PNG not really').decode('ascii')
+    nb = notebook(nbformat.v4.new_output('display_data', {'image/svg+xml': SVG, 'image/png': png}))
+    nb = preprocess(FigureStorePreprocessor(), nb, tmpdir)
+    output = nb.cells[0].outputs[0]
+    assert set(output.metadata.filenames) == {'image/svg+xml', 'image/png'}
+    assert 'application/pdf' not in output.data
+
+
+def image_output(mime_type, image_format, noise):
+    Image = pytest.importorskip('PIL.Image')
+    if noise:
+        image = Image.merge('RGB', [Image.effect_noise((2000, 1000), 64) for band in 'RGB'])
+    else:
+        image = Image.new('RGB', (2000, 1000))
+    data = io.BytesIO()
+    image.save(data, format=image_format)
+    return nbformat.v4.new_output('display_data', {mime_type: base64.b64encode(data.getvalue()).decode('ascii')})
+
+
+def optimize(tmpdir, output):
+    nb = preprocess(FigureStorePreprocessor(), notebook(output), tmpdir)
+    return preprocess(FigureOptimizePreprocessor(), nb, tmpdir).cells[0].outputs[0]
+
+
+def test_photograph_is_stored_as_jpeg(tmpdir):
+    output = optimize(tmpdir, image_output('image/png', 'PNG', noise=True))
+    assert output.data == {'image/jpeg': ''}
+    assert list(output.metadata.filenames) == ['image/jpeg']
+    from PIL import Image
+    image = Image.open(output.metadata.filenames['image/jpeg'])
+    assert image.format == 'JPEG' and image.width == 1050
+
+
+def test_drawing_stays_png(tmpdir):
+    output = optimize(tmpdir, image_output('image/png', 'PNG', noise=False))
+    assert list(output.metadata.filenames) == ['image/png']
+    assert output.metadata.filenames['image/png'].endswith('.png')
+
+
+def test_jpeg_is_left_alone(tmpdir):
+    output = optimize(tmpdir, image_output('image/jpeg', 'JPEG', noise=True))
+    assert list(tmpdir.listdir()) == [tmpdir.join(os.path.basename(output.metadata.filenames['image/jpeg']))]
@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+import nbformat
+import pytest
+
+from pre_markdown import MarkdownPreprocessor, RULES, register_rule
+
+
+@pytest.mark.parametrize('source, expected', [
+    ('<b>bold</b> and <em>italic</em>', '\\textbf{bold} and \\textit{italic}'),
+    ('<font color="red">red <u>text</u></font>', '\\textcolor{red}{red \\underline{text}}'),
+    ('x<sup>2</sup>, H<sub>2</sub>O', 'x\\textsuperscript{2}, H\\textsubscript{2}O'),
+    ('<b>outer <b>inner</b> outer</b>', '\\textbf{outer \\textbf{inner} outer}'),
+    ('<img src="a.png" alt="A">', '![A](a.png)'),
+    ('&lt;b&gt; &amp; <b>x</b>', '&lt;b&gt; &amp; \\textbf{x}'),
+    ('`<b>code</b>` and <b>text</b>', '`<b>code</b>` and \\textbf{text}'),
+    ('```\n<b>fenced</b>\n```\n<i>text</i>', '```\n<b>fenced</b>\n```\n\\textit{text}'),
+])
+def test_transform(source, expected):
+    assert MarkdownPreprocessor().transform(source) == expected
+
+
+def test_only_enabled_rules_apply():
+    assert MarkdownPreprocessor(rules=['bold']).transform('<b>a</b> <i>b</i>') == '\\textbf{a} <i>b</i>'
+
+
+def test_registered_rule(monkeypatch):
+    monkeypatch.setattr('pre_markdown.RULES', RULES.copy())
+    register_rule('smallcaps', r'<span class="sc">([^<]*)</span>')(
+        lambda preprocessor, text: '\\textsc{' + text + '}')
+    preprocessor = MarkdownPreprocessor(rules=['bold', 'smallcaps'])
+    assert preprocessor.transform('<b><span class="sc">Name</span></b>') == '\\textbf{\\textsc{Name}}'
+
+
+def test_cache_is_bounded():
+    preprocessor = MarkdownPreprocessor(cache_size=2)
+    for source in ('<b>a</b>', '<b>b</b>', '<b>c</b>', '<b>a</b>'):
+        preprocessor.transform(source)
+    # the text of the elements is converted, and cached, as well
+    assert list(preprocessor.cache) == ['a', '<b>a</b>']
+
+
+def notebook(*sources):
+    nb = nbformat.v4.new_notebook()
+    nb.cells = [nbformat.v4.new_markdown_cell(source) for source in sources]
+    return nb
+
+
+def test_only_latex_output_is_converted():
+    nb, _ = MarkdownPreprocessor().preprocess(notebook('<b>a</b>'), {'output_extension': '.html'})
+    assert nb.cells[0].source == '<b>a</b>'
+    nb, _ = MarkdownPreprocessor().preprocess(notebook('<b>a</b>'), {'output_extension': '.tex'})
+    assert nb.cells[0].source == '\\textbf{a}'
+
+
+def test_parallel_conversion_matches_serial():
+    sources = ['<b>cell {}</b> <i>{}</i>'.format(i, i % 3) for i in range(20)] + ['<b>cell 0</b> <i>0</i>']
+    resources = {'output_extension': '.tex'}
+    serial, _ = MarkdownPreprocessor().preprocess(notebook(*sources), dict(resources))
+    parallel, _ = MarkdownPreprocessor(workers=2).preprocess(notebook(*sources), dict(resources))
+    assert [cell.source for cell in parallel.cells] == [cell.source for cell in serial.cells]
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+import io
+
+import pytest
+
+from publicationextensions.PrettyTable import PrettyTable
+
+ROWS = [[1, 2.5], [3, 4.25]]
+
+
+def test_stream_renders_like_the_table():
+    table = PrettyTable(ROWS, extra_header=['a', 'b'], formatstring='.1f')
+    stream = PrettyTable.stream(iter(ROWS), extra_header=['a', 'b'], formatstring='.1f', chunksize=1)
+    assert stream._repr_latex_() == table._repr_latex_()
+    stream = PrettyTable.stream(ROWS, extra_header=['a', 'b'], formatstring='.1f', chunksize=1)
+    assert stream._repr_html_() == table._repr_html_()
+
+
+def test_stream_writes_chunks_to_a_file():
+    rows = ([i, i * i] for i in range(2500))
+    f = io.StringIO()
+    PrettyTable.stream(rows, chunksize=1000).write_html(f)
+    html = f.getvalue()
+    assert html.startswith('<table><tr><td>0</td><td>0</td></tr>')
+    assert html.count('<tr>') == 2500
+    assert html.endswith('<tr><td>2499</td><td>6245001</td></tr></table>')
+
+
+def test_single_values_make_a_column():
+    assert list(PrettyTable.stream([1, 2], extra_header='x')) == [['x'], ['1'], ['2']]
+    assert PrettyTable([1, 2], extra_header='x') == [['x'], ['1'], ['2']]
+
+
+def test_empty_tables():
+    assert PrettyTable([])._repr_latex_() == ''
+    assert PrettyTable.stream(iter([]))._repr_latex_() == ''
+    assert PrettyTable([])._repr_html_() == '<table></table>'
+    assert PrettyTable.stream([], extra_header=['a'])._repr_html_() == '<table><tr><td>a</td></tr></table>'
+
+
+def test_format_per_column():
+    expected = [['1', '2.50'], ['3', '4.25']]
+    assert PrettyTable(ROWS, formatstring=['d', '.2f']) == expected
+    assert list(PrettyTable.stream(ROWS, formatstring=['d', '.2f'])) == expected
+
+
+def rows(table):
+    # the formatted rows of arrays are tuples
+    return [list(row) for row in table]
+
+
+def test_numpy_array_is_formatted_column_wise():
+    np = pytest.importorskip('numpy')
+    array = np.array(ROWS)
+    assert rows(PrettyTable(array, formatstring='.2f')) == [['1.00', '2.50'], ['3.00', '4.25']]
+    assert rows(PrettyTable(np.arange(3), extra_header='n')) == [['n'], ['0'], ['1'], ['2']]
+
+
+def test_dataframe_header_is_its_columns():
+    pd = pytest.importorskip('pandas')
+    frame = pd.DataFrame({'a': [1, 3], 'b': [2.5, 4.25]})
+    assert rows(PrettyTable(frame, formatstring=['d', '.2f'])) == [['a', 'b'], ['1', '2.50'], ['3', '4.25']]
+    assert PrettyTable(frame, extra_header=['x', 'y'])[0] == ['x', 'y']
+    with pytest.raises(ValueError):
+        PrettyTable(frame, extra_header=['x'])
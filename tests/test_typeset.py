@@ -0,0 +1,87 @@
+import os
+import sys
+
+import pytest
+
+from jupyterpublicationscripts.typeset import TypesetError, typeset
+
+# stand-ins for the TeX tools, they log their runs to calls. The .aux file
+# written by pdflatex changes for the number of passes given in the .tex
+# file, then it stays the same
+PDFLATEX = r'''
+import os, sys
+job = os.path.splitext(sys.argv[-1])[0]
+with open('calls', 'a') as f:
+    f.write('pdflatex\n')
+with open('calls') as f:
+    passes = f.read().count('pdflatex')
+with open(job + '.tex') as f:
+    tex = f.read()
+if 'fail' in tex:
+    sys.exit(1)
+with open(job + '.aux', 'w') as f:
+    f.write('\\citation{a}\n\\bibdata{refs}\n\\newlabel{x}{' + str(min(passes, int(tex.split()[0]))) + '}\n')
+with open(job + '.pdf', 'w') as f:
+    f.write(str(passes))
+sys.exit(1 if 'error' in tex else 0)
+'''
+
+BIBTEX = r'''
+import sys
+with open('calls', 'a') as f:
+    f.write('bibtex\n')
+with open(sys.argv[-1] + '.bbl', 'w') as f:
+    f.write('\\begin{thebibliography}{1}\n\\end{thebibliography}\n')
+'''
+
+
+@pytest.fixture
+def texfile(tmpdir, monkeypatch):
+    bindir = tmpdir.mkdir('bin')
+    for name, script in [('pdflatex', PDFLATEX), ('bibtex', BIBTEX)]:
+        tool = bindir.join(name)
+        tool.write('#!' + sys.executable + '\n' + script)
+        tool.chmod(0o755)
+    monkeypatch.setenv('PATH', str(bindir) + os.pathsep + os.environ['PATH'])
+
+    def texfile(content):
+        path = tmpdir.join('paper.tex')
+        path.write(content)
+        return str(path)
+    return texfile
+
+
+def calls(texfile):
+    with open(os.path.join(os.path.dirname(texfile), 'calls')) as f:
+        return f.read().split()
+
+
+def test_passes_stop_at_a_fixed_point(texfile):
+    path = texfile('1')
+    assert typeset(path) == path[:-len('.tex')] + '.pdf'
+    # bibtex wrote the .bbl after the first pass, the second one reads it
+    assert calls(path) == ['pdflatex', 'bibtex', 'pdflatex']
+
+
+def test_second_run_skips_bibtex(texfile):
+    path = texfile('2')
+    typeset(path)
+    assert calls(path) == ['pdflatex', 'bibtex', 'pdflatex', 'pdflatex']
+    typeset(path)
+    assert calls(path)[4:] == ['pdflatex']
+
+
+def test_passes_are_bounded(texfile):
+    path = texfile('100')
+    typeset(path, bibtex=False, max_passes=3)
+    assert calls(path) == ['pdflatex'] * 3
+
+
+def test_latex_errors(texfile):
+    path = texfile('1 error')
+    typeset(path, bibtex=False)
+    assert os.path.exists(path[:-len('.tex')] + '.pdf')
+    with pytest.raises(TypesetError):
+        typeset(path, bibtex=False, strict=True)
+    with pytest.raises(TypesetError):
+        typeset(texfile('1 fail'), bibtex=False)